@@ -9,7 +9,10 @@ import os
 DEFAULT_AGENT_CONFIG = {
     'lustre_client_root': "/mnt/lustre_clients",
     'copytool_fifo_directory': "/var/spool",
-    'copytool_template': "--quiet --update-interval %(report_interval)s --event-fifo %(event_fifo)s --archive %(archive_number)s %(hsm_arguments)s %(mountpoint)s"
+    'copytool_template': "--quiet --update-interval %(report_interval)s --event-fifo %(event_fifo)s --archive %(archive_number)s %(hsm_arguments)s %(mountpoint)s",
+    'action_workers': 8,
+    'action_class_concurrency': {'cib': 1, 'block': 4},
+    'metrics_sample_interval': 1
 }
 
 PRODUCTION_CONFIG_STORE = "/var/lib/chroma"
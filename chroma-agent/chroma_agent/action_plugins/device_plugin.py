@@ -31,7 +31,11 @@ def device_plugin(plugin = None):
 
     result = {}
     for plugin_name, plugin_class in plugins.items():
-        result[plugin_name] = plugin_class(None).start_session()
+        plugin_instance = plugin_class(None)
+        try:
+            result[plugin_name] = plugin_instance.start_session()
+        finally:
+            plugin_instance.teardown()
 
     return result
 
@@ -22,7 +22,7 @@ from iml_common.lib.agent_rpc import agent_result_ok
 from iml_common.lib.agent_rpc import agent_ok_or_error
 from iml_common.lib.agent_rpc import agent_result_is_error
 from iml_common.lib.agent_rpc import agent_result_is_ok
-from chroma_agent.lib.pacemaker import cibadmin
+from chroma_agent.lib.pacemaker import cibadmin, crm_mon_status
 from chroma_agent.action_plugins.manage_pacemaker import PreservePacemakerCorosyncState
 from iml_common.lib.util import platform_info
 
@@ -101,7 +101,7 @@ def get_resource_location(resource_name):
     :param resource_name: Name of resource to find.
     :return: host currently mounted on or None if not mounted.
     '''
-    locations = get_resource_locations()
+    locations = get_resource_locations(fresh = True)
 
     if type(locations) is not dict:
         # Pacemaker not running, or no resources configured yet
@@ -111,63 +111,22 @@ def get_resource_location(resource_name):
 
 
 @exceptionSandBox(console_log, None)
-def get_resource_locations():
-    # FIXME: this may break on non-english systems or new versions of pacemaker
-    """Parse `crm_mon -1` to identify where (if anywhere)
-       resources (i.e. targets) are running."""
+def get_resource_locations(fresh = False):
+    """Identify where (if anywhere) resources (i.e. targets) are running from the shared crm_mon status.
 
-    try:
-        rc, lines_text, stderr = AgentShell.run_old(["crm_mon", "-1", "-r"])
-    except OSError, e:
-        # ENOENT is fine here.  Pacemaker might not be installed yet.
-        if e.errno != errno.ENOENT:
-            raise
-
-    if rc != 0:
-        # Pacemaker not running, or no resources configured yet
-        return {"crm_mon_error": {"rc": rc,
-                                  "stdout": lines_text,
-                                  "stderr": stderr}}
-
-    locations = {}
-    before_resources = True
-    for line in lines_text.split("\n"):
-        # if we don't have a DC for this cluster yet, we can't really believe
-        # anything it says
-        if line == "Current DC: NONE":
-            return {}
-
-        # skip down to the resources part
-        if before_resources:
-            if line.startswith("Full list of resources:"):
-                before_resources = False
-            continue
-
-        # only interested in Target resources
-        if "(ocf::chroma:Target)" not in line:
-            continue
-
-        # The line can have 3 - 5 arguments so pad it out to at least 5 and
-        # throw away any extra
-        # credit it goes to Aric Coady for this little trick
-        columns = (line.lstrip().split() + [None, None])[:5]
-
-        # In later pacemakers a new entry is added for stopped servers
-        # MGS_424f74	(ocf::chroma:Target):	(target-role:Stopped) Stopped
-        # and for started servers:
-        # MGS_424f74	(ocf::chroma:Target):	(target-role:Stopped) Started lotus-13vm6
-        # (target-role:Stopped) is new.
-        if "target-role" in columns[2]:
-            del columns[2]
+    :param fresh: True to run crm_mon now rather than use the status cached for this interval, for actions
+                  waiting on a change.
+    """
 
-        # and even newer pacemakers add a "(disabled)" to the end of the line:
-        # MGS_e1321a	(ocf::chroma:Target):	Stopped (disabled)
-        if columns[3] == "(disabled)":
-            columns[3] = None
+    status = crm_mon_status(fresh)
 
-        locations[columns[0]] = columns[3]
+    if not status.available:
+        # Pacemaker not running, or no resources configured yet
+        return {"crm_mon_error": {"rc": status.rc,
+                                  "stdout": status.stdout,
+                                  "stderr": status.stderr}}
 
-    return locations
+    return status.resource_locations
 
 
 def check_block_device(path, device_type):
@@ -535,7 +494,7 @@ def _wait_target(ha_label, started):
     started_items = -1
 
     while (master_timeout > 0) and (activity_timeout > 0):
-        locations = get_resource_locations()
+        locations = get_resource_locations(fresh = True)
 
         if (locations.get(ha_label) is not None) == started:
             return True
@@ -574,15 +533,9 @@ def start_target(ha_label):
         _wait_target(ha_label, True)
 
         # and make sure it didn't start but (the RA) fail(ed)
-        rc, stdout, stderr = AgentShell.run_old(['crm_mon', '-1'])
-
-        failed = True
-        for line in stdout.split("\n"):
-            if line.lstrip().startswith(ha_label):
-                if line.find("FAILED") < 0:
-                    failed = False
+        status = crm_mon_status(fresh = True)
 
-        if failed:
+        if not status.available or status.resource_failed(ha_label):
             # try to leave things in a sane state for a failed mount
             error = AgentShell.run_canned_error_message(['crm_resource', '-r', ha_label, '-p', 'target-role', '-m', '-v', 'Stopped'])
 
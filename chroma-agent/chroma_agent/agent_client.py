@@ -10,16 +10,24 @@ import socket
 import threading
 import traceback
 import datetime
+import random
 import sys
+import zlib
 from chroma_agent.plugin_manager import DevicePluginMessageCollection, DevicePluginMessage, PRIO_HIGH
 import requests
 from chroma_agent import version
 from chroma_agent.log import daemon_log, console_log, logging_in_debug_mode
+from chroma_agent.lib.profiling import agent_profile
 from iml_common.lib.date_time import IMLDateTime
 from iml_common.lib.util import ExceptionThrowingThread
 
 MAX_BYTES_PER_POST = 8 * 1024 ** 2  # 8MiB, should be <= SSLRenegBufferSize
 
+"""
+POST bodies at least this long are gzipped, once the manager has advertised that it accepts gzipped bodies
+"""
+COMPRESS_MIN_BYTES = 1024
+
 MIN_SESSION_BACKOFF = datetime.timedelta(seconds = 10)
 MAX_SESSION_BACKOFF = datetime.timedelta(seconds = 60)
 
@@ -36,23 +44,39 @@ class CryptoClient(object):
         if not self.fqdn:
             self.fqdn = socket.getfqdn()
 
+        # Set when the manager's responses say it accepts gzipped request bodies (RFC 7694)
+        self._compress = False
+
     def get(self, **kwargs):
         kwargs['timeout'] = GET_REQUEST_TIMEOUT
         return self.request('get', **kwargs)
 
     def post(self, data, **kwargs):
-        return self.request('post', data = json.dumps(data), **kwargs)
+        return self.post_json(json.dumps(data), **kwargs)
+
+    def post_json(self, body, **kwargs):
+        """POST an already serialized JSON body"""
+        headers = {"Content-Type": "application/json"}
+
+        if self._compress and len(body) >= COMPRESS_MIN_BYTES:
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            body = compressor.compress(body) + compressor.flush()
+            headers["Content-Encoding"] = "gzip"
+
+        return self.request('post', data = body, headers = headers, **kwargs)
 
     def request(self, method, **kwargs):
         cert, key = self._crypto.certificate_file, self._crypto.private_key_file
         if cert:
             kwargs['cert'] = (cert, key)
 
+        headers = kwargs.pop('headers', {"Content-Type": "application/json"})
+
         try:
             response = requests.request(method, self.url,
                 # FIXME: set verify to true if we have a CA bundle
                 verify = False,
-                headers = {"Content-Type": "application/json"},
+                headers = headers,
                 **kwargs)
         except (socket.error,
                 requests.exceptions.ConnectionError,
@@ -75,7 +99,13 @@ class CryptoClient(object):
             daemon_log.error("Bad status %s from %s to %s" % (response.status_code, method, self.url))
             if response.status_code == 413:
                 daemon_log.error("Oversized request: %s" % json.dumps(kwargs, indent=2))
+            elif response.status_code == 415 and "Content-Encoding" in headers:
+                # The manager no longer accepts compressed bodies (e.g. it has been downgraded)
+                self._compress = False
             raise HttpError()
+
+        if 'gzip' in response.headers.get('Accept-Encoding', ''):
+            self._compress = True
         try:
             return response.json()
         except ValueError:
@@ -208,9 +238,13 @@ class Message(object):
 
 
 class Session(object):
+    # Poll period used unless the manager advertises one in SESSION_CREATE_RESPONSE
     POLL_PERIOD = 10
+    # Fraction of the poll period by which each poll is randomly brought forward or put back, so that
+    # agents which start polling together drift out of phase
+    POLL_JITTER = 0.1
 
-    def __init__(self, client, id, plugin_name):
+    def __init__(self, client, id, plugin_name, schedule = None):
         self.id = id
         self._plugin_name = plugin_name
         self._plugin = client.device_plugins.get(plugin_name)(self)
@@ -220,16 +254,34 @@ class Session(object):
         self._seq = 0
         self._last_poll = None
 
+        # Older managers send no schedule: poll every POLL_PERIOD starting now
+        schedule = schedule or {}
+        self._poll_period = schedule.get('poll_period', self.POLL_PERIOD)
+        self._next_poll = datetime.datetime.now() + datetime.timedelta(seconds = schedule.get('poll_offset', 0))
+
+    def _jittered_poll_period(self):
+        return datetime.timedelta(seconds = self._poll_period * random.uniform(1 - self.POLL_JITTER, 1 + self.POLL_JITTER))
+
+    def set_poll_period(self, poll_period):
+        """Poll every `poll_period` seconds from now on, as directed by the manager"""
+        if poll_period != self._poll_period:
+            daemon_log.info("Session.set_poll_period %s/%s: %s" % (self._plugin_name, self.id, poll_period))
+            self._poll_period = poll_period
+            if self._last_poll is not None:
+                self._next_poll = self._last_poll + self._jittered_poll_period()
+
     def poll(self):
         now = datetime.datetime.now()
-        if self._last_poll is None or now - self._last_poll > datetime.timedelta(seconds = self.POLL_PERIOD):
+        if now >= self._next_poll:
             self._last_poll = now
+            self._next_poll = now + self._jittered_poll_period()
             try:
                 self._poll_counter += 1
-                if self._poll_counter == 1:
-                    return self._plugin.start_session()
-                else:
-                    return self._plugin.update_session()
+                with agent_profile.plugin_poll(self._plugin_name):
+                    if self._poll_counter == 1:
+                        return self._plugin.start_session()
+                    else:
+                        return self._plugin.update_session()
             except NotImplementedError:
                 return None
 
@@ -258,11 +310,19 @@ class SessionTable(object):
         # Map of plugin name to how long to wait between session requests
         self._backoffs = defaultdict(lambda: MIN_SESSION_BACKOFF)
 
-    def create(self, plugin_name, id):
+    def create(self, plugin_name, id, schedule = None):
         daemon_log.info("SessionTable.create %s/%s" % (plugin_name, id))
         self._requested_at.pop(plugin_name, None)
         self._backoffs.pop(plugin_name, None)
-        self._sessions[plugin_name] = Session(self._client, id, plugin_name)
+        self._sessions[plugin_name] = Session(self._client, id, plugin_name, schedule)
+
+    def set_poll_periods(self, poll_periods):
+        """Apply poll periods the manager has sent, a map of plugin name to seconds"""
+        for plugin_name, poll_period in poll_periods.items():
+            try:
+                self.get(plugin_name).set_poll_period(poll_period)
+            except KeyError:
+                pass
 
     def get(self, plugin_name, id = None):
         session = self._sessions[plugin_name]
@@ -357,16 +417,16 @@ class HttpWriter(ExceptionCatchingThread):
         messages = []
         completion_callbacks = []
 
-        post_envelope = {
-            'messages': [],
-            'server_boot_time': self._client.boot_time.isoformat() + "Z",
-            'client_start_time': self._client.start_time.isoformat() + "Z"
-        }
+        # The envelope around the messages, each of which is serialized once as it is taken from the queue
+        post_envelope = '{"messages": [%%s], "server_boot_time": %s, "client_start_time": %s}' % (
+            json.dumps(self._client.boot_time.isoformat() + "Z"),
+            json.dumps(self._client.start_time.isoformat() + "Z"))
 
         # Any message we drop will need its session killed
         kill_sessions = set()
 
-        messages_bytes = len(json.dumps(post_envelope))
+        messages_bytes = len(post_envelope % '')
+        messages_json = []
         while True:
             try:
                 message = self._retry_messages.get_nowait()
@@ -380,28 +440,29 @@ class HttpWriter(ExceptionCatchingThread):
 
             if message.callback:
                 completion_callbacks.append(message.callback)
-            message_length = len(json.dumps(message.dump(self._client._fqdn)))
+            message_json = json.dumps(message.dump(self._client._fqdn))
+            message_length = len(message_json)
 
             if message_length > MAX_BYTES_PER_POST:
-                daemon_log.warning("Oversized message %s/%s: %s" % (message_length, MAX_BYTES_PER_POST, message.dump(self._client._fqdn)))
+                daemon_log.warning("Oversized message %s/%s: %s" % (message_length, MAX_BYTES_PER_POST, message_json))
 
             if messages and message_length > MAX_BYTES_PER_POST - messages_bytes:
                 # This message will not fit into this POST: pop it back into the queue
                 daemon_log.info(
                     "HttpWriter message %s overflowed POST %s/%s (%d "
                     "messages), enqueuing" % (
-                    message.dump(self._client._fqdn), message_length,
+                    message_json, message_length,
                     MAX_BYTES_PER_POST, len(messages)))
                 self._retry_messages.put(message)
                 break
 
             messages.append(message)
+            messages_json.append(message_json)
             messages_bytes += message_length
 
         daemon_log.debug("HttpWriter sending %s messages" % len(messages))
         try:
-            post_envelope['messages'] = [m.dump(self._client._fqdn) for m in messages]
-            self._client.post(post_envelope)
+            response = self._client.post_json(post_envelope % ", ".join(messages_json))
         except HttpError:
             daemon_log.warning("HttpWriter: request failed")
             # Terminate any sessions which we've just droppped messages for
@@ -413,6 +474,9 @@ class HttpWriter(ExceptionCatchingThread):
 
             return False
         else:
+            # The manager may direct plugins to poll at a different rate, e.g. to relieve backpressure
+            if isinstance(response, dict) and 'poll_periods' in response:
+                self._client.sessions.set_poll_periods(response['poll_periods'])
             return True
         finally:
             for callback in completion_callbacks:
@@ -486,7 +550,7 @@ class HttpReader(ExceptionCatchingThread):
 
             try:
                 if m.type == "SESSION_CREATE_RESPONSE":
-                    self._client.sessions.create(m.plugin_name, m.session_id)
+                    self._client.sessions.create(m.plugin_name, m.session_id, m.body)
                 elif m.type == "SESSION_TERMINATE_ALL":
                     self._client.sessions.terminate_all()
                 elif m.type == "SESSION_TERMINATE":
@@ -3,15 +3,62 @@
 # license that can be found in the LICENSE file.
 
 
+import heapq
+import itertools
 import threading
+import time
 import traceback
 import sys
+from collections import defaultdict
 
+from chroma_agent import config, DEFAULT_AGENT_CONFIG
 from chroma_agent.lib.shell import AgentShell
 from chroma_agent.log import daemon_log
 from chroma_agent.plugin_manager import DevicePlugin
 from chroma_agent.agent_client import AgentDaemonContext
 
+"""
+Queued actions run in priority order (lowest first) and then in the order they arrived
+"""
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+"""
+Priorities of actions other than PRIORITY_NORMAL: quick read-only queries are not held up behind
+long running reconfigurations, and reformatting waits for everything else.
+"""
+ACTION_PRIORITIES = {
+    'device_plugin': PRIORITY_HIGH,
+    'trigger_plugin_update': PRIORITY_HIGH,
+    'target_running': PRIORITY_HIGH,
+    'get_corosync_autoconfig': PRIORITY_HIGH,
+    'format_target': PRIORITY_LOW
+}
+
+"""
+Classes of actions which share a concurrency limit (the agent setting 'action_class_concurrency').  'cib' actions
+write the pacemaker configuration and run one at a time, 'block' actions work the block devices.  Actions in no
+class, e.g. read-only queries, are limited only by the number of workers (the agent setting 'action_workers').
+"""
+ACTION_CLASSES = {
+    'configure_target_ha': 'cib',
+    'unconfigure_target_ha': 'cib',
+    'configure_pacemaker': 'cib',
+    'unconfigure_pacemaker': 'cib',
+    'configure_fencing': 'cib',
+    'unconfigure_fencing': 'cib',
+    'set_node_standby': 'cib',
+    'set_node_online': 'cib',
+    'delete_node': 'cib',
+    'format_target': 'block',
+    'writeconf_target': 'block',
+    'check_block_device': 'block',
+    'import_target': 'block',
+    'export_target': 'block',
+    'detect_scan': 'block'
+}
+
 
 class CallbackAfterResponse(Exception):
     """
@@ -33,16 +80,111 @@ class CallbackAfterResponse(Exception):
         self.callback = callback
 
 
+class ActionExecutor(object):
+    """Start ActionRunner threads from a priority queue, running at most `workers` at once and at most
+    the limit of each action class at once.
+
+    Actions run in priority order and then in the order they arrived, skipping over any whose class
+    is already running as many actions as its limit allows.
+    """
+
+    def __init__(self, workers, class_limits, priorities = ACTION_PRIORITIES, classes = ACTION_CLASSES):
+        self._workers = workers
+        self._class_limits = class_limits
+        self._priorities = priorities
+        self._classes = classes
+
+        self._lock = threading.Lock()
+        self._queue = []                       # Heap of (priority, sequence, runner)
+        self._sequence = itertools.count()
+        self._running = set()
+        self._class_running = defaultdict(int)
+
+    def put(self, runner):
+        runner.queued_at = time.time()
+        with self._lock:
+            heapq.heappush(self._queue, (self._priorities.get(runner.action, PRIORITY_NORMAL), next(self._sequence), runner))
+            self._dispatch()
+
+    def withdraw(self, runner):
+        """Remove a runner which has not started from the queue, returning True if it was queued"""
+        with self._lock:
+            for item in self._queue:
+                if item[2] is runner:
+                    self._queue.remove(item)
+                    heapq.heapify(self._queue)
+                    return True
+
+        return False
+
+    def clear(self):
+        """Drop all queued runners, returning them"""
+        with self._lock:
+            dropped = [item[2] for item in self._queue]
+            self._queue = []
+
+        return dropped
+
+    def finished(self, runner):
+        with self._lock:
+            self._running.discard(runner)
+            action_class = self._classes.get(runner.action)
+            if action_class:
+                self._class_running[action_class] -= 1
+            self._dispatch()
+
+    def _runnable(self, runner):
+        action_class = self._classes.get(runner.action)
+        limit = self._class_limits.get(action_class)
+        return limit is None or self._class_running[action_class] < limit
+
+    def _dispatch(self):
+        """Start queued runners while there are free workers, called with the lock held"""
+        skipped = []
+        while self._queue and len(self._running) < self._workers:
+            item = heapq.heappop(self._queue)
+            runner = item[2]
+            if not self._runnable(runner):
+                skipped.append(item)
+                continue
+
+            runner.queue_stats = {'wait': time.time() - runner.queued_at, 'depth': len(self._queue) + len(skipped)}
+            self._running.add(runner)
+            action_class = self._classes.get(runner.action)
+            if action_class:
+                self._class_running[action_class] += 1
+            runner.start()
+
+        for item in skipped:
+            heapq.heappush(self._queue, item)
+
+
+def _executor_settings():
+    """The number of workers and action class limits, from the agent settings"""
+    try:
+        agent_settings = config.get('settings', 'agent')
+    except (TypeError, KeyError, IOError):
+        agent_settings = {}
+
+    return (int(agent_settings.get('action_workers', DEFAULT_AGENT_CONFIG['action_workers'])),
+            agent_settings.get('action_class_concurrency', DEFAULT_AGENT_CONFIG['action_class_concurrency']))
+
+
 class ActionRunnerPlugin(DevicePlugin):
     """
     This class is responsible for handling requests to run actions: invoking
     the required ActionPlugin and handling concurrency.
+
+    Actions are queued on an ActionExecutor, which limits how many run at once.
+    Cancellations are handled as soon as they arrive: queued actions are simply
+    dropped and running ones are interrupted.
     """
 
     def __init__(self, *args, **kwargs):
         self._running_actions_lock = threading.Lock()
         self._running_actions = {}
         self._tearing_down = False
+        self._executor = ActionExecutor(*_executor_settings())
         super(ActionRunnerPlugin, self).__init__(*args, **kwargs)
 
     def run(self, id, cmd, args):
@@ -51,16 +193,18 @@ class ActionRunnerPlugin(DevicePlugin):
         with self._running_actions_lock:
             if not self._tearing_down:
                 self._running_actions[id] = thread
-                thread.start()
+                self._executor.put(thread)
 
     def teardown(self):
         self._tearing_down = True
 
         wait_threads = []
         with self._running_actions_lock:
+            queued = self._executor.clear()
             for action_id, thread in self._running_actions.items():
-                thread.stop()
-                wait_threads.append(thread)
+                if thread not in queued:
+                    thread.stop()
+                    wait_threads.append(thread)
 
             self._running_actions.clear()
 
@@ -99,13 +243,16 @@ class ActionRunnerPlugin(DevicePlugin):
         if self._tearing_down:
             return
 
+        thread = self._running_actions.get(id)
+
         self.send_message(
             {
                 'type': "ACTION_COMPLETE",
                 'id': id,
                 'result': result,
                 'exception': backtrace,
-                'subprocesses': subprocesses
+                'subprocesses': subprocesses,
+                'queue': thread.queue_stats if thread else None
             }, callback)
 
     def cancel(self, id):
@@ -116,7 +263,11 @@ class ActionRunnerPlugin(DevicePlugin):
                 # Cannot cancel that which does not exist
                 pass
             else:
-                thread.stop()
+                if self._executor.withdraw(thread):
+                    daemon_log.info("ActionRunner.cancelled %s before it started" % id)
+                    del self._running_actions[id]
+                else:
+                    thread.stop()
 
     def on_message(self, body):
         if body['type'] == 'ACTION_START':
@@ -139,6 +290,10 @@ class ActionRunner(threading.Thread):
         self._subprocess_abort = None
         self._started = threading.Event()
 
+        # Set by ActionExecutor
+        self.queued_at = None
+        self.queue_stats = None
+
     def stop(self):
         # Don't go any further until the run() method has set up its thread local state
         self._started.wait()
@@ -172,3 +327,5 @@ class ActionRunner(threading.Thread):
             self.manager.fail(self.id, backtrace, AgentShell.thread_state.get_subprocesses())
         else:
             self.manager.succeed(self.id, result, AgentShell.thread_state.get_subprocesses())
+        finally:
+            self.manager._executor.finished(self)
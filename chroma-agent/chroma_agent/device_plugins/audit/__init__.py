@@ -21,5 +21,9 @@ class BaseAudit(object):
     def metrics(self):
         raise NotImplementedError
 
+    def counters(self):
+        """Returns the cumulative counters worth sampling between polls, as {path: value}."""
+        return {}
+
     def properties(self):
         return {}
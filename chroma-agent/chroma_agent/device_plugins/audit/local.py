@@ -11,14 +11,44 @@ from chroma_agent.log import console_log
 
 
 class LocalAudit(BaseAudit, FileSystemMixin):
+    """Aggregates the metrics and properties of the audit classes available on this node.
+
+    Instances are long lived (the LustrePlugin keeps one per session), and so are the
+    audits they hold, so that per-target state such as job_stats snapshot times carries
+    over from one poll to the next.  The available classes are only worked out again when
+    the loaded kernel modules or the Lustre devices change.
+    """
+
     def __init__(self, **kwargs):
         super(LocalAudit, self).__init__(**kwargs)
+        self._topology = None
+        self._audits = []
+
+    def _read_topology(self):
+        """Return the names of the loaded kernel modules and the type and name of each Lustre
+        device, which decide the available audit classes.  Reference counts and the like are
+        left out because they change all the time without changing the topology."""
+        topology = []
+        for filename, fields in [('/proc/modules', slice(0, 1)),
+                                 ('/sys/kernel/debug/lustre/devices', slice(2, 4))]:
+            try:
+                topology.append([line.split()[fields] for line in self.read_lines(filename)])
+            except IOError:
+                topology.append(None)
+        return topology
+
+    def audits(self):
+        """Return an instance of each available audit class, reusing those from earlier calls"""
+        topology = self._read_topology()
+        if topology != self._topology:
+            existing = dict((audit.__class__, audit) for audit in self._audits)
+            self._audits = [existing.get(cls) or cls() for cls in chroma_agent.device_plugins.audit.local_audit_classes()]
+            self._topology = topology
+
+        return self._audits
 
-    # FIXME: This probably ought to be a memorized property, but I'm lazy.
     def audit_classes(self):
-        if not hasattr(self, 'audit_classes_list'):
-            self.audit_classes_list = chroma_agent.device_plugins.audit.local_audit_classes()
-        return self.audit_classes_list
+        return [audit.__class__ for audit in self.audits()]
 
     # Flagrantly "borrowed" from:
     # http://stackoverflow.com/questions/5575124/python-combine-several-nested-lists-into-a-dictionary
@@ -55,14 +85,18 @@ class LocalAudit(BaseAudit, FileSystemMixin):
     def metrics(self):
         """Returns an aggregated dict of all subclass metrics."""
         agg_raw = {}
-        for cls in self.audit_classes():
-            audit = cls()
+        for audit in self.audits():
             audit_metrics = audit.metrics()
             agg_raw = self.__mergedicts(agg_raw, audit_metrics['raw'])
 
         return {'raw': agg_raw}
 
+    @exceptionSandBox(console_log, {})
+    def counters(self):
+        """Returns the merged counters of all the audits, for sampling between polls."""
+        return dict(item for audit in self.audits() for item in audit.counters().items())
+
     @exceptionSandBox(console_log, {})
     def properties(self):
         """Returns merged properties suitable for host validation."""
-        return dict(item for cls in self.audit_classes() for item in cls().properties().items())
+        return dict(item for audit in self.audits() for item in audit.properties().items())
@@ -6,10 +6,8 @@
 import re
 import os
 import heapq
-from collections import defaultdict
 from collections import namedtuple
 
-from tablib.packages import yaml
 from chroma_agent.utils import Mounts
 from chroma_agent.device_plugins.audit import BaseAudit
 from chroma_agent.device_plugins.audit.mixins import FileSystemMixin
@@ -28,6 +26,62 @@ def local_audit_classes():
             if hasattr(cls, 'is_available') and cls.is_available()]
 
 
+def _job_stats_scalar(value):
+    """Convert a job_stats value to the type yaml.load would give it"""
+    if re.match(r'^[-+]?\d+$', value):
+        return int(value)
+    elif re.match(r'^[-+]?\d+\.\d*$', value):
+        return float(value)
+    elif len(value) > 1 and value[0] == value[-1] and value[0] in '"\'':
+        return value[1:-1]
+    else:
+        return value
+
+
+def parse_job_stats(lines, wanted = None):
+    """Generate a dict for each job in the lines of a job_stats file, as yaml.load would
+    give them, one job at a time rather than loading the whole file.
+
+    Each job starts with its job_id and snapshot_time.  If `wanted` is given it is called with
+    them, and the counters of jobs it returns False for are skipped without being parsed.
+
+    e.g.
+    job_stats:
+    - job_id:          dd.0
+      snapshot_time:   1381939640
+      read_bytes:      { samples:         662, unit: bytes, min:  106496, max: 1048576, sum:       671088640 }
+      setattr:         { samples:           1, unit:  reqs }
+    """
+    stat = None
+    skip = False
+
+    for line in lines:
+        if line.startswith('- '):
+            if stat is not None and not skip:
+                yield stat
+            stat = {}
+            skip = False
+            line = line[2:]
+        elif stat is None or skip:
+            # The 'job_stats:' header, or the counters of a job we do not want
+            continue
+
+        key, _, value = line.strip().partition(':')
+        value = value.strip()
+
+        if value.startswith('{'):
+            stat[key] = dict((k.strip(), _job_stats_scalar(v.strip()))
+                             for k, v in (item.split(':', 1) for item in value.strip('{} ').split(',')))
+        else:
+            stat[key] = _job_stats_scalar(value)
+
+            if key == 'snapshot_time' and wanted is not None:
+                skip = not wanted(stat['job_id'], stat['snapshot_time'])
+
+    if stat is not None and not skip:
+        yield stat
+
+
 class LustreAudit(BaseAudit, FileSystemMixin):
     """Parent class for LustreAudit entities.
 
@@ -188,6 +242,10 @@ class LustreAudit(BaseAudit, FileSystemMixin):
 
 
 class TargetAudit(LustreAudit):
+    # The type of Lustre device audited, whose stats are sampled between polls.  None for the MGS,
+    # whose metrics the manager does not store.
+    device_type = None
+
     def __init__(self, **kwargs):
         super(TargetAudit, self).__init__(**kwargs)
         self.int_metric_map = {
@@ -205,6 +263,11 @@ class TargetAudit(LustreAudit):
 
         self.raw_metrics['lustre']['target'] = {}
 
+    def metrics(self):
+        # Audits are kept from one poll to the next, so forget targets reported by the last one
+        self.raw_metrics['lustre']['target'] = {}
+        return super(TargetAudit, self).metrics()
+
     def read_stats(self, target):
         """Returns a dict containing target stats."""
         path = os.path.join(self.target_root, target, "stats")
@@ -217,6 +280,19 @@ class TargetAudit(LustreAudit):
 
         return stats
 
+    def counters(self):
+        """Returns the stats stored as counters by the manager, keyed by ('target', target name, stat name):
+        request counts, and the byte totals of read_bytes and write_bytes."""
+        counters = {}
+        for target in [dev['name'] for dev in self.devices() if dev['type'] == self.device_type]:
+            for name, stat in self.read_stats(target).items():
+                if 'sum' not in stat or stat['units'] == 'reqs':
+                    counters[('target', target, name)] = stat['count']
+                elif stat['units'] == 'bytes':
+                    counters[('target', target, name)] = stat['sum']
+
+        return counters
+
     def read_int_metric(self, target, metric):
         """Given a target name and simple int metric name, returns the
         metric value as an int.  Tries a simple interpolation of the target
@@ -250,6 +326,8 @@ class TargetAudit(LustreAudit):
 
 class MdsAudit(TargetAudit):
     """In Lustre < 2.x, the MDT stats were mis-named as MDS stats."""
+    device_type = 'mds'
+
     @classmethod
     def is_available(cls):
         """Stupid override to prevent this being used on 2.x+ filesystems."""
@@ -269,6 +347,8 @@ class MdsAudit(TargetAudit):
 
 
 class MdtAudit(TargetAudit):
+    device_type = 'mdt'
+
     def __init__(self, **kwargs):
         super(MdtAudit, self).__init__(**kwargs)
         self.target_root = '/proc/fs/lustre'
@@ -403,6 +483,8 @@ class MgsAudit(TargetAudit):
 
 
 class ObdfilterAudit(TargetAudit):
+    device_type = 'obdfilter'
+
     def __init__(self, **kwargs):
         super(ObdfilterAudit, self).__init__(**kwargs)
         self.target_root = '/proc/fs/lustre/obdfilter'
@@ -411,7 +493,8 @@ class ObdfilterAudit(TargetAudit):
             'tot_granted': 'tot_granted',
             'tot_pending': 'tot_pending'
         })
-        self.job_stat_last_snapshot_time = defaultdict(int)
+        # The snapshot time of each job as of the last poll, for each target
+        self.job_stat_last_snapshot_time = {}
 
     def read_brw_stats(self, target):
         """Return a dict representation of an OST's brw_stats histograms."""
@@ -486,37 +569,22 @@ class ObdfilterAudit(TargetAudit):
 
         return histograms
 
-    def _read_job_stats_yaml_file(self, target_name):
-        """Given a path to a yaml file, read the file into a dict and return a value
-
-        return values will be an list or None.
-        If an list, it will hold the parsed stats as a list from the job_stats file, could be an empty list
-        If None, callers can conclude job stats is not turned on.
+    def _open_job_stats_file(self, target_name):
+        """Open the job_stats file of a target, returning None if job stats are not turned on.
 
         The main value of splitting this is so it can be mocked out in tests.
 
-        :param path  Full path to the yaml file (i.e. /proc/fs/lustre/obdfilter/lustre-OST0000/job_stats)
-
-        Sample Code showing the output when job stats is cleared.
+        Sample output when job stats is cleared.
         $ lctl set_param obdfilter.*.job_stats=clear
-        >>> from tablib.packages import yaml
-        >>> f = open('/proc/fs/lustre/obdfilter/ldiskfs-OST0001/job_stats')
-        >>> d = yaml.load(f)
-        >>> d.items()
-        [('job_stats', None)]
-
+        $ cat /proc/fs/lustre/obdfilter/ldiskfs-OST0001/job_stats
+        job_stats:
         """
         path = self.abs(os.path.join(self.target_root, target_name, 'job_stats'))
         try:
-            with open(path) as yaml_file:
-                read_dict = yaml.load(yaml_file)
+            return open(path)
         except IOError:
             # If job stats is NOT turned on, the file will not exist
             return None
-        else:
-            # job stats output should always have this key, but it will return None when there are not stats
-            # Instead this method should return [].  None means job stats is not turned on.
-            return read_dict.get("job_stats") or []
 
     def read_job_stats(self, target_name):
         """Try to read and return the contents of /proc/fs/lustre/obdfilter/<target>/job_stats
@@ -528,38 +596,50 @@ class ObdfilterAudit(TargetAudit):
         In an active system, this ought to give meaning results, while in a quiet system, the top X stats may
         all be zero, or some other equal value from sample to sample, and therefore be supressed.
 
+        An OSS can have tens of thousands of jobs, so the file is parsed a job at a time, the counters of jobs
+        that have not changed are skipped, and only the top few jobs seen so far are kept.
+
         If Job stats is not turned on, there will be no proc file path, and this method will return [] as if no stats
         are found.
         """
 
-        stats = self._read_job_stats_yaml_file(target_name)
+        job_stats_file = self._open_job_stats_file(target_name)
 
-        if not stats:
-            # stats is None when job stats is disabled, or [] if enabled but empty
-            # currently no reason it differentiate, so return as if empty
+        if job_stats_file is None:
             return []
 
-        #  Initialize this dict in preparation to collect just these latest snapshot times as seen in this stats sample
-        latest_job_stat_snapshot_times = defaultdict(int)
+        last_job_stat_snapshot_times = self.job_stat_last_snapshot_time.get(target_name, {})
 
-        stats_to_return = []
-        for stat in stats:
-            # Convert to a format expected in other parts of the application.
-            stat['read'] = stat.pop('read_bytes')
-            stat['write'] = stat.pop('write_bytes')
+        #  Initialize this dict in preparation to collect just these latest snapshot times as seen in this stats sample
+        latest_job_stat_snapshot_times = {}
 
+        def is_new(job_id, snapshot_time):
             #  Record that we know about this stat
-            latest_job_stat_snapshot_times[stat['job_id']] = stat['snapshot_time']
+            latest_job_stat_snapshot_times[job_id] = snapshot_time
 
             #  if we knew about this last run, and the time is new, then report it
-            if self.job_stat_last_snapshot_time[stat['job_id']] < stat['snapshot_time']:
-                stats_to_return.append(stat)
+            return last_job_stat_snapshot_times.get(job_id, 0) < snapshot_time
+
+        #  Heap of the top few job stats based on read+write sum, earlier jobs first amongst equals as nlargest does.
+        top_stats = []
+        with job_stats_file:
+            for index, stat in enumerate(parse_job_stats(job_stats_file, is_new)):
+                # Convert to a format expected in other parts of the application.
+                stat['read'] = stat.pop('read_bytes')
+                stat['write'] = stat.pop('write_bytes')
+
+                item = (stat['read']['sum'] + stat['write']['sum'], -index, stat)
+                if len(top_stats) < JOB_STATS_LIMIT:
+                    heapq.heappush(top_stats, item)
+                else:
+                    heapq.heappushpop(top_stats, item)
 
         #  The local dict will have all the current times for jobs we are tracking, so update the instance copy.
-        self.job_stat_last_snapshot_time = latest_job_stat_snapshot_times
+        #  A file with no jobs in it (e.g. just cleared) leaves the times as they were.
+        if latest_job_stat_snapshot_times:
+            self.job_stat_last_snapshot_time[target_name] = latest_job_stat_snapshot_times
 
-        #  Get the top few job stats based on read+write sum.
-        return heapq.nlargest(JOB_STATS_LIMIT, stats_to_return, key=lambda stat: stat['read']['sum'] + stat['write']['sum'])
+        return [stat for _, _, stat in sorted(top_stats, reverse = True)]
 
     def _gather_raw_metrics(self):
         metrics = self.raw_metrics['lustre']
@@ -567,7 +647,10 @@ class ObdfilterAudit(TargetAudit):
             metrics['jobid_var'] = self.read_string('/sys/fs/lustre/jobid_var')
         except IOError:
             metrics['jobid_var'] = 'disable'
-        for ost in [dev for dev in self.devices() if dev['type'] == 'obdfilter']:
+        osts = [dev for dev in self.devices() if dev['type'] == 'obdfilter']
+        for target_name in set(self.job_stat_last_snapshot_time) - set(ost['name'] for ost in osts):
+            del self.job_stat_last_snapshot_time[target_name]
+        for ost in osts:
             metrics['target'][ost['name']] = self.read_int_metrics(ost['name'])
             metrics['target'][ost['name']]['stats'] = self.read_stats(ost['name'])
             if not DISABLE_BRW_STATS:
@@ -611,6 +694,10 @@ class LnetAudit(LustreAudit):
                 'send_length': h, 'recv_length': i,
                 'route_length': j, 'drop_length': k}
 
+    def counters(self):
+        return dict((('lnet', key), value) for key, value in self.parse_lnet_stats().items()
+                    if key in ('send_count', 'recv_count', 'send_length', 'recv_length'))
+
     def _gather_raw_metrics(self):
         self.raw_metrics['lustre']['lnet'] = self.parse_lnet_stats()
 
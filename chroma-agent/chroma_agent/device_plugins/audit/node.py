@@ -8,6 +8,7 @@ import socket
 import platform
 
 from chroma_agent.lib.shell import AgentShell
+from chroma_agent.lib.profiling import agent_profile
 from chroma_agent.device_plugins.audit import BaseAudit
 from chroma_agent.device_plugins.audit.mixins import FileSystemMixin
 
@@ -46,6 +47,7 @@ class NodeAudit(BaseAudit, FileSystemMixin):
         self.raw_metrics['node']['hostname'] = socket.gethostname()
         self.raw_metrics['node']['meminfo'] = self.parse_meminfo()
         self.raw_metrics['node']['cpustats'] = self.parse_cpustats()
+        self.raw_metrics['node']['agent'] = agent_profile.totals()
 
     def metrics(self):
         """Returns a hash of metric values."""
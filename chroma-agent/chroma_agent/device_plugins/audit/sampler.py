@@ -0,0 +1,103 @@
+# Copyright (c) 2017 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a MIT-style
+# license that can be found in the LICENSE file.
+
+
+"""Sampling of the audits' cumulative counters more often than the plugins poll, so that the bursts
+a single point per poll averages away are still seen by the manager."""
+
+
+import threading
+import time
+from collections import deque
+
+from chroma_agent.log import console_log
+
+"""
+Samples kept between polls, enough for the longest poll period the manager asks for at one sample a second.
+Older samples are dropped, shortening the interval summarized rather than growing without bound.
+"""
+RING_SIZE = 150
+
+
+def summarize(samples):
+    """Return {path: {'count': n, 'sum': n, 'min': n, 'max': n}} of each counter over consecutive
+    (time, {path: value}) samples: the number of intervals, the total increase, and the lowest and
+    highest rate per second.  A counter going backwards has been reset (e.g. the target restarted or
+    its stats were cleared), so that interval is left out.
+    """
+    summaries = {}
+
+    for (then, before), (now, after) in zip(samples, samples[1:]):
+        elapsed = now - then
+        if elapsed <= 0:
+            continue
+
+        for path, value in after.items():
+            increase = value - before.get(path, value)
+            if path not in before or increase < 0:
+                continue
+
+            rate = increase / float(elapsed)
+            summary = summaries.get(path)
+            if summary is None:
+                summaries[path] = {'count': 1, 'sum': increase, 'min': rate, 'max': rate}
+            else:
+                summary['count'] += 1
+                summary['sum'] += increase
+                summary['min'] = min(summary['min'], rate)
+                summary['max'] = max(summary['max'], rate)
+
+    return summaries
+
+
+class CounterSampler(threading.Thread):
+    """Read counters every `interval` seconds into a bounded ring, from which each poll takes a summary.
+
+    `read` returns the counters as {path: value}, where path is a tuple of keys under which the
+    summary is nested in the dict returned by take().
+    """
+
+    def __init__(self, read, interval, ring_size = RING_SIZE):
+        super(CounterSampler, self).__init__()
+        self.daemon = True
+        self._read = read
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._ring = deque(maxlen = ring_size)
+        self._stopping = threading.Event()
+
+    def sample(self):
+        try:
+            counters = self._read()
+        except Exception as e:
+            console_log.debug("Failed to sample counters: %s" % e)
+            return
+
+        with self._lock:
+            self._ring.append((time.time(), counters))
+
+    def run(self):
+        while not self._stopping.wait(self._interval):
+            self.sample()
+
+    def stop(self):
+        self._stopping.set()
+
+    def take(self):
+        """Return the summaries of the samples since the last call, as a nested dict.  The latest
+        sample is kept as the start of the next interval."""
+        with self._lock:
+            samples = list(self._ring)
+            self._ring.clear()
+            if samples:
+                self._ring.append(samples[-1])
+
+        result = {}
+        for path, summary in summarize(samples).items():
+            parent = result
+            for key in path[:-1]:
+                parent = parent.setdefault(key, {})
+            parent[path[-1]] = summary
+
+        return result
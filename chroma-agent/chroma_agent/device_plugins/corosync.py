@@ -3,24 +3,11 @@
 # license that can be found in the LICENSE file.
 
 
-import xml.etree.ElementTree as xml
-import errno
-
-from chroma_agent.lib.shell import AgentShell
 from chroma_agent.log import daemon_log
 from chroma_agent.plugin_manager import DevicePlugin
 from iml_common.lib.exception_sandbox import exceptionSandBox
 from chroma_agent.lib.corosync import corosync_running
-from chroma_agent.lib.pacemaker import pacemaker_running
-from iml_common.lib.date_time import IMLDateTime
-
-try:
-    # Python 2.7
-    from xml.etree.ElementTree import ParseError
-    ParseError  # silence pyflakes
-except ImportError:
-    # Python 2.6
-    from xml.parsers.expat import ExpatError as ParseError
+from chroma_agent.lib.pacemaker import pacemaker_running, crm_mon_status, CrmMonStatus
 
 
 class CorosyncPlugin(DevicePlugin):
@@ -38,88 +25,36 @@ class CorosyncPlugin(DevicePlugin):
 
         datetime is passed in localtime converted to UTC.
 
+        The crm_mon status is shared with the other plugins and actions, see
+        chroma_agent.lib.pacemaker.crm_mon_status.
+
         Based on xml output from this version of corosync/pacemaker
         crm --version
         1.1.7-6.el6 (Build 148fccfd5985c5590cc601123c6c16e966b85d14)
     """
 
-    # This is the message that crm_mon will report
-    # when corosync is not running
-    COROSYNC_CONNECTION_FAILURE = ("Connection to cluster failed: "
-                                   "connection failed")
-
-    def _parse_crm_as_xml(self, raw):
-        """ Parse the crm_mon response
+    def _parse_crm_status(self, status):
+        """ Pack up the shared crm_mon status
 
         returns dict of nodes status or None if corosync is down
         """
 
-        return_dict = None
-
-        try:
-            root = xml.fromstring(raw)
-        except ParseError:
-            # not xml, might be a known error message
-            if CorosyncPlugin.COROSYNC_CONNECTION_FAILURE not in raw:
-                daemon_log.warning("Bad xml from corosync crm_mon:  %s" % raw)
-        else:
-            return_dict = {}
-
-            #  Got node info, pack it up and return
-            tm_str = root.find('summary/last_update').get('time')
-            tm_datetime = IMLDateTime.strptime(tm_str, '%a %b %d %H:%M:%S %Y')
-            return_dict.update({'datetime': IMLDateTime.convert_datetime_to_utc(tm_datetime).strftime("%Y-%m-%dT%H:%M:%S+00:00")})
-
-            nodes = {}
-            for node in root.findall("nodes/node"):
-                host = node.get("name")
-                nodes.update({host: node.attrib})
-
-            return_dict['nodes'] = nodes
-
-            return_dict['options'] = {
-                'stonith_enabled': False
-            }
-
-            cluster_options = root.find('summary/cluster_options')
-
-            if cluster_options is not None:
-                return_dict['options'].update({'stonith_enabled': cluster_options.get('stonith-enabled') == 'true'})
-
-        return return_dict
-
-    def _read_crm_mon_as_xml(self):
-        """Run crm_mon --one-shot --as-xml, return raw output or None
-
-        For expected return values (0, 10), return the stdout from output.
-        If the return value is unexpected, log a warning, and return None
-        """
-
-        crm_command = ['crm_mon', '--one-shot', '--as-xml']
-        try:
-            rc, stdout, stderr = AgentShell.run_old(crm_command)
-        except OSError, e:
-            # ENOENT is fine here.  Pacemaker might not be installed yet.
-            if e.errno != errno.ENOENT:
-                raise
-
-        if rc not in [0, 10]:  # 10 Corosync is not running on this node
-            daemon_log.warning("rc=%s running '%s': '%s' '%s'" %
-                               (rc, crm_command, stdout, stderr))
-            stdout = None
+        if not status.available:
+            if status.rc not in [0, 10, None]:  # 10 Corosync is not running on this node
+                daemon_log.warning("rc=%s running '%s': '%s' '%s'" %
+                                   (status.rc, CrmMonStatus.COMMAND, status.stdout, status.stderr))
+            return None
 
-        return stdout
+        return {'datetime': status.last_update.strftime("%Y-%m-%dT%H:%M:%S+00:00"),
+                'nodes': status.nodes,
+                'options': status.options}
 
     def _scan(self):
         """Respond to poll.  Only return if has valid data"""
 
         result = {}
 
-        raw_output = self._read_crm_mon_as_xml()
-        if raw_output:
-            result['crm_info'] = self._parse_crm_as_xml(raw_output)
-        else:
-            result['crm_info'] = None
+        result['crm_info'] = self._parse_crm_status(crm_mon_status())
 
         result["state"] = {}
         result["state"]["corosync"] = "started" if corosync_running() else "stopped"
@@ -3,6 +3,8 @@
 # license that can be found in the LICENSE file.
 
 
+import time
+
 from chroma_agent.lib.shell import AgentShell
 from chroma_agent.plugin_manager import DevicePlugin
 from chroma_agent import config
@@ -12,6 +14,17 @@ from chroma_agent.device_plugins.linux_components.device_mapper import DmsetupTa
 from chroma_agent.device_plugins.linux_components.emcpower import EMCPower
 from chroma_agent.device_plugins.linux_components.local_filesystems import LocalFilesystems
 from chroma_agent.device_plugins.linux_components.mdraid import MdRaid
+from chroma_agent.device_plugins.linux_components.device_events import DeviceEvents, BLOCK, DM, MD, ZFS
+
+"""
+While device events are being followed, a quick scan for changes they missed is only made every this many polls
+"""
+QUICK_SCAN_INTERVAL = 30
+
+"""
+Seconds after a scan during which device events are ignored, as the scan itself causes some (e.g. partprobe)
+"""
+EVENT_SETTLE_TIME = 2.0
 
 
 class LinuxDevicePlugin(DevicePlugin):
@@ -24,37 +37,62 @@ class LinuxDevicePlugin(DevicePlugin):
         super(LinuxDevicePlugin, self).__init__(session)
         self._last_quick_scan_result = ""
         self._last_full_scan_result = None
+        self._last_components = None
+        self._polls_since_quick_scan = 0
+        self._events_settle_at = 0
+        self._device_events = DeviceEvents()
+
+    def teardown(self):
+        self._device_events.stop()
 
     def _quick_scan(self):
         """Lightweight enumeration of available block devices"""
         return ZfsDevices().quick_scan() + BlockDevices.quick_scan()
 
-    def _full_scan(self):
+    def _full_scan(self, changed = None):
+        """Scan all devices, or if `changed` is a set of subsystems with changes only rescan those, reusing
+        the results of the last scan for the others.
+        """
         # If we are a worker node then return nothing because our devices are not of interest. This is a short term
         # solution for HYD-3140. This plugin should really be loaded if it is not needed but for now this sorts out
         # and issue with PluginAgentResources being in the linux plugin.
         if config.get('settings', 'profile')['worker']:
             return {}
 
-        # Before we do anything do a partprobe, this will ensure that everything gets an up to date view of the
-        # device partitions. partprobe might throw errors so ignore return value
-        AgentShell.run(["partprobe"])
+        if changed is None:
+            # Before we do anything do a partprobe, this will ensure that everything gets an up to date view of the
+            # device partitions. partprobe might throw errors so ignore return value. A device event means the kernel
+            # already has an up to date view.
+            AgentShell.run(["partprobe"])
 
-        # Map of block devices major:minors to /dev/ path.
+        last = self._last_components
+
+        def rescan(subsystem):
+            return changed is None or last is None or subsystem in changed or BLOCK in changed
+
+        # Map of block devices major:minors to /dev/ path. This is always read again as devicemapper and zfs add to it.
         block_devices = BlockDevices()
 
         # Devicemapper: LVM and Multipath
-        dmsetup = DmsetupTable(block_devices)
+        dmsetup = DmsetupTable(block_devices, None if rescan(DM) else last['dmsetup'])
 
         # Software RAID
-        mds = MdRaid(block_devices).all()
+        mds = MdRaid(block_devices).all() if rescan(MD) else last['mds']
 
         # _zpools
         zfs_devices = ZfsDevices()
-        zfs_devices.full_scan(block_devices)
+        if rescan(ZFS):
+            zfs_devices.full_scan(block_devices)
+        else:
+            zfs_devices.rescan(last['zfs_devices'], block_devices)
 
         # EMCPower Devices
-        emcpowers = EMCPower(block_devices).all()
+        emcpowers = EMCPower(block_devices).all() if rescan(BLOCK) else last['emcpowers']
+
+        self._last_components = {'dmsetup': dmsetup,
+                                 'mds': mds,
+                                 'zfs_devices': zfs_devices,
+                                 'emcpowers': emcpowers}
 
         # Local filesystems (not lustre) in /etc/fstab or /proc/mounts
         local_fs = LocalFilesystems(block_devices).all()
@@ -73,13 +111,42 @@ class LinuxDevicePlugin(DevicePlugin):
                 'emcpower': emcpowers,
                 'mds': mds}
 
+    def _changes(self, scan_always):
+        """Return None if all devices must be scanned, else the set of subsystems which have changed.
+
+        While device events are being followed they say what has changed, otherwise (or every QUICK_SCAN_INTERVAL
+        polls, in case any were missed) a quick scan is compared with the last.
+        """
+        if scan_always:
+            return None
+
+        if self._device_events.watching:
+            changed = self._device_events.take(self._events_settle_at)
+            self._polls_since_quick_scan += 1
+
+            if changed or self._polls_since_quick_scan < QUICK_SCAN_INTERVAL:
+                return changed
+
+        self._polls_since_quick_scan = 0
+        quick_scan_result = self._quick_scan()
+
+        if quick_scan_result != self._last_quick_scan_result:
+            self._last_quick_scan_result = quick_scan_result
+            return None
+
+        return set()
+
     def _scan_devices(self, scan_always):
         full_scan_result = None
+        changed = self._changes(scan_always)
 
-        if scan_always or (self._quick_scan() != self._last_quick_scan_result):
-            self._last_quick_scan_result = self._quick_scan()
-            full_scan_result = self._full_scan()
+        if changed is None or changed:
+            if scan_always or changed:
+                # Keep the quick scan up to date for the next comparison
+                self._last_quick_scan_result = self._quick_scan()
+            full_scan_result = self._full_scan(changed)
             self._last_full_scan_result = full_scan_result
+            self._events_settle_at = time.time() + EVENT_SETTLE_TIME
         elif self._safety_send < DevicePlugin.FAILSAFEDUPDATE:
             self._safety_send += 1
         else:
@@ -95,6 +162,7 @@ class LinuxDevicePlugin(DevicePlugin):
         return full_scan_result
 
     def start_session(self):
+        self._device_events.start()
         return self._scan_devices(True)
 
     def update_session(self):
@@ -0,0 +1,140 @@
+# Copyright (c) 2017 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a MIT-style
+# license that can be found in the LICENSE file.
+
+import subprocess
+import threading
+import time
+
+from chroma_agent.log import console_log
+
+"""
+Subsystems of block devices which can be rescanned separately.  A change to a plain block device can
+affect all the others built on it.
+"""
+BLOCK = 'block'
+DM = 'dm'
+MD = 'md'
+ZFS = 'zfs'
+
+
+def udev_event_subsystem(properties):
+    """Return the subsystem affected by a udev block device event, given its properties"""
+    devname = properties.get('DEVNAME', '')
+
+    if 'DM_NAME' in properties or devname.startswith('/dev/dm-'):
+        return DM
+    elif 'MD_LEVEL' in properties or devname.startswith('/dev/md'):
+        return MD
+    elif devname.startswith('/dev/zd'):
+        return ZFS
+    else:
+        return BLOCK
+
+
+def parse_udev_events(lines):
+    """Generate the subsystem of each block device event from the output of `udevadm monitor --property`
+
+    e.g.
+    UDEV  [1048.571629] change   /devices/virtual/block/dm-0 (block)
+    ACTION=change
+    DEVNAME=/dev/dm-0
+    DM_NAME=mpatha
+    SUBSYSTEM=block
+    """
+    properties = {}
+
+    for line in lines:
+        line = line.strip()
+        if line:
+            key, _, value = line.partition('=')
+            if value:
+                properties[key] = value
+        else:
+            if properties.get('SUBSYSTEM') == 'block':
+                yield udev_event_subsystem(properties)
+            properties = {}
+
+
+def parse_zfs_events(lines):
+    """Generate ZFS for each event from the output of `zpool events -H -f`, one per line
+
+    e.g.
+    Oct 18 2017 10:00:00.123456789 sysevent.fs.zfs.pool_import
+    """
+    for line in lines:
+        if line.strip():
+            yield ZFS
+
+
+class EventFollower(threading.Thread):
+    """Run a command which prints events as they happen and call back with the subsystem of each"""
+
+    def __init__(self, args, parse, callback):
+        super(EventFollower, self).__init__()
+        self.daemon = True
+        self._args = args
+        self._parse = parse
+        self._callback = callback
+        self._process = None
+        self._stopping = threading.Event()
+
+    def run(self):
+        try:
+            self._process = subprocess.Popen(self._args, stdout = subprocess.PIPE, close_fds = True)
+        except OSError as e:
+            # The command is not installed, changes are left to the quick scans
+            console_log.debug("Not following device events from %s: %s" % (self._args[0], e))
+            return
+
+        if self._stopping.is_set():
+            self._process.terminate()
+
+        for subsystem in self._parse(iter(self._process.stdout.readline, '')):
+            self._callback(subsystem)
+
+        self._process.wait()
+
+    def stop(self):
+        self._stopping.set()
+        if self._process and self._process.poll() is None:
+            self._process.terminate()
+
+
+class DeviceEvents(object):
+    """Follow udev block device and ZFS events, recording the subsystems they affect so that
+    LinuxDevicePlugin can rescan just those rather than polling for changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._changed = {}
+        self._udev = EventFollower(['udevadm', 'monitor', '--udev', '--subsystem-match=block', '--property'],
+                                   parse_udev_events, self._record)
+        self._zfs = EventFollower(['zpool', 'events', '-H', '-f'], parse_zfs_events, self._record)
+
+    def _record(self, subsystem):
+        with self._lock:
+            self._changed[subsystem] = time.time()
+
+    def start(self):
+        self._udev.start()
+        self._zfs.start()
+
+    def stop(self):
+        self._udev.stop()
+        self._zfs.stop()
+
+    @property
+    def watching(self):
+        """True if udev events are being followed, without them all changes must be polled for"""
+        return self._udev.is_alive()
+
+    def take(self, ignore_before = 0):
+        """Return the subsystems with events since the last call, ignoring those before `ignore_before`
+        (e.g. those caused by scanning)"""
+        with self._lock:
+            changed = set(subsystem for subsystem, at in self._changed.items() if at >= ignore_before)
+            self._changed = {}
+
+        return changed
@@ -5,6 +5,7 @@
 
 import os
 import re
+import copy
 import errno
 
 from chroma_agent.lib.shell import AgentShell
@@ -18,30 +19,47 @@ from iml_common.lib import util
 class DmsetupTable(object):
     """Uses various devicemapper commands to learn about LVM and Multipath"""
 
-    def __init__(self, block_devices):
+    def __init__(self, block_devices, previous = None):
+        """
+        :param block_devices: BlockDevices of this scan, with the parents of LVs and partitions set as the table is parsed
+        :param previous: DmsetupTable of an earlier scan, when devicemapper has not changed since, whose volume
+                         groups and table are parsed again for these block_devices rather than read again
+        """
         self.block_devices = block_devices
         self.mpaths = {}
-        self.vgs = {}
-        self.lvs = {}
+
+        if previous is not None:
+            self._lvm = previous._lvm
+            self._table = previous._table
+        else:
+            self._lvm = self._read_lvm()
+            self._table = AgentShell.try_run(['dmsetup', 'table'])
+
+        # Parsing the table fills in the PVs and block devices, so work on a copy
+        self.vgs, self.lvs = copy.deepcopy(self._lvm)
+        self._parse_dm_table(self._table)
+
+    def _read_lvm(self):
+        vgs = {}
+        lvs = {}
 
         for vg_name, vg_uuid, vg_size in self._get_vgs():
-            self.vgs[vg_name] = {
+            vgs[vg_name] = {
                 'name': vg_name,
                 'uuid': vg_uuid,
                 'size': vg_size,
                 'pvs_major_minor': []}
-            self.lvs[vg_name] = {}
+            lvs[vg_name] = {}
             for lv_name, lv_uuid, lv_size, lv_path in self._get_lvs(vg_name):
                 # Do this to cache the device, type see blockdevice and filesystem for info.
                 BlockDevice('lvm_volume', '/dev/mapper/%s-%s' % (vg_name, lv_name))
 
-                self.lvs[vg_name][lv_name] = {
+                lvs[vg_name][lv_name] = {
                     'name': lv_name,
                     'uuid': lv_uuid,
                     'size': lv_size}
 
-        stdout = AgentShell.try_run(['dmsetup', 'table'])
-        self._parse_dm_table(stdout)
+        return vgs, lvs
 
     def _get_vgs(self):
         try:
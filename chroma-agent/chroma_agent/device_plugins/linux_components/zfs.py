@@ -350,6 +350,15 @@ class ZfsDevices(object):
             self._datasets = {}
             self._zvols = {}
 
+    def rescan(self, previous, block_devices):
+        """Take the pools, datasets and zvols of an earlier scan, when ZFS has not changed since,
+        adding them to the block_devices of this scan without running any zfs commands"""
+        for pool in previous._zpools.values():
+            self._update_pool_or_datasets(block_devices, pool, {}, {})
+
+        if previous._datasets or previous._zvols:
+            self._update_pool_or_datasets(block_devices, None, previous._datasets, previous._zvols)
+
     def _add_zfs_pool(self, line, block_devices):
         name, size_str, uuid = line.split()
 
@@ -8,6 +8,7 @@ import os
 import glob
 import ConfigParser
 
+from chroma_agent import config, DEFAULT_AGENT_CONFIG
 from chroma_agent.lib.shell import AgentShell
 from chroma_agent.log import daemon_log
 from chroma_agent.log import console_log
@@ -26,6 +27,7 @@ from iml_common.blockdevices.blockdevice import BlockDevice
 
 # FIXME: weird naming, 'LocalAudit' is the class that fetches stats
 from chroma_agent.device_plugins.audit import local
+from chroma_agent.device_plugins.audit.sampler import CounterSampler
 
 
 VersionInfo = namedtuple('VersionInfo', ['epoch', 'version', 'release', 'arch'])
@@ -107,6 +109,87 @@ def scan_packages():
     return repo_packages
 
 
+class MetricsEncoder(object):
+    """Delta encode the raw metrics dict for sending to the manager.
+
+    Each leaf of the nested dict is given a key index, and each message carries the paths of
+    keys not sent before in this session followed by (index, value) pairs for only the leaves
+    that have changed, and the indexes of any that have gone.  The manager keeps the same
+    dictionary and last values to expand the message back into the full dict.
+
+    A full dictionary and all the values are sent from index 0 when the session starts and
+    every FAILSAFEDUPDATE messages, so that the manager can recover if it has lost its copy.
+    Messages are numbered in sequence through the session, so that the manager can tell when
+    it has missed one and ask for a new session rather than wait for the next full update.
+    """
+
+    # Stands in for the value of a leaf which has been removed, never equal to one that is sent
+    _removed = object()
+
+    def __init__(self):
+        self._seq = 0
+        self._reset()
+
+    def _reset(self):
+        self._keys = {}
+        self._values = {}
+        self._sent = 0
+
+    def _flatten(self, metrics, path, leaves):
+        for key, value in metrics.items():
+            if isinstance(value, dict) and value:
+                self._flatten(value, path + (key,), leaves)
+            else:
+                leaves[path + (key,)] = value
+
+        return leaves
+
+    def encode(self, metrics):
+        if self._sent >= DevicePlugin.FAILSAFEDUPDATE:
+            self._reset()
+        self._sent += 1
+        self._seq += 1
+
+        first = len(self._keys)
+        keys = []
+        values = []
+        leaves = self._flatten(metrics, (), {})
+
+        for path, value in leaves.items():
+            try:
+                index = self._keys[path]
+            except KeyError:
+                index = self._keys[path] = len(self._keys)
+                keys.append(path)
+            else:
+                # A leaf which went missing keeps its key, and is sent again when it comes back
+                if self._values.get(index, self._removed) == value:
+                    continue
+
+            self._values[index] = value
+            values.append([index, value])
+
+        removed = [index for path, index in self._keys.items() if path not in leaves and index in self._values]
+        for index in removed:
+            del self._values[index]
+
+        return {'delta': {'seq': self._seq,
+                          'first': first,
+                          'keys': keys,
+                          'values': values,
+                          'removed': removed}}
+
+
+def _sample_interval():
+    """Seconds between samples of the Lustre counters, from the agent settings.  0 turns sampling off."""
+    try:
+        agent_settings = config.get('settings', 'agent')
+    except (TypeError, KeyError, IOError):
+        agent_settings = {}
+
+    return float(agent_settings.get('metrics_sample_interval', DEFAULT_AGENT_CONFIG['metrics_sample_interval']))
+
+
 class LustrePlugin(DevicePlugin):
     delta_fields = ['capabilities', 'properties', 'mounts', 'packages', 'resource_locations']
 
@@ -114,8 +197,18 @@ class LustrePlugin(DevicePlugin):
         self.reset_state()
         super(LustrePlugin, self).__init__(session)
 
+        # Target stats and lnet counters are sampled between polls by a separate audit, and each poll
+        # sends the per second rates seen since the last as metrics['lustre']['rates']
+        self._sample_interval = _sample_interval()
+        self._sampler = CounterSampler(local.LocalAudit().counters, self._sample_interval)
+
+    def teardown(self):
+        self._sampler.stop()
+
     def reset_state(self):
         self._mount_cache = defaultdict(dict)
+        self._audit = local.LocalAudit()
+        self._metrics_encoder = MetricsEncoder()
 
     @exceptionSandBox(console_log, {})
     def _scan_mounts(self):
@@ -177,9 +270,17 @@ class LustrePlugin(DevicePlugin):
 
         return mounts.values()
 
+    def _metrics(self):
+        metrics = self._audit.metrics()['raw']
+        rates = self._sampler.take()
+        if rates:
+            metrics.setdefault('lustre', {})['rates'] = rates
+
+        return metrics
+
     def _scan(self, initial=False):
         started_at = IMLDateTime.utcnow().isoformat()
-        audit = local.LocalAudit()
+        audit = self._audit
 
         # Only set resource_locations if we have the management package
         try:
@@ -201,7 +302,7 @@ class LustrePlugin(DevicePlugin):
             "started_at": started_at,
             "agent_version": agent_version(),
             "capabilities": plugin_manager.ActionPluginManager().capabilities,
-            "metrics": audit.metrics(),
+            "metrics": self._metrics_encoder.encode(self._metrics()),
             "properties": audit.properties(),
             "mounts": mounts,
             "packages": packages,
@@ -209,6 +310,8 @@ class LustrePlugin(DevicePlugin):
         }
 
     def start_session(self):
+        if self._sample_interval:
+            self._sampler.start()
         self.reset_state()
         self._reset_delta()
         return self._delta_result(self._scan(initial=True), self.delta_fields)
@@ -5,11 +5,35 @@
 
 import xml.etree.ElementTree as xml
 from xml.parsers.expat import ExpatError as ParseError
+import errno
 import socket
+import threading
+import time
 
 from chroma_agent.lib.shell import AgentShell
 from chroma_agent.lib import fence_agents
+from chroma_agent.log import console_log
 from iml_common.lib import util
+from iml_common.lib.date_time import IMLDateTime
+
+try:
+    # Python 2.7
+    from xml.etree.ElementTree import ParseError as XmlParseError
+except ImportError:
+    # Python 2.6
+    from xml.parsers.expat import ExpatError as XmlParseError
+
+"""
+Seconds for which a crm_mon status is shared by every caller on the agent.  The device plugins poll at the
+same interval so a single crm_mon invocation serves all of them, actions that are waiting for a change ask
+for a fresh status instead.
+"""
+CRM_MON_CACHE_TIME = 10
+
+"""
+The message that crm_mon will report when corosync is not running
+"""
+COROSYNC_CONNECTION_FAILURE = "Connection to cluster failed: connection failed"
 
 
 class PacemakerError(Exception):
@@ -293,3 +317,111 @@ def pacemaker_running():
     result = AgentShell.run(['service', 'pacemaker', 'status'])
 
     return result.rc == 0
+
+
+class CrmMonStatus(object):
+    """The result of a single `crm_mon --one-shot --inactive --as-xml`, parsed once and shared by the device
+    plugins and actions that need node states, resource locations or cluster options.
+    """
+
+    COMMAND = ['crm_mon', '--one-shot', '--inactive', '--as-xml']
+
+    def __init__(self, rc, stdout, stderr):
+        self.rc = rc
+        self.stdout = stdout
+        self.stderr = stderr
+        self.root = None
+
+        if rc == 0:
+            try:
+                self.root = xml.fromstring(stdout)
+            except XmlParseError:
+                # not xml, might be a known error message
+                if COROSYNC_CONNECTION_FAILURE not in stdout:
+                    console_log.warning("Bad xml from crm_mon: %s" % stdout)
+
+    @classmethod
+    def read(cls):
+        try:
+            result = AgentShell.run(cls.COMMAND)
+        except OSError as e:
+            # ENOENT is fine here.  Pacemaker might not be installed yet.
+            if e.errno != errno.ENOENT:
+                raise
+            return cls(None, '', str(e))
+
+        return cls(result.rc, result.stdout, result.stderr)
+
+    @property
+    def available(self):
+        return self.root is not None
+
+    @property
+    def last_update(self):
+        """The time crm_mon reports for the status, in UTC"""
+        tm_datetime = IMLDateTime.strptime(self.root.find('summary/last_update').get('time'), '%a %b %d %H:%M:%S %Y')
+        return IMLDateTime.convert_datetime_to_utc(tm_datetime)
+
+    @property
+    def nodes(self):
+        """dict of node name to the attributes crm_mon reports for it"""
+        return dict((node.get('name'), node.attrib) for node in self.root.findall('nodes/node'))
+
+    @property
+    def options(self):
+        cluster_options = self.root.find('summary/cluster_options')
+
+        return {'stonith_enabled': cluster_options is not None and cluster_options.get('stonith-enabled') == 'true'}
+
+    @property
+    def has_dc(self):
+        current_dc = self.root.find('summary/current_dc')
+        return current_dc is not None and current_dc.get('present') == 'true'
+
+    def _target_resources(self):
+        # Resources may be nested in groups and clones, only Target resources are of interest
+        for resource in self.root.findall('resources//resource'):
+            if resource.get('resource_agent') == 'ocf::chroma:Target':
+                yield resource
+
+    @property
+    def resource_locations(self):
+        """dict of Target resource name to the node it is running on, or None if it is not running.
+
+        If there is no DC for the cluster yet nothing it says can be believed, so {} is returned.
+        """
+        if not self.has_dc:
+            return {}
+
+        locations = {}
+        for resource in self._target_resources():
+            node = resource.find('node')
+            locations[resource.get('id')] = node.get('name') if node is not None else None
+
+        return locations
+
+    def resource_failed(self, resource_name):
+        """True if the resource has failed, or is missing from the status, since then it cannot be seen to have started"""
+        resources = [resource for resource in self._target_resources() if resource.get('id') == resource_name]
+        return not resources or any(resource.get('failed') == 'true' for resource in resources)
+
+
+_crm_mon_lock = threading.Lock()
+_crm_mon_cache = {'bucket': None, 'status': None}
+
+
+def crm_mon_status(fresh = False):
+    """Return the CrmMonStatus for the current CRM_MON_CACHE_TIME interval, running crm_mon only for the
+    first caller in each interval.
+
+    :param fresh: Run crm_mon now regardless, for actions waiting on a change.  The result replaces the
+                  cached status so that other callers see it too.
+    """
+    with _crm_mon_lock:
+        bucket = int(time.time() // CRM_MON_CACHE_TIME)
+
+        if fresh or _crm_mon_cache['bucket'] != bucket:
+            _crm_mon_cache['status'] = CrmMonStatus.read()
+            _crm_mon_cache['bucket'] = bucket
+
+        return _crm_mon_cache['status']
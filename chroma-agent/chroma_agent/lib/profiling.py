@@ -0,0 +1,86 @@
+# Copyright (c) 2017 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a MIT-style
+# license that can be found in the LICENSE file.
+
+
+"""Low overhead timing of the agent's own work, reported with the node metrics so that the
+agent's overhead can be charted next to the server's CPU usage."""
+
+
+import os
+import resource
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+"""
+Categories of timings: polls of each device plugin, and subprocesses by command name
+"""
+PLUGIN = 'plugin'
+COMMAND = 'command'
+
+# Not exposed by the resource module before python 3.2, this is the value on Linux
+RUSAGE_THREAD = getattr(resource, 'RUSAGE_THREAD', 1)
+
+
+def _thread_cpu_time():
+    usage = resource.getrusage(RUSAGE_THREAD)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _children_cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class AgentProfile(object):
+    """Cumulative count, wall time and CPU time of each plugin poll and subprocess command.
+
+    CPU time for a plugin poll is that of the polling thread.  For a command it is the CPU time of
+    the agent's children reaped while it ran, so commands run at the same time by different threads
+    may each be charged for the others.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Map of (category, name) to [count, wall seconds, cpu seconds]
+        self._totals = defaultdict(lambda: [0, 0.0, 0.0])
+
+    def record(self, category, name, wall, cpu):
+        with self._lock:
+            totals = self._totals[(category, name)]
+            totals[0] += 1
+            totals[1] += wall
+            totals[2] += cpu
+
+    @contextmanager
+    def _timed(self, category, name, cpu_time):
+        wall_started, cpu_started = time.time(), cpu_time()
+        try:
+            yield
+        finally:
+            self.record(category, name, time.time() - wall_started, cpu_time() - cpu_started)
+
+    def plugin_poll(self, plugin_name):
+        """Context manager timing a poll of a device plugin"""
+        return self._timed(PLUGIN, plugin_name, _thread_cpu_time)
+
+    def command(self, arg_list):
+        """Context manager timing a subprocess, named after its executable"""
+        executable = arg_list.split()[0] if isinstance(arg_list, basestring) else arg_list[0]
+        return self._timed(COMMAND, os.path.basename(executable), _children_cpu_time)
+
+    def totals(self):
+        """Return {category: {name: {'count': n, 'wall_ms': n, 'cpu_ms': n}}}, as cumulative counters"""
+        result = defaultdict(dict)
+        with self._lock:
+            for (category, name), (count, wall, cpu) in self._totals.items():
+                result[category][name] = {'count': count,
+                                          'wall_ms': int(wall * 1000),
+                                          'cpu_ms': int(cpu * 1000)}
+
+        return dict(result)
+
+
+agent_profile = AgentProfile()
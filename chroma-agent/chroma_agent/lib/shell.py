@@ -10,6 +10,7 @@ import threading
 
 from iml_common.lib.shell import BaseShell
 from iml_common.lib.shell import set_shell
+from chroma_agent.lib.profiling import agent_profile
 
 console_log = logging.getLogger('console')
 
@@ -83,7 +84,8 @@ class AgentShell(BaseShell):
         using this function.
         """
 
-        result = super(AgentShell, cls).run(arg_list, console_log, cls.monitor_func)
+        with agent_profile.command(arg_list):
+            result = super(AgentShell, cls).run(arg_list, console_log, cls.monitor_func)
 
         cls.thread_state.save_result(arg_list, result)
 
@@ -2,6 +2,8 @@ import mock
 
 
 from chroma_agent.action_plugins import manage_targets
+from chroma_agent.lib.pacemaker import CrmMonStatus
+from iml_common.lib.agent_rpc import agent_error, agent_result
 from iml_common.test.command_capture_testcase import CommandCaptureTestCase, CommandCaptureCommand
 
 
@@ -40,3 +42,45 @@ class TestManagePacemaker(CommandCaptureTestCase):
         self.assertEqual(manage_targets._move_target(self.target_disk, self.target_node),
                          'Failed to move target %s to node %s' % (self.target_disk, self.target_node))
         self.assertRanAllCommandsInOrder()
+
+
+class TestStartTarget(CommandCaptureTestCase):
+    CRM_MON_XML = """<?xml version="1.0"?>
+<crm_mon version="1.1.15">
+  <summary>
+    <current_dc present="true" name="node1" id="1" with_quorum="true" />
+  </summary>
+  <resources>
+    %s
+  </resources>
+</crm_mon>"""
+    RESOURCE = """<resource id="MGS_424f74" resource_agent="ocf::chroma:Target" role="Started" failed="false">
+      <node name="node1" id="1" cached="false"/>
+    </resource>"""
+
+    def setUp(self):
+        super(TestStartTarget, self).setUp()
+
+        mock.patch('chroma_agent.action_plugins.manage_targets._wait_target').start()
+        self.crm_mon_status = mock.patch('chroma_agent.action_plugins.manage_targets.crm_mon_status').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _target_role(self, role):
+        return CommandCaptureCommand(('crm_resource', '-r', 'MGS_424f74', '-p', 'target-role', '-m', '-v', role))
+
+    def test_started(self):
+        self.crm_mon_status.return_value = CrmMonStatus(0, self.CRM_MON_XML % self.RESOURCE, '')
+        self.add_commands(self._target_role('Started'))
+
+        with mock.patch('chroma_agent.action_plugins.manage_targets.get_resource_location', return_value = 'node1'):
+            self.assertEqual(manage_targets.start_target('MGS_424f74'), agent_result('node1'))
+        self.assertRanAllCommandsInOrder()
+
+    def test_missing_resource_failed(self):
+        """Test that a resource crm_mon doesn't report is taken to have failed to start"""
+        self.crm_mon_status.return_value = CrmMonStatus(0, self.CRM_MON_XML % '', '')
+        for attempt in range(0, 4):
+            self.add_commands(self._target_role('Started'), self._target_role('Stopped'))
+
+        self.assertEqual(manage_targets.start_target('MGS_424f74'), agent_error('Failed to start target MGS_424f74'))
+        self.assertRanAllCommandsInOrder()
@@ -1,10 +1,10 @@
-from mock import patch
+from mock import patch, Mock
 
 from django.utils.unittest import TestCase
 from chroma_agent.plugin_manager import DevicePluginManager, ActionPluginManager
 from chroma_agent.lib.agent_teardown_functions import agent_daemon_teardown_functions
 from chroma_agent.lib.agent_startup_functions import agent_daemon_startup_functions
-from chroma_agent.action_plugins.device_plugin import initialise_block_device_drivers, terminate_block_device_drivers
+from chroma_agent.action_plugins.device_plugin import device_plugin, initialise_block_device_drivers, terminate_block_device_drivers
 
 
 class TestDevicePlugins(TestCase):
@@ -19,6 +19,16 @@ class TestDevicePlugins(TestCase):
             with patch.object(DevicePluginManager, '_plugins', {}):
                 self.assertTrue('linux' not in DevicePluginManager.get_plugins())
 
+    def test_device_plugin_teardown(self):
+        """Test that a plugin invoked once is torn down, even when its session fails."""
+        plugin_class = Mock()
+        plugin_class.return_value.start_session.side_effect = RuntimeError
+
+        with patch.object(DevicePluginManager, 'get_plugins', return_value = {'linux': plugin_class}):
+            self.assertRaises(RuntimeError, device_plugin, 'linux')
+
+        plugin_class.return_value.teardown.assert_called_once_with()
+
     def test_initialise_block_device_drivers_called_at_startup(self):
         """Test method is added to list of functions to run on daemon startup."""
         self.assertTrue(initialise_block_device_drivers in agent_daemon_startup_functions)
@@ -0,0 +1,78 @@
+"""Compare reading a large job_stats file with yaml.load against the streaming parser.
+
+The file is built by repeating the jobs in the 2.9.58_jobstats fixture under new job ids.
+
+    python -m tests.audit.benchmark_job_stats [jobs]
+"""
+
+import heapq
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+from tablib.packages import yaml
+
+from chroma_agent.device_plugins.audit.lustre import ObdfilterAudit, JOB_STATS_LIMIT
+
+FIXTURE = os.path.join(os.path.dirname(__file__), '..', 'data/lustre_versions/2.9.58_jobstats/oss',
+                       'proc/fs/lustre/obdfilter/lustre-OST0000/job_stats')
+
+
+def write_job_stats(path, jobs):
+    with open(FIXTURE) as f:
+        records = ['- ' + record for record in f.read().split('- ')[1:]]
+
+    with open(path, 'w') as f:
+        f.write("job_stats:\n")
+        for n in xrange(jobs):
+            record = records[n % len(records)]
+            f.write(re.sub(r'job_id:(\s+)\S+', r'job_id:\g<1>job.%d' % n, record))
+
+
+def read_job_stats_yaml(path):
+    """The job_stats reading as it was, loading the whole file with yaml"""
+    with open(path) as f:
+        stats = yaml.load(f)['job_stats'] or []
+
+    for stat in stats:
+        stat['read'] = stat.pop('read_bytes')
+        stat['write'] = stat.pop('write_bytes')
+
+    return heapq.nlargest(JOB_STATS_LIMIT, stats, key = lambda stat: stat['read']['sum'] + stat['write']['sum'])
+
+
+def timed(fn, *args):
+    t = time.time()
+    result = fn(*args)
+    return time.time() - t, result
+
+
+def main(jobs):
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'job_stats')
+        write_job_stats(path, jobs)
+        print "%d jobs, %d bytes" % (jobs, os.path.getsize(path))
+
+        elapsed, expected = timed(read_job_stats_yaml, path)
+        print "yaml.load:                 %.3f sec" % elapsed
+
+        audit = ObdfilterAudit()
+        audit._open_job_stats_file = lambda target_name: open(path)
+        elapsed, result = timed(audit.read_job_stats, 'OST0000')
+        print "streaming, first poll:     %.3f sec" % elapsed
+        assert [stat['job_id'] for stat in result] == [stat['job_id'] for stat in expected]
+
+        # Nothing has changed since the first poll so every job's counters are skipped
+        elapsed, result = timed(audit.read_job_stats, 'OST0000')
+        print "streaming, unchanged poll: %.3f sec" % elapsed
+        assert result == []
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
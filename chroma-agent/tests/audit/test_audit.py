@@ -34,6 +34,22 @@ class TestLocalAudit(PatchedContextTestCase):
         """LocalAudit.audit_classes() should return a list of classes."""
         self.assertEqual(self.audit.audit_classes(), [LnetAudit, MdtAudit, MgsAudit, NodeAudit])
 
+    def test_localaudit_audits_kept(self):
+        """LocalAudit.audits() should only look for audit classes again when the topology changes."""
+        audits = self.audit.audits()
+
+        with mock.patch('chroma_agent.device_plugins.audit.local_audit_classes') as local_audit_classes:
+            self.assertEqual(self.audit.audits(), audits)
+            self.assertFalse(local_audit_classes.called)
+
+            # A new device appears, the audits that remain available are kept
+            local_audit_classes.return_value = [LnetAudit, MdtAudit, NodeAudit]
+            topology = self.audit._read_topology()
+            topology[1].append(['obdfilter', 'testfs-OST0000'])
+            with mock.patch.object(self.audit, '_read_topology', return_value = topology):
+                self.assertEqual(self.audit.audits(), [audits[0], audits[1], audits[3]])
+                self.assertEqual(local_audit_classes.call_count, 1)
+
 
 class TestLocalAuditProperties(CommandCaptureTestCase):
     def setUp(self):
@@ -1,6 +1,7 @@
+import io
 import unittest
 import os
-from chroma_agent.device_plugins.audit.lustre import ObdfilterAudit
+from chroma_agent.device_plugins.audit.lustre import ObdfilterAudit, parse_job_stats
 
 from tests.test_utils import PatchedContextTestCase
 
@@ -17,6 +18,15 @@ class TestObdfilterAudit(PatchedContextTestCase):
     def test_audit_is_available(self):
         assert ObdfilterAudit.is_available()
 
+    def test_counters(self):
+        counters = self.audit.counters()
+
+        # Request counts and byte totals, not stats measured in other units such as get_page's usec
+        self.assertEqual(counters[('target', 'lustre-OST0000', 'create')], 519)
+        self.assertIn(('target', 'lustre-OST0000', 'write_bytes'), counters)
+        self.assertNotIn(('target', 'lustre-OST0000', 'get_page'), counters)
+        self.assertEqual(set(path[1] for path in counters), set(ost['name'] for ost in self.audit.devices() if ost['type'] == 'obdfilter'))
+
 
 class TestObdfilterAuditReadingJobStats(unittest.TestCase):
     """Test that reading job stats will work assuming stats proc file is normal
@@ -26,113 +36,126 @@ class TestObdfilterAuditReadingJobStats(unittest.TestCase):
 
     def setUp(self):
         self.audit = ObdfilterAudit()
-        self.initial_read_yam_file_func = self.audit._read_job_stats_yaml_file
 
-    def tearDown(self):
-        self.audit._read_yaml_file = self.initial_read_yam_file_func
+    def _job_stats(self, *jobs):
+        """Return a function to mock _open_job_stats_file, giving a job_stats file of (job_id, snapshot_time, write sum)"""
+        text = "job_stats:\n"
+        for job_id, snapshot_time, write_sum in jobs:
+            text += ("- job_id:          %s\n"
+                     "  snapshot_time:   %s\n"
+                     "  read_bytes:      { samples:           0, unit: bytes, min:       0, max:       0, sum:               0 }\n"
+                     "  write_bytes:     { samples:           1, unit: bytes, min:  %6s, max:  %6s, sum:  %14s }\n"
+                     "  punch:           { samples:           0, unit:  reqs }\n") % (job_id, snapshot_time, write_sum, write_sum, write_sum)
+        return lambda target_name: io.BytesIO(text)
 
     def test_snapshot_time(self):
         """If a stats file is available, can it be read, and is snapshot time controlling response"""
 
         #  simulate job stats turned off
-        self.audit._read_job_stats_yaml_file = lambda target_name: None
+        self.audit._open_job_stats_file = lambda target_name: None
         res = self.audit.read_job_stats('OST0000')
 
         self.assertEqual(res, [], res)
         self.assertEqual(self.audit.job_stat_last_snapshot_time, {}, self.audit.job_stat_last_snapshot_time)
 
         #  simulate job stats turned on, but has nothing to report, same return as off
-        self.audit._read_job_stats_yaml_file = lambda target_name: []
+        self.audit._open_job_stats_file = self._job_stats()
         res = self.audit.read_job_stats('OST0000')
         self.assertEqual(res, [], res)
         self.assertEqual(self.audit.job_stat_last_snapshot_time, {}, self.audit.job_stat_last_snapshot_time)
 
         #  This sample stats file output for next 2 tests
-        self.audit._read_job_stats_yaml_file = lambda target_name: [{'job_id': 16,
-                                                        'snapshot_time': 1416616379,
-                                                        'read_bytes': {'samples': 0,
-                                                                   'unit': 'bytes',
-                                                                    'min': 0,
-                                                                    'max': 0,
-                                                                    'sum': 0},
-                                                         'write_bytes': {'samples': 1,
-                                                                     'unit': 'bytes',
-                                                                     'min': 102400,
-                                                                     'max': 102400,
-                                                                     'sum': 102400}
-                                                        }]
+        self.audit._open_job_stats_file = self._job_stats((16, 1416616379, 102400))
 
         #  Test that the reading adds the record to the snapshot dict, and returns it
         res = self.audit.read_job_stats('OST0000')
-        self.assertEqual(self.audit.job_stat_last_snapshot_time, {16: 1416616379}, self.audit.job_stat_last_snapshot_time)
+        self.assertEqual(self.audit.job_stat_last_snapshot_time, {'OST0000': {16: 1416616379}}, self.audit.job_stat_last_snapshot_time)
         self.assertEqual(len(res), 1, res)
 
         # Second read, no change in proc file, so no change in snapshot dict (same value), and returning nothing
         res = self.audit.read_job_stats('OST0000')
         self.assertEqual(res, [], res)
-        self.assertEqual(self.audit.job_stat_last_snapshot_time, {16: 1416616379}, self.audit.job_stat_last_snapshot_time)
+        self.assertEqual(self.audit.job_stat_last_snapshot_time, {'OST0000': {16: 1416616379}}, self.audit.job_stat_last_snapshot_time)
 
         #  Simulate new job stats proc file was updated with new snapshot_time for job 16
-        self.audit._read_job_stats_yaml_file = lambda target_name: [{'job_id': 16,
-                                                         'snapshot_time': 1416616599,
-                                                         'read_bytes': {'samples': 0,
-                                                                   'unit': 'bytes',
-                                                                   'min': 0,
-                                                                   'max': 0,
-                                                                   'sum': 0},
-                                                         'write_bytes': {'samples': 1,
-                                                                    'unit': 'bytes',
-                                                                    'min': 102400,
-                                                                    'max': 102400,
-                                                                    'sum': 102400}
-                                                        }]
+        self.audit._open_job_stats_file = self._job_stats((16, 1416616599, 102400))
 
         #  Test that only one record is in the cache, the latest record, and that this new record is returned
         res = self.audit.read_job_stats('OST0000')
-        self.assertTrue({16: 1416616379} not in self.audit.job_stat_last_snapshot_time.items(), self.audit.job_stat_last_snapshot_time)
-        self.assertEqual(self.audit.job_stat_last_snapshot_time, {16: 1416616599}, self.audit.job_stat_last_snapshot_time)
+        self.assertTrue({16: 1416616379} not in self.audit.job_stat_last_snapshot_time['OST0000'].items(), self.audit.job_stat_last_snapshot_time)
+        self.assertEqual(self.audit.job_stat_last_snapshot_time, {'OST0000': {16: 1416616599}}, self.audit.job_stat_last_snapshot_time)
         self.assertEqual(len(res), 1, res)
         self.assertEqual(res[0]['snapshot_time'], 1416616599, res)
+        self.assertEqual(res[0]['write'], {'samples': 1, 'unit': 'bytes', 'min': 102400, 'max': 102400, 'sum': 102400}, res)
 
     def test_snapshot_time_autoclear(self):
         """Test that the cache holds only active jobs after a clear"""
 
-        self.audit._read_job_stats_yaml_file = lambda target_name: [{'job_id': 16,
-                                                         'snapshot_time': 1416616379,
-                                                         'read_bytes': {'samples': 0,
-                                                                   'unit': 'bytes',
-                                                                   'min': 0,
-                                                                   'max': 0,
-                                                                   'sum': 0},
-                                                         'write_bytes': {'samples': 1,
-                                                                    'unit': 'bytes',
-                                                                    'min': 102400,
-                                                                    'max': 102400,
-                                                                    'sum': 102400}
-                                                        }]
+        self.audit._open_job_stats_file = self._job_stats((16, 1416616379, 102400))
 
         #  Add this stat to the cache
         res = self.audit.read_job_stats('OST0000')
 
         #  Next stat shows a new job_id, and DOES NOT SHOW the old id 16.  This means 16 is no longer reporting
         #  This situation can happen in Lustre does an autoclear between these to samples, and 16 has nothing to report.
-        self.audit._read_job_stats_yaml_file = lambda target_name: [{'job_id': 17,
-                                                         'snapshot_time': 1416616399,
-                                                         'read_bytes': {'samples': 0,
-                                                                   'unit': 'bytes',
-                                                                   'min': 0,
-                                                                   'max': 0,
-                                                                   'sum': 0},
-                                                         'write_bytes': {'samples': 1,
-                                                                    'unit': 'bytes',
-                                                                    'min': 102400,
-                                                                    'max': 102400,
-                                                                    'sum': 102400}
-                                                        }]
+        self.audit._open_job_stats_file = self._job_stats((17, 1416616399, 102400))
 
         #  Test that the cache only have the job_id 17, and not 16 anymore, and that the return is only for 17.
         res = self.audit.read_job_stats('OST0000')
-        self.assertEqual(self.audit.job_stat_last_snapshot_time, {17: 1416616399}, self.audit.job_stat_last_snapshot_time)
+        self.assertEqual(self.audit.job_stat_last_snapshot_time, {'OST0000': {17: 1416616399}}, self.audit.job_stat_last_snapshot_time)
         self.assertEqual(len(res), 1, res)
         self.assertFalse(16 in (r['job_id'] for r in res), res)
         self.assertTrue(17 in (r['job_id'] for r in res), res)
+
+    def test_snapshot_time_per_target(self):
+        """Test that each target keeps its own cache, so reading one does not reset another"""
+
+        self.audit._open_job_stats_file = self._job_stats((16, 1416616379, 102400))
+
+        self.assertEqual(len(self.audit.read_job_stats('OST0000')), 1)
+        self.assertEqual(len(self.audit.read_job_stats('OST0001')), 1)
+
+        #  Neither file has changed since, so nothing is reported again for either target
+        self.assertEqual(self.audit.read_job_stats('OST0000'), [])
+        self.assertEqual(self.audit.read_job_stats('OST0001'), [])
+        self.assertEqual(self.audit.job_stat_last_snapshot_time, {'OST0000': {16: 1416616379},
+                                                                  'OST0001': {16: 1416616379}})
+
+    def test_top_jobs(self):
+        """Test that only the most active jobs are returned, most active first and in file order amongst equals"""
+
+        jobs = [('job%d' % n, 1416616379, n % 7) for n in range(50)]
+        self.audit._open_job_stats_file = self._job_stats(*jobs)
+
+        res = self.audit.read_job_stats('OST0000')
+        expected = sorted(jobs, key = lambda job: job[2], reverse = True)[:20]
+        self.assertEqual([r['job_id'] for r in res], [job[0] for job in expected])
+        self.assertEqual(len(self.audit.job_stat_last_snapshot_time['OST0000']), 50)
+
+
+class TestParseJobStats(unittest.TestCase):
+    def test_parse(self):
+        lines = ["job_stats:\n",
+                 "- job_id:          'dd.0'\n",
+                 "  snapshot_time:   1381939640\n",
+                 "  read_bytes:      { samples:         662, unit: bytes, min:  106496, max: 1048576, sum:       671088640 }\n",
+                 "  setattr:         { samples:           1, unit:  reqs }\n",
+                 "- job_id:          cp.0\n",
+                 "  snapshot_time:   1381939650\n",
+                 "  setattr:         { samples:           0, unit:  reqs }\n"]
+
+        self.assertEqual(list(parse_job_stats(lines)),
+                         [{'job_id': 'dd.0',
+                           'snapshot_time': 1381939640,
+                           'read_bytes': {'samples': 662, 'unit': 'bytes', 'min': 106496, 'max': 1048576, 'sum': 671088640},
+                           'setattr': {'samples': 1, 'unit': 'reqs'}},
+                          {'job_id': 'cp.0',
+                           'snapshot_time': 1381939650,
+                           'setattr': {'samples': 0, 'unit': 'reqs'}}])
+
+        #  Jobs which are not wanted are skipped
+        self.assertEqual([stat['job_id'] for stat in parse_job_stats(lines, lambda job_id, snapshot_time: job_id == 'cp.0')],
+                         ['cp.0'])
+
+    def test_empty(self):
+        self.assertEqual(list(parse_job_stats(["job_stats:\n"])), [])
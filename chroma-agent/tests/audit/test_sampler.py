@@ -0,0 +1,50 @@
+import mock
+from django.utils import unittest
+
+from chroma_agent.device_plugins.audit.sampler import CounterSampler, summarize
+
+
+class TestSummarize(unittest.TestCase):
+    def test_rates(self):
+        samples = [(100, {('lnet', 'send_count'): 0}),
+                   (101, {('lnet', 'send_count'): 10}),
+                   (103, {('lnet', 'send_count'): 50})]
+
+        self.assertEqual(summarize(samples), {('lnet', 'send_count'): {'count': 2, 'sum': 50, 'min': 10.0, 'max': 20.0}})
+
+    def test_reset(self):
+        """Test that an interval in which a counter went backwards is left out"""
+        samples = [(100, {'c': 100}),
+                   (101, {'c': 5}),
+                   (102, {'c': 10})]
+
+        self.assertEqual(summarize(samples), {'c': {'count': 1, 'sum': 5, 'min': 5.0, 'max': 5.0}})
+
+    def test_new_counter(self):
+        """Test that a counter only summarized once it has two samples, e.g. a newly mounted target"""
+        self.assertEqual(summarize([(100, {}), (101, {'c': 5})]), {})
+        self.assertEqual(summarize([(100, {'c': 5})]), {})
+
+
+class TestCounterSampler(unittest.TestCase):
+    def test_take(self):
+        values = iter([0, 10, 30, 60])
+        sampler = CounterSampler(lambda: {('target', 'OST0000', 'write_bytes'): next(values)}, 1, ring_size = 3)
+
+        for now in [100, 101, 102]:
+            with mock.patch('time.time', return_value = now):
+                sampler.sample()
+
+        self.assertEqual(sampler.take(), {'target': {'OST0000': {'write_bytes': {'count': 2, 'sum': 30, 'min': 10.0, 'max': 20.0}}}})
+
+        # The last sample starts the next interval
+        with mock.patch('time.time', return_value = 103):
+            sampler.sample()
+        self.assertEqual(sampler.take(), {'target': {'OST0000': {'write_bytes': {'count': 1, 'sum': 30, 'min': 30.0, 'max': 30.0}}}})
+        self.assertEqual(sampler.take(), {})
+
+    def test_read_failure(self):
+        sampler = CounterSampler(mock.Mock(side_effect = IOError()), 1)
+        sampler.sample()
+
+        self.assertEqual(sampler.take(), {})
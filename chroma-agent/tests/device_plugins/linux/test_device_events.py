@@ -0,0 +1,104 @@
+import mock
+from django.utils import unittest
+
+from chroma_agent.device_plugins.linux import LinuxDevicePlugin, QUICK_SCAN_INTERVAL
+from chroma_agent.device_plugins.linux_components.device_events import DeviceEvents, parse_udev_events, \
+    parse_zfs_events, BLOCK, DM, MD, ZFS
+
+
+class TestDeviceEventParsing(unittest.TestCase):
+    def test_udev_events(self):
+        lines = ["monitor will print the received events for:\n",
+                 "UDEV - the event which udev sends out after rule processing\n",
+                 "\n",
+                 "UDEV  [1048.571629] change   /devices/virtual/block/dm-0 (block)\n",
+                 "ACTION=change\n",
+                 "DEVNAME=/dev/dm-0\n",
+                 "DM_NAME=mpatha\n",
+                 "SUBSYSTEM=block\n",
+                 "\n",
+                 "UDEV  [1048.601234] add      /devices/virtual/block/md0 (block)\n",
+                 "ACTION=add\n",
+                 "DEVNAME=/dev/md0\n",
+                 "SUBSYSTEM=block\n",
+                 "\n",
+                 "UDEV  [1048.701234] add      /devices/virtual/block/zd0 (block)\n",
+                 "DEVNAME=/dev/zd0\n",
+                 "SUBSYSTEM=block\n",
+                 "\n",
+                 "UDEV  [1049.000001] add      /devices/pci0000:00/host2/target2:0:0/2:0:0:0/block/sdb (block)\n",
+                 "DEVNAME=/dev/sdb\n",
+                 "SUBSYSTEM=block\n",
+                 "\n"]
+
+        self.assertEqual(list(parse_udev_events(lines)), [DM, MD, ZFS, BLOCK])
+
+    def test_zfs_events(self):
+        lines = ["Oct 18 2017 10:00:00.123456789 sysevent.fs.zfs.pool_import\n", "\n"]
+
+        self.assertEqual(list(parse_zfs_events(lines)), [ZFS])
+
+    def test_take(self):
+        device_events = DeviceEvents()
+
+        with mock.patch('time.time', return_value = 100):
+            device_events._record(DM)
+        with mock.patch('time.time', return_value = 200):
+            device_events._record(MD)
+
+        # Events before the time given are dropped, and all are cleared once taken
+        self.assertEqual(device_events.take(150), set([MD]))
+        self.assertEqual(device_events.take(), set())
+
+
+class TestLinuxDevicePluginEvents(unittest.TestCase):
+    def setUp(self):
+        mock.patch('chroma_agent.device_plugins.linux.DeviceEvents').start()
+        self.addCleanup(mock.patch.stopall)
+
+        self.plugin = LinuxDevicePlugin(None)
+        self.plugin._device_events.watching = True
+        self.plugin._device_events.take.return_value = set()
+        self.plugin._quick_scan = mock.Mock(return_value = ['/dev/sda'])
+        self.plugin._full_scan = mock.Mock(return_value = {'devs': {}})
+
+    def test_initial_scan(self):
+        self.assertEqual(self.plugin._device_events.start.call_count, 0)
+        self.assertEqual(self.plugin.start_session(), {'devs': {}})
+        self.plugin._full_scan.assert_called_once_with(None)
+        self.plugin._device_events.start.assert_called_once_with()
+
+    def test_events(self):
+        """Test that only the subsystems with events are rescanned, without polling quick scans"""
+        self.plugin.start_session()
+        self.plugin._quick_scan.reset_mock()
+
+        self.assertEqual(self.plugin.update_session(), None)
+        self.assertEqual(self.plugin._quick_scan.call_count, 0)
+
+        self.plugin._device_events.take.return_value = set([MD])
+        self.assertEqual(self.plugin.update_session(), {'devs': {}})
+        self.plugin._full_scan.assert_called_with(set([MD]))
+
+    def test_quick_scan_safety_net(self):
+        """Test that changes missed by the device events are found by a periodic quick scan"""
+        self.plugin.start_session()
+        self.plugin._quick_scan.reset_mock()
+        self.plugin._quick_scan.return_value = ['/dev/sda', '/dev/sdb']
+
+        for poll in range(0, QUICK_SCAN_INTERVAL - 1):
+            self.assertEqual(self.plugin.update_session(), None)
+        self.assertEqual(self.plugin._quick_scan.call_count, 0)
+
+        self.assertEqual(self.plugin.update_session(), {'devs': {}})
+        self.assertEqual(self.plugin._quick_scan.call_count, 1)
+        self.plugin._full_scan.assert_called_with(None)
+
+    def test_not_watching(self):
+        """Test that without device events every poll makes a quick scan"""
+        self.plugin._device_events.watching = False
+        self.plugin.start_session()
+        self.plugin._quick_scan.reset_mock()
+
+        self.assertEqual(self.plugin.update_session(), None)
+        self.assertEqual(self.plugin._quick_scan.call_count, 1)
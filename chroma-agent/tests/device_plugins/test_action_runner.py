@@ -6,7 +6,8 @@ import mock
 from django.utils import unittest
 
 from chroma_agent.lib.shell import AgentShell
-from chroma_agent.device_plugins.action_runner import ActionRunnerPlugin, CallbackAfterResponse
+from chroma_agent.device_plugins.action_runner import ActionRunnerPlugin, CallbackAfterResponse, ActionExecutor, \
+    PRIORITY_HIGH, PRIORITY_LOW
 from chroma_agent.plugin_manager import ActionPluginManager, DevicePlugin
 from chroma_agent.agent_client import AgentDaemonContext
 
@@ -200,6 +201,7 @@ class TestActionRunnerPlugin(ActionRunnerPluginTestCase):
 
         id = self._run_action('action_one_no_context', {'arg1': 'arg1_test'})
         response = self._get_responses(1)[0]
+        self.assertEqual(response.pop('queue')['depth'], 0)
         self.assertDictEqual(response, {
             'type': 'ACTION_COMPLETE',
             'id': id,
@@ -255,6 +257,7 @@ class TestActionRunnerPlugin(ActionRunnerPluginTestCase):
 
         for action in xrange(0, actions):
             response = next(r for r in responses if r['id'] == ids[action])
+            self.assertIn('wait', response.pop('queue'))
 
             if action & 1:
                 self.assertDictEqual(response, {
@@ -327,6 +330,79 @@ class TestActionRunnerPluginCancellation(ActionRunnerPluginTestCase):
         # No messages should have been sent during cancellation
         self.assertEqual(self.mock_send_message_call_count, 0)
 
+    def test_cancel_queued(self):
+        """Test that cancelling an action which is still queued drops it without waiting for it to start"""
+        self.action_runner._executor = ActionExecutor(1, {})
+        running_id = self._run_action('action_three', {})
+        queued_id = self._run_action('action_three', {})
+        running = self.action_runner._running_actions[running_id]
+
+        self.action_runner.cancel(queued_id)
+        self.assertNotIn(queued_id, self.action_runner._running_actions)
+        self.assertEqual(self.action_runner._executor._queue, [])
+
+        self.action_runner.cancel(running_id)
+        running.join(2.0)
+        self.assertFalse(running.is_alive())
+        self.assertEqual(self.mock_send_message_call_count, 0)
+
+
+class TestActionExecutor(unittest.TestCase):
+    class Runner(object):
+        def __init__(self, ran, action):
+            self.ran = ran
+            self.action = action
+
+        def start(self):
+            self.ran.append(self)
+
+    def setUp(self):
+        self.ran = []
+        self.executor = ActionExecutor(2, {'cib': 1},
+                                       priorities = {'query': PRIORITY_HIGH, 'format': PRIORITY_LOW},
+                                       classes = {'configure_a': 'cib', 'configure_b': 'cib'})
+
+    def _put(self, action):
+        runner = self.Runner(self.ran, action)
+        self.executor.put(runner)
+        return runner
+
+    def test_workers_and_priority(self):
+        """Test that no more than the workers run at once, and queued actions start in priority order"""
+        first, second = self._put('other'), self._put('other')
+        self._put('format')
+        self._put('other')
+        self._put('query')
+        self.assertEqual(self.ran, [first, second])
+        self.assertEqual(len(self.executor._queue), 3)
+
+        self.executor.finished(first)
+        self.executor.finished(second)
+        self.assertEqual([runner.action for runner in self.ran[2:]], ['query', 'other'])
+        self.assertEqual(self.ran[2].queue_stats['depth'], 2)
+
+    def test_class_limit(self):
+        """Test that actions in a class are serialized while others carry on"""
+        configure_a = self._put('configure_a')
+        self._put('configure_b')
+        query = self._put('query')
+        self.assertEqual(self.ran, [configure_a, query])
+
+        self.executor.finished(query)
+        self.assertEqual(len(self.ran), 2)
+
+        self.executor.finished(configure_a)
+        self.assertEqual(self.ran[2].action, 'configure_b')
+
+    def test_withdraw(self):
+        self._put('other')
+        self._put('other')
+        queued = self._put('other')
+
+        self.assertTrue(self.executor.withdraw(queued))
+        self.assertFalse(self.executor.withdraw(queued))
+        self.assertEqual(self.executor._queue, [])
+
 
 class TestCallbackAfterResponse(ActionRunnerPluginTestCase):
     def _get_response_and_callback(self):
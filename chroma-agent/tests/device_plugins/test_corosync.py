@@ -11,7 +11,7 @@ from iml_common.lib.date_time import IMLDateTime
 log = logging.getLogger(__name__)
 
 ONLINE, OFFLINE = 'true', 'false'
-CMD = ('crm_mon', '--one-shot', '--as-xml')
+CMD = ('crm_mon', '--one-shot', '--inactive', '--as-xml')
 
 
 class TestCorosync(CommandCaptureTestCase):
@@ -22,6 +22,12 @@ class TestCorosync(CommandCaptureTestCase):
     If the host is up and corosync is down, the return {'ERROR': reason }
     """
 
+    def setUp(self):
+        super(TestCorosync, self).setUp()
+
+        mock.patch.dict('chroma_agent.lib.pacemaker._crm_mon_cache', {'bucket': None, 'status': None}).start()
+        self.addCleanup(mock.patch.stopall)
+
     def test_corosync_up(self):
         """Check that getting status of corosync works
 
@@ -41,7 +47,7 @@ class TestCorosync(CommandCaptureTestCase):
         feed_local_datetime = "Fri Jan 11 11:04:07 2013"  # PST  (UTC-8)
         feed_utc_datetime = "2013-01-11T19:04:07+00:00"   # UTC
 
-        # crm_mon --one-shot --as-xml
+        # crm_mon --one-shot --inactive --as-xml
         # Simulating running this command for output
         # that has two nodes one online one offline.
         crm_one_shot_xml = """<?xml version="1.0"?>
@@ -80,7 +86,7 @@ class TestCorosync(CommandCaptureTestCase):
             def now(cls, tz=None):
                 return cls.utcnow() + timedelta(hours=feed_tz)
 
-        mock.patch('chroma_agent.device_plugins.corosync.IMLDateTime', mock_imldatetime).start()
+        mock.patch('chroma_agent.lib.pacemaker.IMLDateTime', mock_imldatetime).start()
 
         plugin = CorosyncPlugin(None)
         result_dict = plugin.start_session()
@@ -10,11 +10,14 @@ from chroma_agent.device_plugins.lustre import LustrePlugin
 
 class MockLocalAudit():
     def metrics(self):
-        return {'metrics': TestLustreAudit.values['metrics']}
+        return {'raw': {'metrics': TestLustreAudit.values['metrics']}}
 
     def properties(self):
         return {'properties': TestLustreAudit.values['properties']}
 
+    def counters(self):
+        return {}
+
 
 class MockActionPluginManager():
     capabilities = 0
@@ -60,6 +63,7 @@ class TestLustreAudit(unittest.TestCase):
                    self.mock_scan_packages).start()
 
         self.lustre_plugin = LustrePlugin(None)
+        self.addCleanup(self.lustre_plugin.teardown)
 
     def test_audit_delta_match(self):
         delta_fields = ['capabilities', 'properties', 'mounts', 'packages', 'resource_locations']
@@ -70,6 +74,9 @@ class TestLustreAudit(unittest.TestCase):
         for key in result_all:
             if key in delta_fields:
                 self.assertEqual(result_none[key], None)
+            elif key == 'metrics':
+                # Metrics are delta encoded, nothing changed so no values are sent
+                self.assertEqual(result_none[key], {'delta': {'first': 1, 'keys': [], 'values': [], 'removed': []}})
             else:
                 # Time is a special case.
                 if key == 'started_at':
@@ -106,6 +113,52 @@ class TestLustreAudit(unittest.TestCase):
                 self.assertEqual(result_all[key], result_none[key])
 
 
+class TestMetricsEncoder(unittest.TestCase):
+    def test_encode(self):
+        encoder = lustre.MetricsEncoder()
+
+        result = encoder.encode({'target': {'OST0000': {'filesfree': 10, 'stats': {}}}, 'jobid_var': 'disable'})
+        self.assertEqual(result['delta']['seq'], 1)
+        self.assertEqual(result['delta']['first'], 0)
+        self.assertEqual(sorted(result['delta']['keys']), [('jobid_var',),
+                                                           ('target', 'OST0000', 'filesfree'),
+                                                           ('target', 'OST0000', 'stats')])
+        self.assertEqual(len(result['delta']['values']), 3)
+
+        # Only the changed leaf and the new key are sent, and the missing leaf is removed
+        result = encoder.encode({'target': {'OST0000': {'filesfree': 9, 'stats': {}}, 'OST0001': {'filesfree': 5}}})
+        keys = dict((path, index) for index, path in enumerate(sorted(encoder._keys, key = encoder._keys.get)))
+        self.assertEqual(result['delta']['seq'], 2)
+        self.assertEqual(result['delta']['first'], 3)
+        self.assertEqual(result['delta']['keys'], [('target', 'OST0001', 'filesfree')])
+        self.assertEqual(sorted(result['delta']['values']), [[keys[('target', 'OST0000', 'filesfree')], 9],
+                                                             [keys[('target', 'OST0001', 'filesfree')], 5]])
+        self.assertEqual(result['delta']['removed'], [keys[('jobid_var',)]])
+
+    def test_leaf_returns(self):
+        """Test that a leaf which goes missing and comes back is sent again under its key"""
+        encoder = lustre.MetricsEncoder()
+
+        encoder.encode({'filesfree': 10, 'rates': {'reqs': 1}})
+        result = encoder.encode({'filesfree': 10})
+        self.assertEqual(result['delta']['removed'], [encoder._keys[('rates', 'reqs')]])
+
+        result = encoder.encode({'filesfree': 10, 'rates': {'reqs': 1}})
+        self.assertEqual(result['delta']['keys'], [])
+        self.assertEqual(result['delta']['values'], [[encoder._keys[('rates', 'reqs')], 1]])
+        self.assertEqual(result['delta']['removed'], [])
+
+    def test_resync(self):
+        encoder = lustre.MetricsEncoder()
+
+        for x in range(0, LustrePlugin.FAILSAFEDUPDATE):
+            encoder.encode({'filesfree': 10})
+
+        result = encoder.encode({'filesfree': 10})
+        self.assertEqual(result, {'delta': {'seq': LustrePlugin.FAILSAFEDUPDATE + 1,
+                                            'first': 0, 'keys': [('filesfree',)], 'values': [[0, 10]], 'removed': []}})
+
+
 class TestLustreScanPackages(CommandCaptureTestCase):
     '''
     This is a very incomplete test of the scan packages. But is at least some test that I added, it ensures the expected
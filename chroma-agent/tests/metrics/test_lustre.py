@@ -215,7 +215,9 @@ dm_mod 75539 2 dm_mirror,dm_log, Live 0xffffffffa0000000
         audit = LocalAudit()
         # FIXME: this gethostname() should probably be stubbed out
         import socket
-        self.assertEqual(audit.metrics(), {'raw': {'node': {'hostname': socket.gethostname(), 'cpustats': {'iowait': 10892, 'idle': 3471279, 'total': 3540537, 'user': 24601, 'system': 33763}, 'meminfo': {'MemTotal': 3991680}}}})
+        metrics = audit.metrics()
+        self.assertIsInstance(metrics['raw']['node'].pop('agent'), dict)
+        self.assertEqual(metrics, {'raw': {'node': {'hostname': socket.gethostname(), 'cpustats': {'iowait': 10892, 'idle': 3471279, 'total': 3540537, 'user': 24601, 'system': 33763}, 'meminfo': {'MemTotal': 3991680}}}})
 
 
 class TestMdtMetrics(CommandCaptureTestCase, PatchedContextTestCase):
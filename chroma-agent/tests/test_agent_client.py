@@ -3,15 +3,54 @@ import time
 import json
 import datetime
 import mock
+import zlib
 
 from django.utils import unittest
 
-from chroma_agent.agent_client import HttpWriter, Message, HttpReader, SessionTable, HttpError
+from chroma_agent.agent_client import CryptoClient, HttpWriter, Message, HttpReader, SessionTable, HttpError
 from chroma_agent.log import daemon_log
 from chroma_agent.plugin_manager import PRIO_LOW, DevicePluginMessage, PRIO_NORMAL, PRIO_HIGH
 from iml_common.lib.date_time import IMLDateTime
 
 
+class TestCryptoClient(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('requests.request')
+        self.request = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.request.return_value.headers = {}
+        self.request.return_value.json.return_value = None
+
+        self.client = CryptoClient('https://manager/agent/message/', mock.Mock(certificate_file = None), 'test_server')
+
+    def test_compression(self):
+        """Test that bodies are only gzipped after the manager says it accepts them"""
+        body = json.dumps({'messages': ['x' * 2000]})
+
+        self.client.post_json(body)
+        self.assertEqual(self.request.call_args[1]['data'], body)
+        self.assertNotIn('Content-Encoding', self.request.call_args[1]['headers'])
+
+        self.request.return_value.headers = {'Accept-Encoding': 'gzip, deflate'}
+        self.client.post_json(body)
+        self.client.post_json(body)
+        self.assertEqual(self.request.call_args[1]['headers']['Content-Encoding'], 'gzip')
+        self.assertEqual(zlib.decompress(self.request.call_args[1]['data'], 16 + zlib.MAX_WBITS), body)
+
+        # Small bodies are not worth compressing
+        self.client.post_json('{}')
+        self.assertEqual(self.request.call_args[1]['data'], '{}')
+
+    def test_unsupported_compression(self):
+        """Test that compression is turned off if the manager rejects a compressed body"""
+        self.client._compress = True
+        self.request.return_value.ok = False
+        self.request.return_value.status_code = 415
+
+        self.assertRaises(HttpError, self.client.post_json, json.dumps({'messages': ['x' * 2000]}))
+        self.assertFalse(self.client._compress)
+
+
 class TestHttpWriter(unittest.TestCase):
     def test_message_callback(self):
         """Test that when a callback is included in a Message(), it is invoked
@@ -38,18 +77,18 @@ class TestHttpWriter(unittest.TestCase):
                 TIMEOUT = 2
                 i = 0
                 while True:
-                    if client.post.call_count and callback.call_count:
+                    if client.post_json.call_count and callback.call_count:
                         break
                     else:
                         time.sleep(1)
                         i += 1
                         if i > TIMEOUT:
-                            raise RuntimeError("Timeout waiting for .post() and callback (%s %s)" % (client.post.call_count, callback.call_count))
+                            raise RuntimeError("Timeout waiting for .post() and callback (%s %s)" % (client.post_json.call_count, callback.call_count))
 
                 # Should have sent back the result
-                self.assertEqual(client.post.call_count, 1)
-                self.assertDictEqual(client.post.call_args[0][0], {
-                    'messages': [message.dump(client._fqdn)],
+                self.assertEqual(client.post_json.call_count, 1)
+                self.assertDictEqual(json.loads(client.post_json.call_args[0][0]), {
+                    'messages': [json.loads(json.dumps(message.dump(client._fqdn)))],
                     'server_boot_time': client.boot_time.isoformat() + "Z",
                     'client_start_time': client.start_time.isoformat() + "Z"
                 })
@@ -86,8 +125,8 @@ class TestHttpWriter(unittest.TestCase):
 
         inject_messages()
         writer.send()
-        self.assertEqual(client.post.call_count, 1)
-        messages = client.post.call_args[0][0]['messages']
+        self.assertEqual(client.post_json.call_count, 1)
+        messages = json.loads(client.post_json.call_args[0][0])['messages']
 
         self.assertEqual(len(messages), 4)
         # First two messages (of equal priority) arrive in order or insertion
@@ -118,7 +157,7 @@ class TestHttpWriter(unittest.TestCase):
         client.device_plugins.get_plugins = mock.Mock(return_value={'test_plugin': TestPlugin})
         client.sessions = SessionTable(client)
 
-        client.post = mock.Mock(side_effect=HttpError())
+        client.post_json = mock.Mock(side_effect=HttpError())
 
         # Pick an arbitrary time to use as a base for simulated waits
         t_0 = datetime.datetime.now()
@@ -149,8 +188,8 @@ class TestHttpWriter(unittest.TestCase):
 
             # Send should consume the messages, and they go to nowhere because the POST fails
             writer.send()
-            client.post.assert_called_once()
-            self.assertEqual(len(client.post.call_args[0][0]['messages']), 1)
+            client.post_json.assert_called_once()
+            self.assertEqual(len(json.loads(client.post_json.call_args[0][0])['messages']), 1)
 
             # First time boundary: where the first repeat should happen
             from chroma_agent.agent_client import MIN_SESSION_BACKOFF
@@ -170,7 +209,7 @@ class TestHttpWriter(unittest.TestCase):
             # ==========================================
 
             # This time we'll let the message go through, and a session to begin.
-            client.post = mock.Mock()
+            client.post_json = mock.Mock()
             writer.send()
 
             # HttpReader receives a response from the manager, and should reset the backoff counters.
@@ -188,7 +227,7 @@ class TestHttpWriter(unittest.TestCase):
             # ===================================================
 
             # Break the POST link again
-            client.post = mock.Mock(side_effect=HttpError())
+            client.post_json = mock.Mock(side_effect=HttpError())
 
             # Poll will get a DATA message from initial_scan
             session.initial_scan = mock.Mock(return_value={'foo': 'bar'})
@@ -240,11 +279,11 @@ class TestHttpWriter(unittest.TestCase):
         writer = HttpWriter(client)
 
         def fake_post(envelope):
-            if len(json.dumps(envelope)) > MAX_BYTES_PER_POST:
+            if len(envelope) > MAX_BYTES_PER_POST:
                 daemon_log.info("fake_post(): rejecting oversized message")
                 raise HttpError()
 
-        client.post = mock.Mock(side_effect=fake_post)
+        client.post_json = mock.Mock(side_effect=fake_post)
         TestPlugin = mock.Mock()
 
         mock_plugin_instance = mock.Mock()
@@ -262,8 +301,8 @@ class TestHttpWriter(unittest.TestCase):
         # There should be one message to set up the session
         writer.poll('test_plugin')
         self.assertTrue(writer.send())
-        self.assertEqual(client.post.call_count, 1)
-        messages = client.post.call_args[0][0]['messages']
+        self.assertEqual(client.post_json.call_count, 1)
+        messages = json.loads(client.post_json.call_args[0][0])['messages']
         self.assertEqual(len(messages), 1)
         self.assertEqual(messages[0]['type'], "SESSION_CREATE_REQUEST")
         # Pretend we got a SESSION_CREATE_RESPONSE
@@ -278,27 +317,75 @@ class TestHttpWriter(unittest.TestCase):
 
         # Only the normal message should get through
         self.assertTrue(writer.send())
-        self.assertEqual(client.post.call_count, 2)
-        messages = client.post.call_args[0][0]['messages']
+        self.assertEqual(client.post_json.call_count, 2)
+        messages = json.loads(client.post_json.call_args[0][0])['messages']
         self.assertEqual(len(messages), 1)
         self.assertEqual(messages[0]['type'], "DATA")
 
         # The oversized message should be dropped and the session
         # terminated
         self.assertFalse(writer.send())
-        self.assertEqual(client.post.call_count, 3)
+        self.assertEqual(client.post_json.call_count, 3)
         self.assertEqual(len(client.sessions._sessions), 0)
 
         # However, we should eventually get a new session for the
         # offending plugin
         writer.poll('test_plugin')
         self.assertTrue(writer.send())
-        self.assertEqual(client.post.call_count, 4)
-        messages = client.post.call_args[0][0]['messages']
+        self.assertEqual(client.post_json.call_count, 4)
+        messages = json.loads(client.post_json.call_args[0][0])['messages']
         self.assertEqual(len(messages), 1)
         self.assertEqual(messages[0]['type'], "SESSION_CREATE_REQUEST")
 
 
+class TestSession(unittest.TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client._fqdn = "test_server"
+        self.client.boot_time = IMLDateTime.utcnow()
+        self.client.start_time = IMLDateTime.utcnow()
+        self.client.sessions = SessionTable(self.client)
+        self.plugin = mock.Mock()
+        self.client.device_plugins.get = mock.Mock(return_value = lambda session: self.plugin)
+
+        self.now = datetime.datetime(2017, 10, 18, 12, 0, 0)
+        mock.patch('chroma_agent.agent_client.datetime.datetime', mock.Mock(now = lambda: self.now)).start()
+        mock.patch('random.uniform', return_value = 1.0).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _polls_at(self, *seconds):
+        polled = []
+        start = self.now
+        for second in range(0, 60):
+            self.now = start + datetime.timedelta(seconds = second)
+            if self.client.sessions.get('test_plugin').poll() is not None:
+                polled.append(second)
+        self.assertEqual(polled[:len(seconds)], list(seconds))
+
+    def test_default_schedule(self):
+        """Test that without a schedule from the manager the session polls now and every POLL_PERIOD"""
+        self.client.sessions.create('test_plugin', 'id_foo', None)
+        self._polls_at(0, 10, 20)
+
+    def test_manager_schedule(self):
+        """Test that the session starts polling at the offset, at the period the manager gives"""
+        self.client.sessions.create('test_plugin', 'id_foo', {'poll_period': 15, 'poll_offset': 4})
+        self._polls_at(4, 19, 34)
+
+    def test_set_poll_periods(self):
+        """Test that poll periods in a POST response are applied to the sessions"""
+        self.client.sessions.create('test_plugin', 'id_foo', None)
+        self.client.sessions.get('test_plugin').poll()
+
+        writer = HttpWriter(self.client)
+        self.client.post_json = mock.Mock(return_value = {'poll_periods': {'test_plugin': 30, 'other_plugin': 30}})
+        writer.put(Message("SESSION_CREATE_REQUEST", "other_plugin"))
+        self.assertTrue(writer.send())
+
+        self.now += datetime.timedelta(seconds = 1)
+        self._polls_at(29, 59)
+
+
 class TestHttpReader(unittest.TestCase):
     def test_data_message(self):
         client = mock.Mock()
@@ -0,0 +1,83 @@
+import mock
+
+from chroma_agent.lib.pacemaker import crm_mon_status, CrmMonStatus
+from iml_common.test.command_capture_testcase import CommandCaptureTestCase, CommandCaptureCommand
+
+CRM_MON_XML = """<?xml version="1.0"?>
+<crm_mon version="1.1.15">
+  <summary>
+    <last_update time="Fri Jan 11 11:04:07 2013" />
+    <current_dc present="%s" name="node1" id="1" with_quorum="true" />
+    <cluster_options stonith-enabled="true" />
+  </summary>
+  <nodes>
+    <node name="node1" id="1" online="true" standby="false" />
+    <node name="node2" id="2" online="false" standby="false" />
+  </nodes>
+  <resources>
+    <resource id="st-fencing" resource_agent="stonith:fence_chroma" role="Started" failed="false">
+      <node name="node1" id="1" cached="false"/>
+    </resource>
+    <resource id="MGS_424f74" resource_agent="ocf::chroma:Target" role="Started" failed="false">
+      <node name="node1" id="1" cached="false"/>
+    </resource>
+    <group id="group-testfs" number_resources="1">
+      <resource id="testfs-OST0000_f8e7a6" resource_agent="ocf::chroma:Target" role="Stopped" failed="true" />
+    </group>
+  </resources>
+</crm_mon>"""
+
+CMD = tuple(CrmMonStatus.COMMAND)
+
+
+class TestCrmMonStatus(CommandCaptureTestCase):
+    def setUp(self):
+        super(TestCrmMonStatus, self).setUp()
+
+        mock.patch.dict('chroma_agent.lib.pacemaker._crm_mon_cache', {'bucket': None, 'status': None}).start()
+        self.time = mock.patch('time.time', return_value = 1000.0).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_parse(self):
+        status = CrmMonStatus(0, CRM_MON_XML % 'true', '')
+
+        self.assertEqual(sorted(status.nodes), ['node1', 'node2'])
+        self.assertEqual(status.nodes['node2']['online'], 'false')
+        self.assertEqual(status.options, {'stonith_enabled': True})
+        self.assertEqual(status.resource_locations, {'MGS_424f74': 'node1', 'testfs-OST0000_f8e7a6': None})
+        self.assertTrue(status.resource_failed('testfs-OST0000_f8e7a6'))
+        self.assertFalse(status.resource_failed('MGS_424f74'))
+        # A resource crm_mon doesn't report cannot be seen to have started
+        self.assertTrue(status.resource_failed('testfs-MDT0000_c3d2e1'))
+
+    def test_no_dc(self):
+        self.assertEqual(CrmMonStatus(0, CRM_MON_XML % 'false', '').resource_locations, {})
+
+    def test_shared_within_interval(self):
+        """Test that crm_mon runs once per interval, however many callers there are"""
+        self.add_commands(CommandCaptureCommand(CMD, stdout = CRM_MON_XML % 'true'))
+
+        first = crm_mon_status()
+        self.time.return_value = 1005.0
+        self.assertIs(crm_mon_status(), first)
+        self.assertEqual(self.commands_ran_count, 1)
+
+        self.time.return_value = 1010.0
+        self.assertIsNot(crm_mon_status(), first)
+        self.assertEqual(self.commands_ran_count, 2)
+
+    def test_fresh(self):
+        """Test that a fresh status runs crm_mon and replaces the cached one"""
+        self.add_commands(CommandCaptureCommand(CMD, stdout = CRM_MON_XML % 'true'))
+
+        crm_mon_status()
+        fresh = crm_mon_status(fresh = True)
+        self.assertIs(crm_mon_status(), fresh)
+        self.assertEqual(self.commands_ran_count, 2)
+
+    def test_error(self):
+        self.add_commands(CommandCaptureCommand(CMD, rc = 107, stderr = 'Connection refused'))
+
+        status = crm_mon_status()
+        self.assertFalse(status.available)
+        self.assertEqual((status.rc, status.stderr), (107, 'Connection refused'))
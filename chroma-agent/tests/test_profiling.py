@@ -0,0 +1,41 @@
+import mock
+from django.utils import unittest
+
+from chroma_agent.lib.profiling import AgentProfile, PLUGIN, COMMAND
+
+
+class TestAgentProfile(unittest.TestCase):
+    def setUp(self):
+        self.profile = AgentProfile()
+
+    def test_totals(self):
+        self.profile.record(PLUGIN, 'lustre', 0.5, 0.25)
+        self.profile.record(PLUGIN, 'lustre', 0.5, 0.25)
+        self.profile.record(COMMAND, 'crm_mon', 0.1, 0.05)
+
+        self.assertEqual(self.profile.totals(), {
+            PLUGIN: {'lustre': {'count': 2, 'wall_ms': 1000, 'cpu_ms': 500}},
+            COMMAND: {'crm_mon': {'count': 1, 'wall_ms': 100, 'cpu_ms': 50}}
+        })
+
+    def test_command(self):
+        """Test that commands are named after their executable, and timed even if they raise"""
+        with mock.patch('time.time', side_effect = [100.0, 102.0]):
+            with self.profile.command(['/usr/sbin/crm_mon', '-1']):
+                pass
+
+        with self.assertRaises(OSError):
+            with self.profile.command('zpool list -H'):
+                raise OSError()
+
+        totals = self.profile.totals()[COMMAND]
+        self.assertEqual(totals['crm_mon']['wall_ms'], 2000)
+        self.assertEqual(totals['zpool']['count'], 1)
+
+    def test_plugin_poll(self):
+        with self.profile.plugin_poll('linux'):
+            sum(range(0, 100000))
+
+        totals = self.profile.totals()[PLUGIN]['linux']
+        self.assertEqual(totals['count'], 1)
+        self.assertTrue(totals['cpu_ms'] >= 0)
@@ -0,0 +1,87 @@
+# Copyright (c) 2017 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a MIT-style
+# license that can be found in the LICENSE file.
+
+
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.test.simple import DjangoTestSuiteRunner
+from django.utils import dateparse
+from django.utils.timezone import utc
+
+from chroma_core.models import Stats
+from chroma_core.lib.util import chroma_settings
+from chroma_core.services.stats import StatsQueue
+from benchmark.generic import GenericBenchmark
+
+settings = chroma_settings()
+
+
+def legacy_insert(samples):
+    "Ingest path prior to epoch timestamps and COPY: string datetimes and multi-row INSERTs."
+    payload = json.loads(json.dumps([(id, str(dt), value) for id, dt, value in samples]))
+    Stats.insert((id, dateparse.parse_datetime(dt), value) for id, dt, value in payload)
+
+
+def copy_insert(samples):
+    "Current ingest path: epoch timestamps over the queue and rows streamed with COPY."
+    payload = json.loads(json.dumps(StatsQueue.encode(samples)))
+    Stats.insert(StatsQueue.decode(payload))
+
+
+class Benchmark(GenericBenchmark):
+    """Measure the stats service ingest rate, in rows per second, before and after COPY-based inserts.
+
+    Each step is one batch of a sample per series, as the stats service receives them from the queue.
+    """
+    MODES = ('before', legacy_insert, False), ('after', copy_insert, True)
+
+    def __init__(self, series=1000, steps=60, **kwargs):
+        self.series = series
+        self.steps = steps
+        self.test_runner = DjangoTestSuiteRunner()
+        self.prepare()
+
+    def prepare(self):
+        from south.management.commands import patch_for_test_db_setup
+
+        self.test_runner.setup_test_environment()
+        patch_for_test_db_setup()
+        self.old_db_config = self.test_runner.setup_databases()
+
+    def batches(self, start):
+        for step in xrange(self.steps):
+            dt = start + timedelta(seconds=Stats[0].step * step)
+            yield [(id, dt, random.random() * 1e6) for id in xrange(self.series)]
+
+    def rows(self):
+        return sum(model.objects.count() for model in Stats)
+
+    def run(self):
+        start = datetime.now(utc).replace(microsecond=0)
+        preserve_copy_insert = settings.STATS_COPY_INSERT
+        try:
+            for name, insert, copy in self.MODES:
+                Stats.delete_all()
+                for model in Stats:
+                    model.cache.clear()
+                settings.STATS_COPY_INSERT = copy
+                batches = list(self.batches(start))
+                elapsed = 0.0
+                for batch in batches:
+                    batch_start = time.time()
+                    insert(batch)
+                    elapsed += time.time() - batch_start
+                rows = self.rows()
+                print "%s: %d samples, %d rows in %.2f sec: %.0f samples/sec, %.0f rows/sec" % (
+                    name, self.series * self.steps, rows, elapsed, self.series * self.steps / elapsed, rows / elapsed)
+        finally:
+            settings.STATS_COPY_INSERT = preserve_copy_insert
+            Stats.delete_all()
+
+    def cleanup(self):
+        self.test_runner.teardown_databases(self.old_db_config)
+        self.test_runner.teardown_test_environment()
@@ -0,0 +1,110 @@
+# Copyright (c) 2017 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a MIT-style
+# license that can be found in the LICENSE file.
+
+
+import time
+from collections import deque
+
+from django.test.simple import DjangoTestSuiteRunner
+
+from chroma_core.models import StateLock
+from chroma_core.services.job_scheduler.command_plan import CommandPlan
+from chroma_core.services.job_scheduler.lock_cache import LockCache
+from benchmark.generic import GenericBenchmark
+
+
+class FakeJob(object):
+    "Stands in for a saved Job: the lock cache and dependency code only need an id."
+    def __init__(self, id):
+        self.id = id
+        self.wait_for_json = None
+
+
+class FakeItem(object):
+    "Stands in for a stateful object, hashed by identity like a model instance in the lock cache."
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+
+class Benchmark(GenericBenchmark):
+    """Measure the time the job scheduler spends on lock bookkeeping for a large estate.
+
+    Each job takes a write lock on one target and read locks on its host and filesystem, the
+    pattern of a target start/stop, and every tenth job write locks a host.  Jobs are scheduled as CommandPlan does (dependencies from
+    the lock cache, then the locks added) and the oldest jobs are completed as new ones arrive,
+    so the cache holds `pending` jobs' worth of locks throughout.
+    """
+
+    def __init__(self, targets=5000, hosts=500, filesystems=50, jobs=50000, pending=5000, **kwargs):
+        self.targets = [FakeItem("target%d" % i) for i in xrange(targets)]
+        self.hosts = [FakeItem("host%d" % i) for i in xrange(hosts)]
+        self.filesystems = [FakeItem("filesystem%d" % i) for i in xrange(filesystems)]
+        self.jobs = jobs
+        self.pending = pending
+        self.test_runner = DjangoTestSuiteRunner()
+        self.prepare()
+
+    def prepare(self):
+        from south.management.commands import patch_for_test_db_setup
+
+        self.test_runner.setup_test_environment()
+        patch_for_test_db_setup()
+        self.old_db_config = self.test_runner.setup_databases()
+
+    def locks(self, job):
+        n = job.id % len(self.targets)
+        if job.id % 10 == 0:
+            # Host jobs (e.g. LNet changes) write lock a host that many target jobs read lock
+            return [StateLock(job = job, locked_item = self.hosts[n % len(self.hosts)], write = True,
+                              begin_state = 'lnet_up', end_state = 'lnet_up')]
+        return [StateLock(job = job, locked_item = self.targets[n], write = True,
+                          begin_state = 'mounted', end_state = 'mounted'),
+                StateLock(job = job, locked_item = self.hosts[n % len(self.hosts)], write = False),
+                StateLock(job = job, locked_item = self.filesystems[n % len(self.filesystems)], write = False)]
+
+    def run(self):
+        # Only the bookkeeping is measured, not the long polling notifications made on each change
+        LockCache.lock_change_receivers = []
+        lock_cache = LockCache()
+        command_plan = CommandPlan(lock_cache, None)
+        pending = deque()
+        timings = dict.fromkeys(['dependencies', 'add', 'remove', 'write_by_item'], 0.0)
+
+        for id in xrange(1, self.jobs + 1):
+            job = FakeJob(id)
+            locks = self.locks(job)
+
+            t = time.time()
+            command_plan._create_dependencies(job, locks)
+            timings['dependencies'] += time.time() - t
+
+            t = time.time()
+            for lock in locks:
+                lock_cache.add(lock)
+            timings['add'] += time.time() - t
+
+            pending.append(job)
+            if len(pending) > self.pending:
+                t = time.time()
+                lock_cache.remove_job(pending.popleft())
+                timings['remove'] += time.time() - t
+
+            # get_transition_consequences takes a snapshot of all write locks for each command
+            if id % 1000 == 0:
+                t = time.time()
+                lock_cache.get_write_by_locked_item()
+                timings['write_by_item'] += time.time() - t
+
+        total = sum(timings.values())
+        for name, elapsed in sorted(timings.items()):
+            print "%s: %.2f sec" % (name, elapsed)
+        print "%d jobs, %d pending, %d targets: %.2f sec locking, %.0f jobs/sec" % (
+            self.jobs, self.pending, len(self.targets), total, self.jobs / total)
+
+    def cleanup(self):
+        self.test_runner.teardown_databases(self.old_db_config)
+        self.test_runner.teardown_test_environment()
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# Copyright (c) 2017 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a MIT-style
+# license that can be found in the LICENSE file.
+
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from benchmark.ingest import Benchmark
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+            make_option("--series", type=int, default=1000,
+                help="number of series per batch (default: 1000)"),
+            make_option("--steps", type=int, default=60,
+                help="number of 10 second batches to ingest (default: 60)"),
+    )
+    help = "Benchmark stats service ingest rows/sec with string timestamps and INSERT vs epoch timestamps and COPY"
+
+    def handle(self, *args, **kwargs):
+        bench = Benchmark(**kwargs)
+        bench.run()
+        bench.cleanup()
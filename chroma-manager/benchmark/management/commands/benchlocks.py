@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# Copyright (c) 2017 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a MIT-style
+# license that can be found in the LICENSE file.
+
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from benchmark.locks import Benchmark
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+            make_option("--targets", type=int, default=5000,
+                help="number of targets locked by jobs (default: 5000)"),
+            make_option("--hosts", type=int, default=500,
+                help="number of hosts read locked by jobs (default: 500)"),
+            make_option("--filesystems", type=int, default=50,
+                help="number of filesystems read locked by jobs (default: 50)"),
+            make_option("--jobs", type=int, default=50000,
+                help="number of jobs to schedule (default: 50000)"),
+            make_option("--pending", type=int, default=5000,
+                help="number of incomplete jobs holding locks at once (default: 5000)"),
+    )
+    help = "Benchmark job scheduler lock cache bookkeeping for a large number of targets"
+
+    def handle(self, *args, **kwargs):
+        bench = Benchmark(**kwargs)
+        bench.run()
+        bench.cleanup()
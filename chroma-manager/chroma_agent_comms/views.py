@@ -7,6 +7,7 @@ import Queue
 import json
 import traceback
 import time
+import zlib
 
 from django.db import transaction
 from django.http import HttpResponseNotAllowed, HttpResponse, HttpResponseBadRequest
@@ -42,6 +43,46 @@ def log_exception(f):
     return wrapped
 
 
+class UnsupportedEncoding(Exception):
+    pass
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+"""
+Largest decompressed request body accepted.  The HTTPS frontend only limits the compressed size,
+which a small body can inflate far beyond.
+"""
+MAX_DECODED_BODY_SIZE = 64 * 1024 * 1024
+
+
+def decoded_body(request):
+    "Return the body of a request, decompressing it according to its Content-Encoding."
+    encoding = request.META.get('HTTP_CONTENT_ENCODING', 'identity')
+    if encoding == 'identity':
+        return request.body
+    elif encoding == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+        decompressor = zlib.decompressobj()
+    else:
+        raise UnsupportedEncoding(encoding)
+
+    body = decompressor.decompress(request.body, MAX_DECODED_BODY_SIZE)
+    if decompressor.unconsumed_tail:
+        raise BodyTooLarge(MAX_DECODED_BODY_SIZE)
+    return body
+
+
+"""
+Request body encodings accepted by MessageView, advertised to agents in the Accept-Encoding header
+of its responses (RFC 7694) so that they know they can compress what they POST.
+"""
+ACCEPT_ENCODING = 'gzip, deflate'
+
+
 class ValidatedClientView(View):
     @classmethod
     def valid_fqdn(cls, request):
@@ -149,6 +190,7 @@ class MessageView(ValidatedClientView):
     queues = None
     sessions = None
     hosts = None
+    poll_schedule = None
 
     LONG_POLL_TIMEOUT = 30
 
@@ -159,11 +201,21 @@ class MessageView(ValidatedClientView):
         Handle a POST containing messages from the agent
         """
 
-        body = json.loads(request.body)
         fqdn = self.valid_fqdn(request)
         if not fqdn:
             return HttpForbidden()
 
+        try:
+            body = json.loads(decoded_body(request))
+        except UnsupportedEncoding as e:
+            response = HttpResponse(status = 415, content = "Unsupported Content-Encoding '%s'" % e)
+            response['Accept-Encoding'] = ACCEPT_ENCODING
+            return response
+        except BodyTooLarge as e:
+            return HttpResponse(status = 413, content = "Decompressed body exceeds %s bytes" % e)
+        except zlib.error as e:
+            return HttpResponseBadRequest("Bad compressed body: %s" % e)
+
         try:
             messages = body['messages']
         except KeyError:
@@ -177,10 +229,14 @@ class MessageView(ValidatedClientView):
                 return HttpResponseBadRequest("Incorrect client name")
 
         log.debug("MessageView.post: %s %s messages: %s" % (fqdn, len(messages), body))
+
+        # Sessions which have sent DATA, whose poll period may need changing
+        data_sessions = {}
+
         for message in messages:
             if message['type'] == 'DATA':
                 try:
-                    self.sessions.get(fqdn, message['plugin'], message['session_id'])
+                    data_sessions[message['plugin']] = self.sessions.get(fqdn, message['plugin'], message['session_id'])
                 except KeyError:
                     log.warning("Terminating session because unknown %s/%s/%s" % (fqdn, message['plugin'], message['session_id']))
                     self.queues.send({
@@ -213,16 +269,33 @@ class MessageView(ValidatedClientView):
                     'client_start_time': body['client_start_time']
                 })
 
+                schedule = self.poll_schedule.create(session.plugin)
+                session.poll_period = schedule['poll_period']
+
                 self.queues.send({
                     'fqdn': fqdn,
                     'type': 'SESSION_CREATE_RESPONSE',
                     'plugin': session.plugin,
                     'session_id': session.id,
                     'session_seq': None,
-                    'body': None
+                    'body': schedule
                 })
 
-        return HttpResponse()
+        # Tell the agent about any changes to the poll periods of the sessions it is
+        # sending data for, e.g. to slow it down while a plugin's RX queue is backed up.
+        poll_periods = {}
+        for plugin, session in data_sessions.items():
+            poll_period = self.poll_schedule.period(plugin)
+            if poll_period != session.poll_period:
+                log.info("Changing poll period of %s/%s/%s to %s" % (fqdn, plugin, session.id, poll_period))
+                session.poll_period = poll_periods[plugin] = poll_period
+
+        if poll_periods:
+            response = HttpResponse(json.dumps({'poll_periods': poll_periods}), mimetype = "application/json")
+        else:
+            response = HttpResponse()
+        response['Accept-Encoding'] = ACCEPT_ENCODING
+        return response
 
     def _filter_valid_messages(self, fqdn, messages):
         plugin_to_session_id = {}
@@ -316,7 +389,9 @@ class MessageView(ValidatedClientView):
         messages = self._filter_valid_messages(fqdn, messages)
 
         log.debug("MessageView.get: responding to %s with %s messages (%s)" % (fqdn, len(messages), client_start_time))
-        return HttpResponse(json.dumps({'messages': messages}), mimetype = "application/json")
+        response = HttpResponse(json.dumps({'messages': messages}), mimetype = "application/json")
+        response['Accept-Encoding'] = ACCEPT_ENCODING
+        return response
 
 
 def validate_token(key, credits=1):
@@ -7,7 +7,7 @@ import json
 from tastypie.exceptions import ImmediateHttpResponse
 from tastypie.http import HttpNotModified
 
-from chroma_core.services.job_scheduler.job_scheduler_client import JobSchedulerClient
+from chroma_core.lib.long_polling import long_polling
 from chroma_core.services import log_register
 
 import settings
@@ -38,9 +38,11 @@ class LongPollingAPI(object):
             else:
                 table_timestamps = json.loads(table_timestamps)
 
-            table_timestamps = JobSchedulerClient.wait_table_change(table_timestamps,
-                                                                    [table._meta.db_table for table in self.long_polling_tables],
-                                                                    settings.LONG_POLL_TIMEOUT_SECONDS)
+            # Wait in this process on the table changes broadcast by the job_scheduler
+            long_polling.subscribe_table_changes()
+            table_timestamps = long_polling.wait_table_change(table_timestamps,
+                                                              [table._meta.db_table for table in self.long_polling_tables],
+                                                              settings.LONG_POLL_TIMEOUT_SECONDS)
 
             if table_timestamps:
                 # We want the super of the thing that called us, because it might have other overloads
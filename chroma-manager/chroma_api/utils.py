@@ -8,7 +8,6 @@ import traceback
 import logging
 import itertools
 from chroma_core.models.jobs import SchedulingError
-import bisect
 from collections import namedtuple
 
 
@@ -184,12 +183,6 @@ class StatefulModelResource(CustomModelResource):
     def dehydrate_label(self, bundle):
         return bundle.obj.get_label()
 
-    def dehydrate_locks(self, bundle):
-        obj = bundle.obj
-        obj_key = ContentType.objects.get_for_model(obj.downcast()).natural_key()
-
-        return JobSchedulerClient.get_locks(obj_key, obj.id)
-
     def alter_detail_data_to_serialize(self, request, bundle):
         """Add post dehydrate data to a single bundle
 
@@ -228,11 +221,11 @@ class StatefulModelResource(CustomModelResource):
         return to_be_serialized['objects'][0]
 
     def alter_list_data_to_serialize(self, request, to_be_serialized):
-        """Post process available jobs and state transitions
+        """Post process available jobs, state transitions and locks
 
         This method is a TastyPie hook that is called after all fields
-        have been dehydrated.  The available_* methods are no longer
-        dehydrated one at a time.  Instead, they are all done in two batched
+        have been dehydrated.  The available_* methods and locks are no longer
+        dehydrated one at a time.  Instead, they are all done in three batched
         calls, and set in the return datastructure here.
 
         to_be_serialized is a list of TastyPie Bundles composing some
@@ -248,6 +241,7 @@ class StatefulModelResource(CustomModelResource):
 
         computed_transitions = JobSchedulerClient.available_transitions(batch)
         computed_jobs = JobSchedulerClient.available_jobs(batch)
+        computed_locks = JobSchedulerClient.get_locks(batch)
 
         #  decorate the transition lists with verbs
         #  and install in the bundle for return
@@ -266,6 +260,8 @@ class StatefulModelResource(CustomModelResource):
                                        key=lambda action: action['display_order'])
             bundle.data['available_actions'] = available_actions
 
+            bundle.data['locks'] = computed_locks[str(bundle.obj.id)]
+
         return to_be_serialized
 
     # PUT handler for accepting {'state': 'foo', 'dry_run': <true|false>}
@@ -502,16 +498,16 @@ class MetricResource:
         # Want an overall reduction into one series
         if reduce_fn not in ('sum', 'average'):
             raise NotImplementedError
-        datetimes = dict((obj_id, sorted(data)) for obj_id, data in results.items())
+        # Sweep forward through time, carrying each object's latest data over timestamps it doesn't have,
+        # and its earliest data back over those before it has any.
+        current = dict((obj_id, stats[min(stats)]) for obj_id, stats in results.items() if stats)
         result = {}
-        for dt in set(itertools.chain(*datetimes.values())):
+        for dt in sorted(set(itertools.chain(*results.values()))):
             result[dt] = counter = Counter.fromkeys(metrics, 0.0)
             for obj_id, stats in results.items():
-                data = stats.get(dt, {})
-                dts = datetimes[obj_id]
-                if dts and not data:  # Didn't have one for this exact timestamp, do we have one before?
-                    data = stats[dts[max(bisect.bisect(dts, dt) - 1, 0)]]
-                counter.update(data)
+                if stats.get(dt):
+                    current[obj_id] = stats[dt]
+                counter.update(current.get(obj_id, {}))
             if reduce_fn == 'average':
                 for name in counter:
                     counter[name] /= len(results)
@@ -530,9 +526,12 @@ class MetricResource:
             objs = self.obj_get_list(bundle=base_bundle, **self.remove_api_resource_names(kwargs))
         except Http404 as exc:
             raise custom_response(self, request, http.HttpNotFound, {'metrics': exc})
-        metrics = metrics or set(itertools.chain.from_iterable(MetricStore(obj).names for obj in objs))
+        metrics = metrics or MetricStore.names_many(objs)
 
-        result = dict((obj.id, self._fetch(MetricStore(obj), metrics, begin, end, job, max_points, num_points)) for obj in objs)
+        if job or not (begin and end):
+            result = dict((obj.id, self._fetch(MetricStore(obj), metrics, begin, end, job, max_points, num_points)) for obj in objs)
+        else:
+            result = MetricStore.fetch_many(objs, metrics, begin, end, max_points, num_points)
         if not reduce_fn:
             for obj_id, stats in result.items():
                 result[obj_id] = self._format(stats)
@@ -5,7 +5,6 @@
 
 import time
 import threading
-import sys
 from threading import Thread
 from collections import defaultdict
 
@@ -17,7 +16,7 @@ from django.db import transaction
 from chroma_core.lib import util
 from chroma_core.services.log import log_register
 
-is_job_scheduler = ('job_scheduler' in sys.argv)
+settings = util.chroma_settings()
 
 log = log_register(__name__.split('.')[-1])
 
@@ -26,27 +25,74 @@ log = log_register(__name__.split('.')[-1])
 operation_lock = threading.RLock()
 
 
-class DatabaseChangedThread(Thread):
-    def __init__(self, timestamp, tablenames):
-        super(DatabaseChangedThread, self).__init__()
-        self.timestamp = timestamp
-        self.tablenames = tablenames
-
-        log.debug('Starting DatabaseChangedThead for %s time %s' % (self.tablenames, self.timestamp))
+class TableChangePublisher(Thread):
+    """Publish the tables changed by this process to long polling clients.
+
+    Changes are merged over a window of LONG_POLL_COALESCE_SECONDS starting at the first change
+    after a publish, and each window is published as one fire and forget message, rather than
+    every commit being sent separately.  The timestamp published is that of the last change.
+    """
+
+    def __init__(self, window):
+        super(TableChangePublisher, self).__init__()
+        self.daemon = True
+        self._window = window
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        self._timestamp = 0
+        self._tablenames = set()
+
+    def add(self, timestamp, tablenames):
+        with self._lock:
+            self._timestamp = max(self._timestamp, timestamp)
+            self._tablenames.update(tablenames)
+            self._changed.set()
+
+    def take(self):
+        """Return the timestamp and tables of the changes since the last call, or None if there are none"""
+        with self._lock:
+            self._changed.clear()
+            if not self._tablenames:
+                return None
+
+            changes = (self._timestamp, list(self._tablenames))
+            self._timestamp = 0
+            self._tablenames = set()
+
+            return changes
+
+    def publish(self):
+        changes = self.take()
+        if changes:
+            log.debug('Publishing table changes %s time %s' % (changes[1], changes[0]))
+            import long_polling
+            long_polling.tables_changed(*changes)
 
     def run(self):
-        from chroma_core.services.job_scheduler.job_scheduler_client import JobSchedulerClient
-        JobSchedulerClient.tables_changed(self.timestamp, self.tablenames)
+        while True:
+            self._changed.wait()
+            time.sleep(self._window)
+            try:
+                self.publish()
+            except Exception as e:
+                log.error('Failed to publish table changes: %s' % e)
+
+
+# The publisher of this process, started by its first change
+_publisher = None
 
 
 def _propagate_table_change(table_names):
+    global _publisher
+
     timestamp = int(time.time() * util.SECONDSTOMICROSECONDS)
 
-    if is_job_scheduler:
-        import long_polling
-        long_polling.tables_changed(timestamp, table_names)
-    else:
-        DatabaseChangedThread(timestamp, table_names).start()
+    with operation_lock:
+        if _publisher is None:
+            _publisher = TableChangePublisher(settings.LONG_POLL_COALESCE_SECONDS)
+            _publisher.start()
+
+    _publisher.add(timestamp, table_names)
 
 
 _pending_table_changes = defaultdict(set)
@@ -12,6 +12,10 @@ from collections import defaultdict
 
 from chroma_core.lib import util
 from chroma_core.services.job_scheduler import lock_cache
+from chroma_core.services.queue import ServiceBroadcast
+from chroma_core.services.log import log_register
+
+log = log_register(__name__.split('.')[-1])
 
 # table_name: list events
 # When waiting for a table to change a semaphore is added to the list this is trigger when that table changes
@@ -24,13 +28,29 @@ timestamps = defaultdict(lambda: int(util.SECONDSTOMICROSECONDS * (time.time() -
 # Semaphore for operations
 operation_lock = threading.RLock()
 
+# The thread mirroring the job_scheduler's table changes into this process, see subscribe_table_changes
+_subscriber = None
+
+
+class TableChangeBroadcast(ServiceBroadcast):
+    name = 'table_changes'
+
 
 @lock_cache.lock_change_receiver()
 def lock_change_receiver(lock, add_remove):
-    tables_changed(int(time.time() * util.SECONDSTOMICROSECONDS), [lock.locked_item._meta.db_table])
+    # Lock changes come from the job scheduler while it holds its lock, so are published with the
+    # database changes of this process rather than waiting on the broker here.
+    from chroma_core.lib.long_polling import enable_long_polling
+    enable_long_polling._propagate_table_change([lock.locked_item._meta.db_table])
 
 
 def tables_changed(timestamp, tables):
+    """Record the change in this process and publish it to the long polling waiters in every other"""
+    _tables_changed(timestamp, tables)
+    TableChangeBroadcast().publish({'timestamp': timestamp, 'tables': tables})
+
+
+def _tables_changed(timestamp, tables):
     assert type(timestamp) == int
 
     with operation_lock:
@@ -82,3 +102,32 @@ def _table_timestamps(tables_list):
     table_timestamps['max_timestamp'] = max_timestamp
 
     return table_timestamps
+
+
+def _resync():
+    """Changes published while we were not subscribed are lost, so assume every table
+    changed just now: waiters wake and clients fetch once more rather than miss a change."""
+    now = int(time.time() * util.SECONDSTOMICROSECONDS)
+
+    with operation_lock:
+        timestamps.default_factory = lambda: now
+        _tables_changed(now, timestamps.keys())
+
+
+def subscribe_table_changes():
+    """Follow the table changes published by the job_scheduler so that wait_table_change
+    can be called in this process, rather than as an RPC holding a job_scheduler thread.
+
+    Safe to call repeatedly, the subscription is started once per process.
+    """
+    global _subscriber
+
+    with operation_lock:
+        if _subscriber is None:
+            broadcast = TableChangeBroadcast()
+            _subscriber = threading.Thread(target = broadcast.subscribe,
+                                           args = (lambda body: _tables_changed(body['timestamp'], body['tables']),),
+                                           kwargs = {'on_connect': _resync})
+            _subscriber.daemon = True
+            _subscriber.start()
+            log.info("Subscribed to table changes")
@@ -9,7 +9,9 @@ import collections
 from datetime import datetime
 from chroma_core.services import log_register
 from django.utils.timezone import utc
+from django.contrib.contenttypes.models import ContentType
 from chroma_core.models import Point, Series, Stats, ManagedHost, ManagedTarget, ManagedFilesystem
+from chroma_core.models.stats import Cache
 from chroma_core.lib.storage_plugin.api import statistics
 from chroma_core.lib import scheduler
 
@@ -31,7 +33,9 @@ class MetricStore(object):
     Base class for metric stores.
     """
     def __init__(self, measured_object):
-        self.measured_object = measured_object.downcast() if hasattr(measured_object, 'content_type') else measured_object
+        self.measured_object = self._downcast(measured_object)
+        # Series ids by name, resolved once for the life of this store
+        self.series_ids = Cache(None)
 
     @classmethod
     def new(cls, measured_object):
@@ -43,14 +47,30 @@ class MetricStore(object):
 
     def serialize(self, update):
         "Generate serialized samples (id, dt, value) from a timestamped update dict."
+        series_ids = self.series_ids
         for ts, data in update.items():
             dt = datetime.fromtimestamp(ts, utc)
             for name, item in data.items():
-                series = Series.get(self.measured_object, name, item['type'])
-                yield series.id, dt, item['value']
+                try:
+                    series_id = series_ids[name]
+                except KeyError:
+                    series_id = series_ids[name] = Series.get(self.measured_object, name, item['type']).id
+                yield series_id, dt, item['value']
+
+    def load_series_ids(self):
+        "Resolve the ids of all existing series in a single query."
+        self.series_ids.update(Series.filter(self.measured_object).values_list('name', 'id'))
+
+    @staticmethod
+    def rate_peaks(ds_name, summary):
+        """Return Gauge updates of the lowest and highest rates per second of a counter, from the summary of
+        the agent's samples of it between polls.  A single point per poll gives only the mean rate."""
+        return {ds_name + '_rate_min': {'value': summary['min'], 'type': 'Gauge'},
+                ds_name + '_rate_max': {'value': summary['max'], 'type': 'Gauge'}}
 
     def clear(self):
         "Remove all associated series."
+        self.series_ids.clear()
         for series in Series.filter(self.measured_object):
             series.delete()
             Stats.delete(series.id)
@@ -70,11 +90,55 @@ class MetricStore(object):
             minimum = 0.0 if series.type == 'Counter' else float('-inf')
             for point in Stats.select(series.id, begin, end, rate=series.type in ('Counter', 'Derive'), maxlen=max_points, fixed=num_points):
                 result[point.dt][series.name] = max(minimum, point.mean)
+        return self._complete(result, types, fetch_metrics)
+
+    @staticmethod
+    def _complete(result, types, fetch_metrics):
         # if absolute and derived values are mixed, the earliest value will be incomplete
         if result and types > set(['Gauge']) and len(result[min(result)]) < len(fetch_metrics):
             del result[min(result)]
         return dict(result)
 
+    @staticmethod
+    def _series_many(measured_objects, **kwargs):
+        "Return mapping of object ids to the series of many measured objects, in a single query."
+        objects = dict(((ContentType.objects.get_for_model(obj).id, obj.id), obj.id) for obj in measured_objects)
+        query = Series.objects.filter(content_type__in=set(ct for ct, id in objects), object_id__in=set(id for ct, id in objects), **kwargs)
+        series = collections.defaultdict(list)
+        for item in query:
+            if (item.content_type_id, item.object_id) in objects:
+                series[objects[item.content_type_id, item.object_id]].append(item)
+        return series
+
+    @classmethod
+    def names_many(cls, measured_objects):
+        "names of all available data series of many measured objects"
+        series = cls._series_many(map(cls._downcast, measured_objects), type__in=Series.DATA_TYPES)
+        return set(item.name for items in series.values() for item in items)
+
+    @classmethod
+    def fetch_many(cls, measured_objects, fetch_metrics, begin, end, max_points=float('inf'), num_points=0):
+        """Return mapping of object ids to fetch results for many measured objects.
+        All series are selected together at a single sample resolution, rather than a query per series.
+        """
+        measured_objects = map(cls._downcast, measured_objects)
+        series = dict((item.id, (obj_id, item)) for obj_id, items in cls._series_many(measured_objects, name__in=fetch_metrics).items() for item in items)
+        rates = set(id for id, (obj_id, item) in series.items() if item.type in ('Counter', 'Derive'))
+        end = Stats[0].floor(end)  # exclude points from a partial sample
+        results = dict((obj.id, collections.defaultdict(dict)) for obj in measured_objects)
+        types = collections.defaultdict(set)
+        for id, points in Stats.select_many(series, begin, end, rates, maxlen=max_points, fixed=num_points).items():
+            obj_id, item = series[id]
+            types[obj_id].add(item.type)
+            minimum = 0.0 if item.type == 'Counter' else float('-inf')
+            for point in points:
+                results[obj_id][point.dt][item.name] = max(minimum, point.mean)
+        return dict((obj_id, cls._complete(result, types[obj_id], fetch_metrics)) for obj_id, result in results.items())
+
+    @staticmethod
+    def _downcast(measured_object):
+        return measured_object.downcast() if hasattr(measured_object, 'content_type') else measured_object
+
     def fetch_last(self, fetch_metrics):
         "Return latest datetime and dict of field names and values."
         latest, data = datetime.fromtimestamp(0, utc), {}
@@ -180,6 +244,22 @@ class HostMetricStore(MetricStore):
         except KeyError:
             pass
 
+        for key, summary in metrics.get('lnet_rates', {}).items():
+            ds_name = "lnet_%s" % key
+            if ds_name in lnet_included:
+                update.update(self.rate_peaks(ds_name, summary))
+
+        # The agent's own overhead: cumulative count, wall and cpu milliseconds of each
+        # device plugin poll and each subprocess command, e.g. agent_command_crm_mon_cpu_ms
+        try:
+            for category, timings in metrics['agent'].items():
+                for name, values in timings.items():
+                    for key, value in values.items():
+                        update["agent_%s_%s_%s" % (category, name, key)] = {'value': value,
+                                                                            'type': 'Counter'}
+        except KeyError:
+            pass
+
         return list(MetricStore.serialize(self, {update_time: update}))
 
 
@@ -198,6 +278,7 @@ class TargetMetricStore(MetricStore):
         metrics.pop('brw_stats', None)  # ignore brw_stats
         job_stats = metrics.pop('job_stats', [])
         hsm_stats = metrics.pop('hsm', {})
+        rates = metrics.pop('rates', {})
         update = dict((key, {'value': metrics[key], 'type': 'Gauge'}) for key in metrics)
 
         for key in stats:
@@ -219,6 +300,9 @@ class TargetMetricStore(MetricStore):
                 update[ds_name] = {'value': stats[key]['count'],
                                    'type': 'Counter'}
 
+        for key in rates:
+            update.update(self.rate_peaks("stats_%s" % key, rates[key]))
+
         # Let's ignore this for now...  Way too ugh, have a vague idea that
         # this might make sense as a special Datasource type.  Another idea
         # is that we could deconstruct the histograms on the agent side and
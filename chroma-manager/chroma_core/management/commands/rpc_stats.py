@@ -0,0 +1,59 @@
+# Copyright (c) 2017 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a MIT-style
+# license that can be found in the LICENSE file.
+
+
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chroma_core.services.rpc import ServiceRpcInterface, RpcClientFactory, RpcTimeout
+
+PHASES = ['validate', 'queue', 'execute', 'respond', 'round_trip']
+
+
+class Command(BaseCommand):
+    args = "<rpc interface> [<rpc interface> ...]"
+    help = """Print the RPC timings of running services, by the name of their RPC interface,
+e.g. JobSchedulerRpc.  Methods are listed with the most total execution time first."""
+    option_list = BaseCommand.option_list + (
+        make_option('--json', action = 'store_true', dest = 'json', default = False,
+                    help = "print the raw statistics as JSON"),
+    )
+
+    def handle(self, *args, **options):
+        if not args:
+            raise CommandError("Specify at least one RPC interface, e.g. JobSchedulerRpc")
+
+        try:
+            for name in args:
+                # RPCs are routed by the name of the interface class, the methods are not needed
+                rpc = type(name, (ServiceRpcInterface,), {'methods': []})()
+                try:
+                    stats = rpc.get_rpc_stats(rpc_timeout = 10)
+                except RpcTimeout:
+                    raise CommandError("No response from %s, is its service running?" % name)
+
+                if options['json']:
+                    print json.dumps({name: stats}, indent = 2)
+                else:
+                    self._print(name, stats)
+        finally:
+            RpcClientFactory.shutdown_threads()
+
+    def _print(self, name, stats):
+        print "%s: %s" % (name, ", ".join("%s=%s" % item for item in sorted(stats['executor'].items())))
+        print "%-40s %-10s %8s %10s %10s %10s %10s %10s" % ('method', 'phase', 'count', 'mean ms', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms')
+
+        def execute_time(method):
+            return stats['methods'][method].get('execute', {}).get('total_ms', 0)
+
+        for method in sorted(stats['methods'], key = execute_time, reverse = True):
+            for phase in PHASES:
+                histogram = stats['methods'][method].get(phase)
+                if histogram:
+                    print "%-40s %-10s %8d %10.1f %10.1f %10.1f %10.1f %10.1f" % (
+                        method, phase, histogram['count'], histogram['mean_ms'], histogram['p50_ms'],
+                        histogram['p90_ms'], histogram['p99_ms'], histogram['max_ms'])
+        print
@@ -4,6 +4,8 @@
 
 
 import logging
+import threading
+import time
 
 from django.db import models
 from django.contrib.auth.models import User
@@ -15,6 +17,64 @@ from django.db import IntegrityError
 from chroma_core.models.sparse_model import SparseModel
 from chroma_core.models.utils import STR_TO_SEVERITY
 from chroma_core.lib.job import job_log
+from chroma_core.lib.util import chroma_settings
+
+settings = chroma_settings()
+
+
+class ActiveAlertIndex(object):
+    """The active alerts of the indexed alert classes, by (class name, alert item type id, alert item id).
+
+    Loaded with a single query when first used, kept current by AlertStateBase.high and low in this
+    process, and reloaded every ALERT_INDEX_LIFETIME seconds to pick up alerts raised or lowered
+    by other processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._alerts = None
+        self._loaded_at = 0
+
+    @staticmethod
+    def key(alert_class, alert_item):
+        # A DowncastMetaclass object knows its type, without loading its content_type
+        if hasattr(alert_item, 'content_type_id'):
+            item_type_id = alert_item.content_type_id
+        else:
+            item_type_id = ContentType.objects.get_for_model(alert_item).id
+
+        return alert_class.__name__, item_type_id, alert_item.pk
+
+    def _load(self):
+        names = [cls.__name__ for cls in AlertStateBase.subclasses() if cls.indexed]
+        self._alerts = dict(((alert.record_type, alert.alert_item_type_id, alert.alert_item_id), alert)
+                            for alert in AlertState.objects.filter(active = True, record_type__in = names))
+        self._loaded_at = time.time()
+
+    def get(self, alert_class, alert_item):
+        """Return the active alert of `alert_class` on `alert_item`, or None"""
+        with self._lock:
+            if self._alerts is None or time.time() - self._loaded_at > settings.ALERT_INDEX_LIFETIME:
+                self._load()
+
+            return self._alerts.get(self.key(alert_class, alert_item))
+
+    def add(self, alert_state):
+        with self._lock:
+            if self._alerts is not None:
+                self._alerts[(alert_state.record_type, alert_state.alert_item_type_id, alert_state.alert_item_id)] = alert_state
+
+    def remove(self, alert_state):
+        with self._lock:
+            if self._alerts is not None:
+                self._alerts.pop((alert_state.record_type, alert_state.alert_item_type_id, alert_state.alert_item_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._alerts = None
+
+
+active_alert_index = ActiveAlertIndex()
 
 
 class AlertStateBase(SparseModel):
@@ -68,6 +128,10 @@ class AlertStateBase(SparseModel):
     # Subclasses set this, used as a default in .notify()
     default_severity = logging.INFO
 
+    # Subclasses notified on every report from a service, and only raised and lowered through notify, set
+    # this so that their active alerts are looked up in the active_alert_index rather than queried.
+    indexed = False
+
     # For historical compatibility anything called Alert will send and alert email and anything else won't.
     # This can obviously be overridden by any particular event but gives us a like for behaviour.
     @property
@@ -203,7 +267,12 @@ class AlertStateBase(SparseModel):
         attrs_to_save = cls._get_attrs_to_save(kwargs)
 
         try:
-            alert_state = cls.filter_by_item(alert_item).get(**kwargs)
+            if cls.indexed and not kwargs:
+                alert_state = active_alert_index.get(cls, alert_item)
+                if alert_state is None:
+                    raise cls.DoesNotExist()
+            else:
+                alert_state = cls.filter_by_item(alert_item).get(**kwargs)
         except cls.DoesNotExist:
             kwargs.update(attrs_to_save)
 
@@ -219,6 +288,8 @@ class AlertStateBase(SparseModel):
             try:
                 alert_state._message = alert_state.alert_message()
                 alert_state.save()
+                if cls.indexed:
+                    active_alert_index.add(alert_state)
                 job_log.info("AlertState: Raised %s on %s "
                              "at severity %s" % (cls,
                                                  alert_state.alert_item,
@@ -228,6 +299,8 @@ class AlertStateBase(SparseModel):
                 # Handle colliding inserts: drop out here, no need to update
                 # the .end of the existing record as we are logically concurrent
                 # with the creator.
+                if cls.indexed:
+                    active_alert_index.clear()
                 return None
         return alert_state
 
@@ -239,11 +312,17 @@ class AlertStateBase(SparseModel):
         # currently, no attrs are saved when an attr is lowered, so just filter them out of kwargs
         cls._get_attrs_to_save(kwargs)
 
+        # Nothing to lower if the index has no active alert, otherwise read it afresh to lower it
+        if cls.indexed and not kwargs and active_alert_index.get(cls, alert_item) is None:
+            return None
+
         try:
             alert_state = cls.filter_by_item(alert_item).get(**kwargs)
             alert_state.end = end_time
             alert_state.active = None
             alert_state.save()
+            if cls.indexed:
+                active_alert_index.remove(alert_state)
 
             # We optionally emit an event when alerts are lowered: we don't do that
             # for the beginning because that is implicit in the alert itself, whereas
@@ -83,6 +83,7 @@ class CorosyncNoPeersAlert(AlertStateBase):
     # This is worse than INFO because it *could* indicate that
     # networking is misconfigured..
     default_severity = logging.WARNING
+    indexed = True
 
     def alert_message(self):
         return "Host %s no failover peers" % self.alert_item.host
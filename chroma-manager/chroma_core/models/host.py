@@ -1685,6 +1685,7 @@ class HostContactAlert(AlertStateBase):
     # * Host can be offline entirely but filesystem remains available
     #   if failover servers are available.
     default_severity = logging.WARNING
+    indexed = True
 
     class Meta:
         app_label = 'chroma_core'
@@ -1720,6 +1721,7 @@ class HostOfflineAlert(AlertStateBase):
     # * Host can be offline but filesystem remains available
     #   if failover servers are available.
     default_severity = logging.WARNING
+    indexed = True
 
     class Meta:
         app_label = 'chroma_core'
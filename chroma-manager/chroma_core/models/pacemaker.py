@@ -68,6 +68,7 @@ class PacemakerConfiguration(DeletableStatefulObject):
 
 class StonithNotEnabledAlert(AlertStateBase):
     default_severity = logging.ERROR
+    indexed = True
 
     class Meta:
         app_label = 'chroma_core'
@@ -3,13 +3,15 @@
 # license that can be found in the LICENSE file.
 
 
+import array
 import itertools
 import collections
 import calendar
 import operator
-import functools
+import cStringIO
 from datetime import datetime, timedelta
-from django.db import models
+import psycopg2
+from django.db import models, connection, transaction, IntegrityError
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes import generic
 from django.utils.timezone import utc
@@ -72,6 +74,16 @@ epoch = datetime.fromtimestamp(0, utc)
 Point.zero = Point(epoch, 0.0, 0)
 
 
+def microseconds(dt):
+    "Return utc timestamp in microseconds from datetime."
+    return timestamp(dt) * 10 ** 6 + dt.microsecond
+
+
+def from_microseconds(us):
+    "Return utc datetime from timestamp in microseconds."
+    return epoch + timedelta(microseconds=us)
+
+
 class Cache(collections.defaultdict):
     "Simple cache of limited size;  doesn't need to be LRU yet."
     SIZE = 1e5
@@ -82,6 +94,121 @@ class Cache(collections.defaultdict):
             self.clear()
 
 
+class Rings(object):
+    """Preallocated, array-backed rings of the most recent points of many series.
+
+    Points are stored column-wise (microsecond timestamps, sums and lens) in ``maxlen`` slots per series,
+    and rows are looked up by series id.  Rows are evicted least recently used once the memory budget is full.
+    """
+    CODES = 'l', 'd', 'l'  # column typecodes: timestamp in microseconds, sum, len
+
+    def __init__(self, maxlen, budget):
+        self.maxlen = maxlen
+        self.capacity = max(1, int(budget // (maxlen * sum(array.array(code).itemsize for code in self.CODES))))
+        self.columns = [array.array(code) for code in self.CODES]
+        self.heads, self.counts = array.array('l'), array.array('l')
+        self.clear()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, id):
+        return id in self.rows
+
+    def clear(self):
+        self.rows = collections.OrderedDict()  # series id -> row, least recently used first
+        self.free = range(len(self.heads))
+
+    def _grow(self):
+        "Preallocate another chunk of rows, doubling the allocation up to capacity."
+        allocated = len(self.heads)
+        size = min(self.capacity - allocated, max(allocated, 64))
+        for column in self.columns:
+            column.extend(array.array(column.typecode, [0]) * (size * self.maxlen))
+        self.heads.extend(array.array('l', [0]) * size)
+        self.counts.extend(array.array('l', [0]) * size)
+        self.free.extend(xrange(allocated + size - 1, allocated - 1, -1))
+
+    def _get(self, id):
+        "Return row of a resident series and mark it as recently used, or None."
+        row = self.rows.pop(id, None)
+        if row is not None:
+            self.rows[id] = row
+        return row
+
+    def _allocate(self, id):
+        "Return an empty row for a series, evicting the least recently used series if necessary."
+        if not self.free and len(self.heads) < self.capacity:
+            self._grow()
+        row = self.free.pop() if self.free else self.rows.popitem(last=False)[1]
+        self.heads[row] = self.counts[row] = 0
+        self.rows[id] = row
+        return row
+
+    def _ordered(self, column, row):
+        "Return a column's values for a row, oldest first."
+        base, head = row * self.maxlen, self.heads[row]
+        if self.counts[row] < self.maxlen:
+            return column[base:base + head]
+        return column[base + head:base + self.maxlen] + column[base:base + head]
+
+    def prime(self, id, point=None):
+        "Make a series resident, optionally with its most recent point."
+        row = self._get(id)
+        if row is None:
+            row = self._allocate(id)
+        if point is not None and not self.counts[row]:
+            self.extend(id, [point])
+
+    def extend(self, id, points):
+        "Append sorted points to a series, overwriting its oldest points."
+        row = self._get(id)
+        if row is None:
+            row = self._allocate(id)
+        us, sums, lens = self.columns
+        base, head, count = row * self.maxlen, self.heads[row], self.counts[row]
+        for point in points[-self.maxlen:]:
+            index = base + head
+            us[index], sums[index], lens[index] = microseconds(point.dt), point.sum, point.len
+            head = (head + 1) % self.maxlen
+            count += 1
+        self.heads[row], self.counts[row] = head, min(count, self.maxlen)
+
+    def latest(self, id):
+        "Return most recent point of a resident series, Point.zero if it has none, or None if it isn't resident."
+        row = self._get(id)
+        if row is None:
+            return None
+        if not self.counts[row]:
+            return Point.zero
+        index = row * self.maxlen + (self.heads[row] - 1) % self.maxlen
+        us, sums, lens = self.columns
+        return Point(from_microseconds(us[index]), sums[index], lens[index])
+
+    def rollup(self, id, start, stop, step):
+        """Return points within [start, stop) grouped and summed by step seconds,
+        or None if the series' resident points don't cover the interval.
+        """
+        row = self._get(id)
+        if row is None or not self.counts[row]:
+            return None
+        start, stop, width = microseconds(start), microseconds(stop), step * 10 ** 6
+        stamps, sums, lens = (self._ordered(column, row) for column in self.columns)
+        if start < stamps[0] or stop > stamps[-1]:
+            return None
+        floors, totals = [], []
+        for us, value, count in itertools.izip(stamps, sums, lens):
+            if start <= us < stop and count:
+                floor = us - us % width
+                if floors and floors[-1] == floor:
+                    totals[-1][0] += value
+                    totals[-1][1] += count
+                else:
+                    floors.append(floor)
+                    totals.append([value, count])
+        return [Point(from_microseconds(floor), *total) for floor, total in zip(floors, totals)]
+
+
 class Series(models.Model):
     """Sources and their associated fields.
     Leverages the ContentTypes framework to allow series to be associated with other apps' models.
@@ -125,7 +252,7 @@ class Series(models.Model):
 class Sample(models.Model):
     """Abstract model for Sample tables.
     Only used for query generation.
-    Subclasses require 'step', 'expiration_time', and 'cache' attributes.
+    Subclasses require 'step', 'expiration_time', and 'cache' (Rings) attributes.
     """
     id = models.IntegerField(primary_key=True)  # for django only, not really the primary key
     dt = models.DateTimeField(db_index=True)
@@ -139,7 +266,20 @@ class Sample(models.Model):
     @classmethod
     def latest(cls, id):
         "Return most recent data point for series."
-        return (cls.cache[id] or list(cls.select(id, order_by='-dt', limit=1)) or [Point.zero])[-1]
+        point = cls.cache.latest(id)
+        if point is None:
+            point = (list(cls.select(id, order_by='-dt', limit=1)) or [Point.zero])[-1]
+        return point
+
+    @classmethod
+    def prime(cls, ids):
+        "Cache most recent data points for series which aren't resident, in a single query."
+        ids = [id for id in ids if id not in cls.cache]
+        if ids:
+            query = cls.objects.filter(id__in=ids).order_by('id', '-dt').distinct('id')
+            latest = dict((row[0], Point(*row[1:])) for row in query.values_list('id', *Point._fields))
+            for id in ids:
+                cls.cache.prime(id, latest.get(id))
 
     @classmethod
     def start(cls, id):
@@ -166,13 +306,29 @@ class Sample(models.Model):
         query = cls.objects.filter(id=id, **filters).order_by(order_by)[:limit]
         return itertools.starmap(Point, query.values_list(*Point._fields))
 
+    @classmethod
+    def copy(cls, stats):
+        "Bulk insert mapping of series ids to points by streaming rows with COPY in a single round trip."
+        rows = cStringIO.StringIO()
+        for id in stats:
+            for dt, value, count in stats[id]:
+                rows.write('{0:d}\t{1}\t{2!r}\t{3:d}\n'.format(id, dt.isoformat(), float(value), count))
+        rows.seek(0)
+        try:
+            connection.cursor().copy_from(rows, cls._meta.db_table, columns=('id',) + Point._fields)
+        except psycopg2.IntegrityError as error:  # raw cursor errors aren't translated by django
+            raise IntegrityError(*error.args)
+        transaction.commit_unless_managed()
+
     @classmethod
     def insert(cls, stats):
         "Bulk insert mapping of series ids to points."
-        if stats:
+        if stats and settings.STATS_COPY_INSERT:
+            cls.copy(stats)
+        elif stats:
             cls.objects.bulk_create(cls(id, *point) for id in stats for point in stats[id])
         for id in stats:
-            cls.cache[id] += sorted(stats[id])
+            cls.cache.extend(id, sorted(stats[id]))
 
     @classmethod
     def delete(cls, **filters):
@@ -200,7 +356,7 @@ class Stats(list):
     def __init__(self, samples):
         maxlen = max(map(div_samplerate, samples[1:], samples[:-1]))
         for sample in samples:
-            cache = Cache(functools.partial(collections.deque, maxlen=maxlen))
+            cache = Rings(maxlen, settings.STATS_CACHE_MEMORY)
             namespace = {'__module__': 'chroma_core.models',
                          'step': sample.sample_rate,
                          'expiration_time': sample.expiration_time,
@@ -211,11 +367,16 @@ class Stats(list):
 
     def insert(self, samples):
         "Bulk insert new samples (id, dt, value).  Skip and return outdated samples."
-        # keep stats as Points grouped by id
-        outdated, stats = [], collections.defaultdict(list)
+        samples = list(samples)
+        ids = set(id for id, dt, value in samples)
+        for model in self:
+            model.prime(ids)
+        # keep stats as Points grouped by id, skipping duplicates from batched messages
+        outdated, stats, seen = [], collections.defaultdict(list), set()
         for id, dt, value in samples:
-            if dt > self[0].latest(id).dt:
+            if dt > self[0].latest(id).dt and (id, dt) not in seen:
                 stats[id].append(Point(dt, value, 1))
+                seen.add((id, dt))
             else:
                 outdated.append((id, dt, value))
         # insert stats into first Sample and check the rest
@@ -225,14 +386,11 @@ class Stats(list):
             for id in list(stats):
                 start = model.latest(id).dt + step
                 stop = model.floor(max(stats.pop(id)).dt)
-                cache = previous.cache[id]
                 # aggregate from previous Sample as necessary
                 if start < stop:
-                    if cache and start >= cache[0].dt and stop <= cache[-1].dt:  # use cache if full
-                        points = (point for point in cache if start <= point.dt < stop and point.len)
-                    else:
-                        points = previous.select(id, dt__gte=start, dt__lt=stop)
-                    points = list(model.reduce(points))
+                    points = previous.cache.rollup(id, start, stop, model.step)  # use cache if full
+                    if points is None:
+                        points = list(model.reduce(previous.select(id, dt__gte=start, dt__lt=stop)))
                     if points:
                         stats[id] = points
             previous.expire(stats)
@@ -251,7 +409,29 @@ class Stats(list):
             if start >= model.start(id) and model.step >= minstep:
                 break
         points = model.select(id, dt__gte=start, dt__lt=stop)
-        points = list(points if index else model.reduce(points))
+        return self._derive(index, points, start, stop, rate, fixed)
+
+    def select_many(self, ids, start, stop, rates=(), maxlen=float('inf'), fixed=0):
+        """Return mapping of series ids to points within inclusive interval, as select, in a single query.
+        The sample resolution is chosen once for all series, as the finest one none of them has expired the start from.
+        Series in rates have the rate of change of their points derived.
+        """
+        ids = list(ids)
+        if not ids:
+            return {}
+        minstep = total_seconds(stop - start) / maxlen
+        for index, model in enumerate(self):
+            if model.step >= minstep and not model.objects.filter(id__in=ids, dt__gt=start + model.expiration_time).exists():
+                break
+        query = model.objects.filter(id__in=ids, dt__gte=start, dt__lt=stop).order_by('id', 'dt')
+        points = collections.defaultdict(list)
+        for row in query.values_list('id', *Point._fields):
+            points[row[0]].append(Point(*row[1:]))
+        return dict((id, self._derive(index, points[id], start, stop, id in rates, fixed)) for id in ids)
+
+    def _derive(self, index, points, start, stop, rate, fixed):
+        "Return points selected from the indexed Sample, optionally as rates and fixed intervals."
+        points = list(points if index else self[index].reduce(points))
         if rate:
             points = map(operator.sub, points[1:], points[:-1])
         if fixed:
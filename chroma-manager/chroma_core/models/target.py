@@ -1660,6 +1660,7 @@ class TargetRecoveryAlert(AlertStateBase):
     # from clients may block until recovery completes, effectively degrading performance.
     # Therefore it's WARNING.
     default_severity = logging.WARNING
+    indexed = True
 
     def alert_message(self):
         return "Target %s in recovery" % self.alert_item
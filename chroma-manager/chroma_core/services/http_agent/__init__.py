@@ -12,6 +12,7 @@ from chroma_core.services.rpc import ServiceRpcInterface
 from chroma_core.services.http_agent.host_state import HostStateCollection, HostStatePoller
 from chroma_core.services.http_agent.queues import HostQueueCollection, AmqpRxForwarder, AmqpTxForwarder
 from chroma_core.services.http_agent.sessions import SessionCollection
+from chroma_core.services.http_agent.poll_schedule import PollSchedule
 from chroma_core.services import ChromaService, ServiceThread, log_register
 from chroma_agent_comms.views import MessageView, ValidatedClientView
 
@@ -105,6 +106,7 @@ class Service(ChromaService):
         MessageView.queues = self.queues
         MessageView.sessions = self.sessions
         MessageView.hosts = self.hosts
+        MessageView.poll_schedule = PollSchedule()
         ValidatedClientView.valid_certs = self.valid_certs
 
         # The thread for generating HostOfflineAlerts
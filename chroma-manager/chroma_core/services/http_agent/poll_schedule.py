@@ -0,0 +1,65 @@
+# Copyright (c) 2017 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a MIT-style
+# license that can be found in the LICENSE file.
+
+
+import random
+import threading
+import time
+
+from chroma_core.services import log_register
+from chroma_core.services.queue import AgentRxQueue
+import settings
+
+
+log = log_register(__name__)
+
+
+class PollSchedule(object):
+    """
+    Decide how often agents poll each device plugin, and with what phase.
+
+    Each session is given a random phase offset when it is created so that agents which (re)connect together,
+    e.g. after a manager restart, do not poll in lock-step.  When a plugin's RX queue backs up the period is
+    lengthened, spreading the load of its consumer service over time rather than letting it peak.
+    """
+
+    # Seconds for which a queue depth sample is reused, so that checking it costs at most one AMQP
+    # round trip per plugin per interval however many agents are posting.
+    DEPTH_CHECK_INTERVAL = 10
+
+    def __init__(self, rx_depth = None):
+        self._rx_depth = rx_depth or (lambda plugin: AgentRxQueue(plugin).depth())
+        self._lock = threading.Lock()
+        # Map of plugin name to (time sampled, depth)
+        self._depths = {}
+
+    def _depth(self, plugin):
+        with self._lock:
+            sampled_at, depth = self._depths.get(plugin, (None, 0))
+            if sampled_at is None or time.time() - sampled_at > self.DEPTH_CHECK_INTERVAL:
+                try:
+                    depth = self._rx_depth(plugin)
+                except Exception as e:
+                    log.warning("Cannot read queue depth for %s: %s" % (plugin, e))
+                self._depths[plugin] = (time.time(), depth)
+
+            return depth
+
+    def period(self, plugin):
+        """The poll period, in seconds, that agents should currently use for `plugin`"""
+        period = settings.AGENT_PLUGIN_POLL_PERIODS.get(plugin, settings.AGENT_POLL_PERIOD)
+
+        backlog = self._depth(plugin) // settings.AGENT_RX_BACKPRESSURE_DEPTH
+        if backlog:
+            period = min(period * 2 ** min(backlog, 16), max(period, settings.AGENT_MAX_POLL_PERIOD))
+            log.debug("Backpressure on %s: poll period %s" % (plugin, period))
+
+        return period
+
+    def create(self, plugin):
+        """The schedule for a new session of `plugin`, sent in its SESSION_CREATE_RESPONSE"""
+        period = self.period(plugin)
+
+        return {'poll_period': period,
+                'poll_offset': random.uniform(0, period)}
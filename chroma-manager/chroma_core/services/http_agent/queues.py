@@ -5,8 +5,8 @@
 
 import Queue
 import threading
-from chroma_core.services import _amqp_connection, log_register
-from chroma_core.services.queue import ServiceQueue
+from chroma_core.services import log_register
+from chroma_core.services.queue import ServiceQueue, AgentRxQueue
 
 
 class AgentTxQueue(ServiceQueue):
@@ -60,20 +60,21 @@ class AmqpRxForwarder(object):
     def __init__(self, queue_collection):
         self._stopping = threading.Event()
         self._queue_collection = queue_collection
+        self._rx_queues = {}
 
     def run(self):
-        with _amqp_connection() as conn:
-            while not self._stopping.is_set():
+        while not self._stopping.is_set():
+            try:
+                msg = self._queue_collection.plugin_rx_queue.get(block = True, timeout = 1)
+            except Queue.Empty:
+                pass
+            else:
+                plugin_name = msg['plugin']
                 try:
-                    msg = self._queue_collection.plugin_rx_queue.get(block = True, timeout = 1)
-                except Queue.Empty:
-                    pass
-                else:
-                    plugin_name = msg['plugin']
-                    rx_queue_name = "agent_%s_rx" % plugin_name
-                    q = conn.SimpleQueue(rx_queue_name, serializer = 'json',
-                                         exchange_opts={'durable': False}, queue_opts={'durable': False})
-                    q.put(msg)
+                    rx_queue = self._rx_queues[plugin_name]
+                except KeyError:
+                    rx_queue = self._rx_queues[plugin_name] = AgentRxQueue(plugin_name)
+                rx_queue.put(msg)
 
     def stop(self):
         self._stopping.set()
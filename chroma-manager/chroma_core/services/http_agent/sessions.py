@@ -117,3 +117,5 @@ class Session(object):
     def __init__(self, plugin):
         self.id = uuid.uuid4().__str__()
         self.plugin = plugin
+        # The poll period last advertised to the agent for this session
+        self.poll_period = None
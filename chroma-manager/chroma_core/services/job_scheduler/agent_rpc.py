@@ -37,6 +37,9 @@ class ActionInFlight(object):
         self.exception = None
         self.result = None
         self.subprocesses = []
+        # How long the action waited in the agent's action queue, and how many others were still queued
+        # when it started: {'wait': seconds, 'depth': n}, None from older agents.
+        self.queue_stats = None
 
     def get_request(self):
         return {
@@ -240,6 +243,10 @@ class AgentRpcMessenger(object):
                         rpc.exception = rpc_response['exception']
                         rpc.result = rpc_response['result']
                         rpc.subprocesses = rpc_response['subprocesses']
+                        rpc.queue_stats = rpc_response.get('queue')
+                        if rpc.queue_stats:
+                            log.info("AgentRpcMessenger.on_rx: rpc %s %s queued %.1fs on %s, %s queued behind it" % (
+                                rpc.id, rpc.action, rpc.queue_stats['wait'], fqdn, rpc.queue_stats['depth']))
                         log.info("AgentRpcMessenger.on_rx: completing rpc %s" % rpc.id)
                         rpc.complete.set()
                 else:
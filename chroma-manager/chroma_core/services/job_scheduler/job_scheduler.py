@@ -55,7 +55,8 @@ from iml_common.lib.date_time import IMLDateTime
 from chroma_help.help import help_text
 
 import chroma_core.lib.conf_param
-from chroma_core.lib.long_polling import long_polling
+# Imported to register its receiver of lock changes, which are published to long polling clients
+from chroma_core.lib.long_polling import long_polling  # noqa
 
 log = log_register(__name__.split('.')[-1])
 
@@ -349,6 +350,13 @@ class RunJobThread(threading.Thread):
 
 
 class JobCollection(object):
+    """In-memory index of the jobs of incomplete commands.
+
+    Each job's wait_for_json is parsed once when it is added, and the collection keeps a count of
+    outstanding (not complete) dependencies per job plus the reverse edges, so that completing a job
+    only visits its dependents, and the set of ready jobs (pending with no outstanding dependencies)
+    is maintained rather than recomputed.
+    """
     def __init__(self):
         self.flush()
 
@@ -364,9 +372,42 @@ class JobCollection(object):
         self._command_to_jobs = defaultdict(set)
         self._job_to_commands = defaultdict(set)
 
+        self._outstanding = {}  # Map of job ID to number of wait_for jobs which aren't complete
+        self._dependents = defaultdict(set)  # Map of job ID to IDs of jobs which wait for it
+        self._ready = {}  # Pending jobs with no outstanding dependencies
+
+    def _index(self, job):
+        wait_for_ids = set(json.loads(job.wait_for_json))
+        self._outstanding[job.id] = len(wait_for_ids - set(self._state_jobs['complete']))
+        for wait_for_id in wait_for_ids:
+            self._dependents[wait_for_id].add(job.id)
+
+    def _set_state(self, job, initial_state):
+        """Update the ready set and dependency counts for a job which has moved from
+        `initial_state` (None if it is new to the collection) to `job.state`"""
+        if job.state == 'pending' and self._outstanding[job.id] == 0:
+            self._ready[job.id] = job
+        else:
+            self._ready.pop(job.id, None)
+
+        if job.state == 'complete' and initial_state != 'complete':
+            for dependent_id in self._dependents[job.id]:
+                self._outstanding[dependent_id] -= 1
+                if self._outstanding[dependent_id] == 0 and dependent_id in self._state_jobs['pending']:
+                    self._ready[dependent_id] = self._state_jobs['pending'][dependent_id]
+
     def add(self, job):
+        initial_state = None
+        if job.id in self._jobs:
+            for state, jobs in self._state_jobs.items():
+                if jobs.pop(job.id, None) is not None:
+                    initial_state = state
+        else:
+            self._index(job)
+
         self._jobs[job.id] = job
         self._state_jobs[job.state][job.id] = job
+        self._set_state(job, initial_state)
 
     def add_command(self, command, jobs):
         """Add command if it doesn't already exist, and ensure that all
@@ -397,6 +438,7 @@ class JobCollection(object):
             log.warning("Cancelling uncached Job %s" % job.id)
         else:
             self._state_jobs[job.state][job.id] = job
+            self._set_state(job, initial_state)
 
     def update_commands(self, job):
         """
@@ -418,20 +460,17 @@ class JobCollection(object):
 
     def update_many(self, jobs, new_state):
         for job in jobs:
+            initial_state = job.state
             del self._state_jobs[job.state][job.id]
             job.state = new_state
             self._state_jobs[job.state][job.id] = job
+            self._set_state(job, initial_state)
 
         Job.objects.filter(id__in = [j.id for j in jobs]).update(state = new_state)
 
     @property
     def ready_jobs(self):
-        result = []
-        for job in self._state_jobs['pending'].values():
-            wait_for_ids = json.loads(job.wait_for_json)
-            complete_job_ids = [j.id for j in self._state_jobs['complete'].values()]
-            if not set(wait_for_ids) - set(complete_job_ids):
-                result.append(job)
+        result = self._ready.values()
 
         if len(result) == 0 and len(self.pending_jobs) == 0 and len(self.tasked_jobs) == 0:
             # A quiescent state, flush the collection (avoid building up an indefinitely
@@ -1497,18 +1536,30 @@ class JobScheduler(object):
 
             return jobs
 
-    def get_locks(self, obj_key, obj_id):
-        locks = {'read': [],
-                 'write': []}
+    def get_locks(self, object_list):
+        """Look up the jobs holding locks on each stateful object
 
-        try:
-            object = JobScheduler._retrieve_stateful_object(obj_key, obj_id)
-            locks['read'] = list(set([x.job.id for x in self._lock_cache.read_by_item[object]]))
-            locks['write'] = list(set([x.job.id for x in self._lock_cache.write_by_item[object]]))
-        except ObjectDoesNotExist:
-            pass
+        :param object_list: list of serialized tuples: [(obj_key, obj_id), ...]
+        :return: A dict of lock job ids for each object like {obj1_id: {'read': [job_id, ...],
+                        'write': [job_id, ...]}, ...}
+        """
 
-        return locks
+        with self._lock:
+
+            locks = {}
+            for obj_key, obj_id in object_list:
+                locks[obj_id] = {'read': [],
+                                 'write': []}
+
+                try:
+                    object = JobScheduler._retrieve_stateful_object(obj_key, obj_id)
+                except ObjectDoesNotExist:
+                    continue
+
+                locks[obj_id]['read'] = list(set([x.job.id for x in self._lock_cache.read_by_item.get(object, [])]))
+                locks[obj_id]['write'] = list(set([x.job.id for x in self._lock_cache.write_by_item.get(object, [])]))
+
+            return locks
 
     def update_nids(self, nid_list):
         # Although this is creating/deleting a NID it actually rewrites the whole NID configuration for the node
@@ -1595,9 +1646,3 @@ class JobScheduler(object):
     @property
     def CommandPlan(self):
         return CommandPlan(self._lock_cache, self._job_collection)
-
-    def tables_changed(self, timestamp, tables):
-        return long_polling.tables_changed(timestamp, tables)
-
-    def wait_table_change(self, last_change_time, tables_list, timeout):
-        return long_polling.wait_table_change(last_change_time, tables_list, timeout)
@@ -11,10 +11,9 @@ non-remote functionality is wrapped in JobSchedulerClient.
 
 """
 
-from django import db
 
 from chroma_core.services import log_register
-from chroma_core.services.rpc import ServiceRpcInterface
+from chroma_core.services.rpc import ServiceRpcInterface, PRIORITY_HIGH, PRIORITY_LOW
 from chroma_core.models import ManagedHost, Command
 
 
@@ -42,11 +41,23 @@ class JobSchedulerRpc(ServiceRpcInterface):
                'available_jobs',
                'get_locks',
                'update_corosync_configuration',
-               'get_transition_consequences',
-               'tables_changed',
-               'wait_table_change'
+               'get_transition_consequences'
                ]
 
+    # Queries made to render the UI go ahead of requests to change the system, which take
+    # longer and mostly serialize on the scheduler lock.
+    priorities = {'available_transitions': PRIORITY_HIGH,
+                  'available_jobs': PRIORITY_HIGH,
+                  'get_locks': PRIORITY_HIGH,
+                  'get_transition_consequences': PRIORITY_HIGH,
+                  'create_host_ssh': PRIORITY_LOW,
+                  'create_filesystem': PRIORITY_LOW,
+                  'create_targets': PRIORITY_LOW}
+
+    # create_host_ssh holds the scheduler lock across SSH round trips, so further calls
+    # would only park workers on the lock.
+    concurrency_limits = {'create_host_ssh': 1}
+
 
 class JobSchedulerClient(object):
     """Because there are some tasks which are the domain of the job scheduler but do not need to
@@ -188,20 +199,6 @@ class JobSchedulerClient(object):
 
         return JobSchedulerRpc().trigger_plugin_update(include_host_ids, exclude_host_ids, plugin_names)
 
-    @classmethod
-    def tables_changed(cls, timestamp, tables):
-        return JobSchedulerRpc().tables_changed(timestamp, tables)
-
-    @classmethod
-    def wait_table_change(cls, last_timestamp, tables_list, timeout):
-        # This can be a long time so we don't want to hang onto any database connection
-        db.connection.close()
-
-        return JobSchedulerRpc().wait_table_change(last_timestamp,
-                                                   tables_list,
-                                                   timeout,
-                                                   rpc_timeout=timeout + 5)
-
     @classmethod
     def update_lnet_configuration(cls, lnet_configuration_list):
         return JobSchedulerRpc().update_lnet_configuration(lnet_configuration_list)
@@ -264,5 +261,10 @@ class JobSchedulerClient(object):
         JobSchedulerRpc().unregister_copytool(copytool_id)
 
     @classmethod
-    def get_locks(cls, obj_key, obj_id):
-        return JobSchedulerRpc().get_locks(obj_key, obj_id)
+    def get_locks(cls, object_list):
+        """Return the read and write lock job ids for each object in list
+
+        See the Job Scheduler method of the same name for details.
+        """
+
+        return JobSchedulerRpc().get_locks(object_list)
@@ -4,10 +4,71 @@
 
 
 from collections import defaultdict
+import bisect
 import json
 from django.db.models import Q
 
 
+class ItemLocks(object):
+    """The read or the write locks on a single item, indexed by job ID and kept in job ID
+    order, so that the latest lock and the locks after a given job are found without sorting"""
+
+    def __init__(self):
+        self._job_ids = []  # Sorted
+        self._by_job_id = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for job_id in self._job_ids:
+            for lock in self._by_job_id[job_id]:
+                yield lock
+
+    def add(self, lock):
+        job_id = lock.job.id
+        locks = self._by_job_id.get(job_id)
+        if locks is not None:
+            locks.append(lock)
+        else:
+            self._by_job_id[job_id] = [lock]
+            if self._job_ids and job_id < self._job_ids[-1]:
+                bisect.insort(self._job_ids, job_id)
+            else:
+                # Jobs are created in ID order, so this is the usual case
+                self._job_ids.append(job_id)
+        self._count += 1
+
+    def remove(self, lock):
+        job_id = lock.job.id
+        locks = self._by_job_id[job_id]
+        locks.remove(lock)
+        if not locks:
+            del self._by_job_id[job_id]
+            del self._job_ids[bisect.bisect_left(self._job_ids, job_id)]
+        self._count -= 1
+
+    def latest(self, not_job = None):
+        if not self._job_ids:
+            return None
+        locks = self._by_job_id[self._job_ids[-1]]
+        if locks[-1].job != not_job:
+            # Usual case: the job asking is not yet (or no longer) holding a lock here
+            return locks[-1]
+        for job_id in reversed(self._job_ids):
+            locks = [l for l in self._by_job_id[job_id] if l.job != not_job]
+            if locks:
+                return locks[-1]
+        return None
+
+    def after(self, job_id, not_job = None):
+        for index in xrange(bisect.bisect_left(self._job_ids, job_id), len(self._job_ids)):
+            for lock in self._by_job_id[self._job_ids[index]]:
+                if lock.job != not_job:
+                    yield lock
+
+
 class LockCache(object):
 
     # Lock change receivers are called whenever a change occurs to the locks. It allows something to
@@ -20,12 +81,10 @@ class LockCache(object):
     def __init__(self):
         from chroma_core.models import Job, StateLock
 
-        self.write_locks = []
-        self.write_by_item = defaultdict(list)
-        self.read_locks = []
-        self.read_by_item = defaultdict(list)
+        self.write_by_item = defaultdict(ItemLocks)
+        self.read_by_item = defaultdict(ItemLocks)
         self.all_by_job = defaultdict(list)
-        self.all_by_item = defaultdict(list)
+        self.all_by_item = defaultdict(set)
 
         for job in Job.objects.filter(~Q(state = 'complete')):
             if job.locks_json:
@@ -38,19 +97,17 @@ class LockCache(object):
             lock_change_receiver(lock, add_remove)
 
     def remove_job(self, job):
-        locks = list(self.all_by_job[job.id])
-        n = len(locks)
+        locks = self.all_by_job.pop(job.id, [])
         for lock in locks:
-            if lock.write:
-                self.write_locks.remove(lock)
-                self.write_by_item[lock.locked_item].remove(lock)
-            else:
-                self.read_locks.remove(lock)
-                self.read_by_item[lock.locked_item].remove(lock)
-            self.all_by_job[job.id].remove(lock)
+            by_item = self.write_by_item if lock.write else self.read_by_item
+            by_item[lock.locked_item].remove(lock)
+            if not by_item[lock.locked_item]:
+                del by_item[lock.locked_item]
             self.all_by_item[lock.locked_item].remove(lock)
+            if not self.all_by_item[lock.locked_item]:
+                del self.all_by_item[lock.locked_item]
             self.call_receivers(lock, self.LOCK_REMOVE)
-        return n
+        return len(locks)
 
     def add(self, lock):
         self._add(lock)
@@ -59,45 +116,39 @@ class LockCache(object):
         assert lock.job.id is not None
 
         if lock.write:
-            self.write_locks.append(lock)
-            self.write_by_item[lock.locked_item].append(lock)
+            self.write_by_item[lock.locked_item].add(lock)
         else:
-            self.read_locks.append(lock)
-            self.read_by_item[lock.locked_item].append(lock)
+            self.read_by_item[lock.locked_item].add(lock)
 
         self.all_by_job[lock.job.id].append(lock)
-        self.all_by_item[lock.locked_item].append(lock)
+        self.all_by_item[lock.locked_item].add(lock)
         self.call_receivers(lock, self.LOCK_ADD)
 
     def get_by_job(self, job):
         return self.all_by_job[job.id]
 
     def get_all(self, locked_item):
-        return self.all_by_item[locked_item]
+        return list(self.all_by_item.get(locked_item, []))
 
     def get_latest_write(self, locked_item, not_job = None):
-        try:
-            if not_job != None:
-                return sorted([l for l in self.write_by_item[locked_item] if l.job != not_job], lambda a, b: cmp(a.job.id, b.job.id))[-1]
-            else:
-                return sorted(self.write_by_item[locked_item], lambda a, b: cmp(a.job.id, b.job.id))[-1]
-        except IndexError:
-            return None
+        locks = self.write_by_item.get(locked_item)
+        return locks.latest(not_job) if locks else None
 
     def get_read_locks(self, locked_item, after, not_job):
-        return [x for x in self.read_by_item[locked_item] if after <= x.job.id and x.job != not_job]
+        locks = self.read_by_item.get(locked_item)
+        return list(locks.after(after, not_job)) if locks else []
 
     def get_write(self, locked_item):
-        return self.write_by_item[locked_item]
+        return list(self.write_by_item.get(locked_item, []))
 
     def get_by_locked_item(self, item):
-        return self.all_by_item[item]
+        return list(self.all_by_item.get(item, []))
 
     def get_write_by_locked_item(self):
         result = {}
         for locked_item, locks in self.write_by_item.items():
             if locks:
-                result[locked_item] = sorted(locks, lambda a, b: cmp(a.job.id, b.job.id))[-1]
+                result[locked_item] = locks.latest()
         return result
 
 
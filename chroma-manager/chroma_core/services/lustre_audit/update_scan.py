@@ -5,6 +5,8 @@
 
 
 import json
+import time
+from collections import defaultdict
 from chroma_core.services import log_register
 
 from django.db import transaction
@@ -16,20 +18,166 @@ from chroma_core.models.client_mount import LustreClientMount
 from chroma_core.models.filesystem import ManagedFilesystem
 from chroma_core.services.job_scheduler import job_scheduler_notify
 from chroma_core.services.job_scheduler.job_scheduler_client import JobSchedulerClient
+from chroma_core.services.http_agent import HttpAgentRpc
 from chroma_core.models import ManagedTargetMount
+from chroma_core.lib.long_polling import long_polling
 from iml_common.lib.date_time import IMLDateTime
 import chroma_core.models.package
 from chroma_core.services.stats import StatsQueue
+import settings
 
 
 log = log_register(__name__)
 
 
+class MetricsDecoder(object):
+    """Expand the delta encoded metrics sent by a host's lustre plugin back into the raw dict.
+
+    The agent sends the paths of new keys in the nested dict and (index, value) pairs for only
+    the leaves that changed, so the dictionary and last values are kept here between messages.
+    A message starting from key 0 is a full update from a new session or a periodic resync.
+    Messages are numbered in sequence (by agents since this was added), so that one which was
+    missed is noticed even if it only changed values.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.values = {}
+        self.next_seq = None
+        # Set once a new session has been asked for, until the full update it starts arrives
+        self.resync_requested = False
+
+    def decode(self, delta):
+        """Return the raw dict, or None if a message has been missed since the last full update"""
+        seq = delta.get('seq')
+        if delta['first'] == 0:
+            self.keys = []
+            self.values = {}
+            self.resync_requested = False
+        elif delta['first'] != len(self.keys) or (seq is not None and seq != self.next_seq):
+            # A message was missed, or this service restarted since the last full update
+            self.next_seq = None
+            return None
+
+        self.next_seq = None if seq is None else seq + 1
+        self.keys.extend(delta['keys'])
+        for index in delta['removed']:
+            self.values.pop(index, None)
+        for index, value in delta['values']:
+            self.values[index] = value
+
+        raw = {}
+        for index, value in self.values.items():
+            path = self.keys[index]
+            parent = raw
+            for key in path[:-1]:
+                parent = parent.setdefault(key, {})
+            parent[path[-1]] = value
+
+        return raw
+
+
+class AuditSnapshot(object):
+    """The values from a host's reports that have been applied to the database, so that each report
+    only touches the database for the entries that differ from the last.
+
+    Values are keyed by entry, e.g. ('target_mount', id).  Those found changed by a scan are only
+    recorded once its transaction commits.  The whole snapshot is forgotten every
+    AUDIT_SNAPSHOT_LIFETIME seconds, so that entries changed in the database by other services
+    are brought back in line with what the host reports.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.values = {}
+        self.pending = {}
+        self.taken_at = time.time()
+
+    def changed(self, key, value):
+        """Return True if `value` differs from the one last applied for `key`"""
+        if time.time() - self.taken_at > settings.AUDIT_SNAPSHOT_LIFETIME:
+            self._reset()
+
+        if key in self.values and self.values[key] == value:
+            return False
+
+        self.pending[key] = value
+        return True
+
+    def commit(self):
+        self.values.update(self.pending)
+        self.pending = {}
+
+    def rollback(self):
+        self.pending = {}
+
+
+class SeriesMap(object):
+    """The metric stores of each host and of the targets mounted on it, with their series ids resolved,
+    so that storing the metrics of a message is a loop of dict lookups rather than a query for each
+    target and each series.
+
+    Dropped whenever the target tables change, as followed through the table change broadcast,
+    so that added and removed targets are picked up.
+    """
+    TABLES = [ManagedTarget._meta.db_table, ManagedTargetMount._meta.db_table]
+
+    def __init__(self):
+        self._changed_at = None
+        self._hosts = {}
+        self._targets = {}
+
+    def _check(self):
+        long_polling.subscribe_table_changes()
+
+        changed_at = max(long_polling.timestamps[table] for table in self.TABLES)
+        if changed_at != self._changed_at:
+            self._changed_at = changed_at
+            self._hosts = {}
+            self._targets = {}
+
+    def host_metrics(self, host):
+        self._check()
+
+        try:
+            return self._hosts[host.id]
+        except KeyError:
+            metrics = self._hosts[host.id] = host.metrics
+            metrics.load_series_ids()
+            return metrics
+
+    def target_metrics(self, host, target_name):
+        """Return the metric store of a target mounted on `host`, or None if there is no such target"""
+        self._check()
+
+        try:
+            return self._targets[(host.id, target_name)]
+        except KeyError:
+            try:
+                metrics = ManagedTarget.objects.get(name=target_name,
+                                                    managedtargetmount__host=host,
+                                                    managedtargetmount__not_deleted=True).downcast().metrics
+                metrics.load_series_ids()
+            except ManagedTarget.DoesNotExist:
+                metrics = None
+
+            self._targets[(host.id, target_name)] = metrics
+            return metrics
+
+
 class UpdateScan(object):
+    # Metrics decoders and audit snapshots by host id, kept between the UpdateScans of each message
+    metrics_decoders = defaultdict(MetricsDecoder)
+    audit_snapshots = defaultdict(AuditSnapshot)
+    series_map = SeriesMap()
+
     def __init__(self):
         self.audited_mountables = {}
         self.host = None
         self.host_data = None
+        self.snapshot = AuditSnapshot()
 
     def is_valid(self):
         try:
@@ -57,8 +205,38 @@ class UpdateScan(object):
         self.host_data = host_data
         log.debug("UpdateScan.run: %s" % self.host)
 
-        self.audit_host()
-        self.store_metrics()
+        self.expand_metrics()
+
+        self.snapshot = self.audit_snapshots[host.id]
+        try:
+            self.audit_host()
+        except Exception:
+            self.snapshot.rollback()
+            raise
+        self.snapshot.commit()
+
+        if self.host_data['metrics'] is not None:
+            self.store_metrics()
+
+    def expand_metrics(self):
+        """
+        Expand delta encoded metrics into the raw form the rest of the scan uses, setting them
+        to None if they cannot be expanded until the host next sends a full update.
+        """
+        metrics = self.host_data['metrics']
+        if 'delta' in metrics:
+            decoder = self.metrics_decoders[self.host.id]
+            raw = decoder.decode(metrics['delta'])
+            if raw is None:
+                self.host_data['metrics'] = None
+                if not decoder.resync_requested:
+                    # Restarting the session makes the agent send everything again, rather than
+                    # leaving this host's metrics out until its next periodic full update
+                    log.warning("Discarding metrics from %s and restarting its session for a full update" % self.host)
+                    decoder.resync_requested = True
+                    HttpAgentRpc().reset_session(self.host.fqdn, 'lustre', None)
+            else:
+                self.host_data['metrics'] = {'raw': raw}
 
     def update_properties(self, properties):
         if properties is not None:
@@ -104,6 +282,10 @@ class UpdateScan(object):
     def update_client_mounts(self):
         # Client mount audit comes in via metrics due to the way the
         # ClientAudit is implemented.
+        if self.host_data['metrics'] is None:
+            # Nothing is known about the mounts without the metrics
+            return
+
         try:
             client_mounts = self.host_data['metrics']['raw']['lustre_client_mounts']
         except KeyError:
@@ -111,7 +293,7 @@ class UpdateScan(object):
 
         # If lustre_client_mounts is None then nothing changed since the last update and so we can just return.
         # Not the same as [] empty list which means no mounts
-        if client_mounts == None:
+        if client_mounts == None or not self.snapshot.changed(('client_mounts',), client_mounts):
             return
 
         expected_fs_mounts = LustreClientMount.objects.select_related('filesystem').filter(host = self.host)
@@ -157,30 +339,35 @@ class UpdateScan(object):
         # Loop over all mountables we expected on this host, whether they
         # were actually seen in the results or not.
         mounted_uuids = dict([(m['fs_uuid'], m) for m in self.host_data['mounts']])
-        for target_mount in ManagedTargetMount.objects.filter(host = self.host):
+        for target_mount in ManagedTargetMount.objects.filter(host = self.host).select_related('target'):
+            target = target_mount.target
 
             # Mounted-ness
             # ============
-            mounted_locally = target_mount.target.uuid in mounted_uuids
+            mounted_locally = target.uuid in mounted_uuids
 
             # Recovery status
             # ===============
             if mounted_locally:
-                mount_info = mounted_uuids[target_mount.target.uuid]
+                mount_info = mounted_uuids[target.uuid]
                 recovery_status = mount_info["recovery_status"]
             else:
                 recovery_status = {}
 
+            # Nothing to do unless the report or the target's active mount changed since the last applied
+            if not self.snapshot.changed(('target_mount', target_mount.id),
+                                         (mounted_locally, recovery_status, target.active_mount_id)):
+                continue
+
             # Update to active_mount and alerts for monitor-only
             # targets done here instead of resource_locations
-            if target_mount.target.immutable_state:
-                target = target_mount.target
+            if target.immutable_state:
                 if mounted_locally:
                     job_scheduler_notify.notify(target, self.started_at, {
                         'state': 'mounted',
                         'active_mount_id': target_mount.id
                     }, ['mounted', 'unmounted'])
-                elif not mounted_locally and target.active_mount == target_mount:
+                elif not mounted_locally and target.active_mount_id == target_mount.id:
                     log.debug("clearing active_mount, %s %s", self.started_at, self.host)
 
                     job_scheduler_notify.notify(target, self.started_at, {
@@ -188,12 +375,12 @@ class UpdateScan(object):
                         'active_mount_id': None
                     }, ['mounted', 'unmounted'])
 
-            if target_mount.target.active_mount == None:
-                TargetRecoveryInfo.update(target_mount.target, {})
-                TargetRecoveryAlert.notify(target_mount.target, False)
+            if target.active_mount_id is None:
+                TargetRecoveryInfo.update(target, {})
+                TargetRecoveryAlert.notify(target, False)
             elif mounted_locally:
-                recovering = TargetRecoveryInfo.update(target_mount.target, recovery_status)
-                TargetRecoveryAlert.notify(target_mount.target, recovering)
+                recovering = TargetRecoveryInfo.update(target, recovery_status)
+                TargetRecoveryAlert.notify(target, recovering)
 
     def update_resource_locations(self):
         # If resource_locations is None then nothing changed since the last update and so we can just return.
@@ -217,6 +404,9 @@ class UpdateScan(object):
             return
 
         for resource_name, node_name in self.host_data['resource_locations'].items():
+            if not self.snapshot.changed(('resource_location', resource_name), node_name):
+                continue
+
             try:
                 target = ManagedTarget.objects.get(ha_label = resource_name)
             except ManagedTarget.DoesNotExist:
@@ -249,16 +439,13 @@ class UpdateScan(object):
         if target_name == "MGS":
             return []
 
-        try:
-            target = ManagedTarget.objects.get(name=target_name,
-                                               managedtargetmount__host=self.host,
-                                               managedtargetmount__not_deleted=True).downcast()
-        except ManagedTarget.DoesNotExist:
+        target_metrics = self.series_map.target_metrics(self.host, target_name)
+        if target_metrics is None:
             # Unknown target -- ignore metrics
             log.warning("Discarding metrics for unknown target: %s" % target_name)
             return []
 
-        return target.metrics.serialize(metrics, jobid_var=self.jobid_var)
+        return target_metrics.serialize(metrics, jobid_var=self.jobid_var)
 
     @transaction.commit_on_success
     def store_metrics(self):
@@ -269,19 +456,26 @@ class UpdateScan(object):
         self.jobid_var = raw_metrics.get('lustre', {}).get('jobid_var', 'disable')
         samples = []
 
+        # Summaries of the counters the agent samples between polls, see MetricStore.rate_peaks
+        rates = raw_metrics.get('lustre', {}).pop('rates', {})
+
         try:
             node_metrics = raw_metrics['node']
             try:
                 node_metrics['lnet'] = raw_metrics['lustre']['lnet']
             except KeyError:
                 pass
+            if 'lnet' in rates:
+                node_metrics['lnet_rates'] = rates['lnet']
 
-            samples += self.host.metrics.serialize(node_metrics)
+            samples += self.series_map.host_metrics(self.host).serialize(node_metrics)
         except KeyError:
             pass
 
         try:
             for target, target_metrics in raw_metrics['lustre']['target'].items():
+                if target in rates.get('target', {}):
+                    target_metrics['rates'] = rates['target'][target]
                 samples += self.store_lustre_target_metrics(target, target_metrics)
         except KeyError:
             pass
@@ -7,7 +7,13 @@
 around an AMQP queue."""
 
 
+import socket
 import threading
+import time
+import uuid
+
+import kombu.pools
+from kombu.entity import Exchange, Queue
 
 from chroma_core.services import _amqp_connection
 from chroma_core.services.log import log_register
@@ -15,6 +21,17 @@ from chroma_core.services.log import log_register
 
 log = log_register('queue')
 
+"""
+Max number of pooled producers (each with its own AMQP connection) used to
+put messages on ServiceQueues from a single process.
+
+"""
+PRODUCER_POOL_LIMIT = 10
+
+# Producers are shared by all ServiceQueue instances and threads in the process, so
+# that their connections, channels and queue declarations are reused across puts.
+producers = kombu.pools.Producers(limit = PRODUCER_POOL_LIMIT)
+
 
 class ServiceQueue(object):
     """Simple FIFO queue, multiple senders, single receiver.  Payloads
@@ -33,14 +50,22 @@ class ServiceQueue(object):
 
         AcmeQueue().put({'foo': 'bar'})
 
+    Consumers which can handle several messages in one transaction may opt in
+    to receiving them in batches with `serve_batch`.
+
     """
     name = None
 
+    def _queue(self):
+        """The queue and exchange declared by SimpleQueue for this queue's name"""
+        return Queue(self.name, Exchange(self.name, type = 'direct', durable = False),
+                     routing_key = self.name, durable = False)
+
     def put(self, body):
-        with _amqp_connection() as conn:
-            q = conn.SimpleQueue(self.name, serializer = 'json',
-                                 exchange_opts={'durable': False}, queue_opts={'durable': False})
-            q.put(body)
+        queue = self._queue()
+        with producers[_amqp_connection()].acquire(block = True) as producer:
+            producer.publish(body, serializer = 'json', exchange = queue.exchange, routing_key = queue.routing_key,
+                             declare = [queue], retry = True)
 
     def purge(self):
         with _amqp_connection() as conn:
@@ -48,6 +73,12 @@ class ServiceQueue(object):
                                       exchange_opts={'durable': False}, queue_opts={'durable': False}).consumer.purge()
             log.info("Purged %s messages from '%s' queue" % (purged, self.name))
 
+    def depth(self):
+        """Number of messages waiting in the queue"""
+        with _amqp_connection() as conn:
+            return conn.SimpleQueue(self.name,
+                                    exchange_opts={'durable': False}, queue_opts={'durable': False}).qsize()
+
     def __init__(self):
         self._stopping = threading.Event()
 
@@ -71,6 +102,87 @@ class ServiceQueue(object):
                 except QueueEmpty:
                     pass
 
+    def serve_batch(self, callback, batch_size = 100, batch_timeout = 0.1):
+        """Like `serve`, but drain up to `batch_size` messages, or as many as arrive within
+        `batch_timeout` seconds of the first one, ack them together and invoke the callback
+        once with the list of decoded messages."""
+        from Queue import Empty as QueueEmpty
+        with _amqp_connection() as conn:
+            q = conn.SimpleQueue(self.name, serializer = 'json',
+                                 exchange_opts={'durable': False}, queue_opts={'durable': False})
+            while not self._stopping.is_set():
+                try:
+                    messages = [q.get(timeout = 1)]
+                except QueueEmpty:
+                    continue
+
+                deadline = time.time() + batch_timeout
+                while len(messages) < batch_size:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        messages.append(q.get(timeout = remaining))
+                    except QueueEmpty:
+                        break
+
+                for message in messages:
+                    message.ack()
+                callback([message.decode() for message in messages])
+
+
+class ServiceBroadcast(object):
+    """Publish/subscribe on a fanout exchange: many senders, and every subscriber in every
+    process receives its own copy of each message.  Payloads must be JSON-serializable.
+
+    A subscriber only receives messages published while it is connected, so subscribers
+    must be able to recover from missed messages, using the `on_connect` callback which is
+    invoked each time the subscription is (re)established.
+
+    Subclass this for each named broadcast, setting the `name` class attribute.
+
+    """
+    name = None
+
+    def __init__(self):
+        self._stopping = threading.Event()
+
+    def _exchange(self):
+        return Exchange(self.name, type = 'fanout', durable = False)
+
+    def publish(self, body):
+        exchange = self._exchange()
+        with producers[_amqp_connection()].acquire(block = True) as producer:
+            producer.publish(body, serializer = 'json', exchange = exchange, declare = [exchange], retry = True)
+
+    def stop(self):
+        log.info("Stopping ServiceBroadcast %s" % self.name)
+        self._stopping.set()
+
+    def subscribe(self, callback, on_connect = None):
+        """Invoke callback with each decoded message until stopped, reconnecting if the
+        connection to the broker is lost."""
+        while not self._stopping.is_set():
+            conn = _amqp_connection()
+            try:
+                # A private queue for this subscriber, removed by the broker when it disconnects
+                queue = Queue("%s_%s" % (self.name, uuid.uuid4()), self._exchange(),
+                              durable = False, exclusive = True, auto_delete = True)
+                with conn.Consumer([queue], callbacks = [lambda body, message: callback(body)],
+                                   no_ack = True, accept = ['json']):
+                    if on_connect:
+                        on_connect()
+                    while not self._stopping.is_set():
+                        try:
+                            conn.drain_events(timeout = 1)
+                        except socket.timeout:
+                            pass
+            except conn.connection_errors + conn.channel_errors, e:
+                log.warning("Lost subscription to '%s' (%s), reconnecting" % (self.name, e))
+                self._stopping.wait(1)
+            finally:
+                conn.release()
+
 
 class AgentRxQueue(ServiceQueue):
     def __route_message(self, message):
@@ -104,3 +216,13 @@ class AgentRxQueue(ServiceQueue):
         self.__session_callback = session_callback
 
         return ServiceQueue.serve(self, self.__route_message)
+
+    def serve_batch(self, data_callback, batch_size = 100, batch_timeout = 0.1):
+        """Batched counterpart of `serve` for simple consumer services: the data callback
+        receives a list of (fqdn, body) tuples for the DATA messages in each batch."""
+        def route_messages(messages):
+            data = [(message['fqdn'], message['body']) for message in messages if message['type'] == 'DATA']
+            if data:
+                data_callback(data)
+
+        return ServiceQueue.serve_batch(self, route_messages, batch_size, batch_timeout)
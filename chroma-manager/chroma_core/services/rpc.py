@@ -8,6 +8,10 @@
 The outward facing parts of this module are the `ServiceRpc` class and the
 RpcWaiter.initialize/shutdown methods.
 
+Timings of the RPCs served and called by a process are kept in `rpc_stats`, which
+can be fetched from a running service with its `get_rpc_stats` RPC (see the
+`rpc_stats` management command).
+
 Concurrent RPC invocations from a single process are handled by a global
 instance of RpcWaiter, which requires explicit initialization and shutdown.
 This is taken care of if your code is running within the `chroma_service`
@@ -15,6 +19,8 @@ management command.
 """
 import logging
 
+import heapq
+import itertools
 import socket
 import threading
 import uuid
@@ -24,6 +30,7 @@ import os
 import time
 import jsonschema
 
+from collections import defaultdict
 from django.db import transaction
 import kombu
 import kombu.pools
@@ -68,6 +75,29 @@ LIGHTWEIGHT_CONNECTIONS_LIMIT = 10
 
 RESPONSE_CONN_LIMIT = 10
 
+"""
+Number of worker threads running RPCs for each RpcServer.
+
+"""
+RPC_WORKERS = 75
+
+"""
+Max number of RPCs received by an RpcServer and waiting for a worker.  When this
+is reached the server stops consuming requests, so that a storm of RPCs waits in
+the broker instead of in our memory.
+
+"""
+RPC_QUEUE_LIMIT = 1000
+
+"""
+RPC priorities, see ServiceRpcInterface.priorities.  Waiting RPCs are run lowest
+value first, then in the order they arrived.
+
+"""
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
 tx_connections = None
 rx_connections = None
 lw_connections = None
@@ -75,6 +105,72 @@ lw_connections = None
 log = log_register('rpc')
 
 
+class RpcHistogram(object):
+    """Count of durations in power of two millisecond buckets: bucket 0 is under 1ms,
+    bucket n is [2^(n-1), 2^n)ms and the last bucket is unbounded."""
+
+    BUCKETS = 20
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[min(int(seconds * 1000).bit_length(), self.BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction):
+        """The upper bound of the bucket containing the given fraction of durations, in ms"""
+        target = fraction * self.count
+        cumulative = 0
+        for bucket, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                break
+        return min(2 ** bucket, self.max * 1000)
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total_ms': self.total * 1000,
+            'mean_ms': self.total * 1000 / self.count if self.count else 0.0,
+            'max_ms': self.max * 1000,
+            'p50_ms': self.percentile(0.5),
+            'p90_ms': self.percentile(0.9),
+            'p99_ms': self.percentile(0.99),
+            'buckets': self.counts
+        }
+
+
+class RpcStats(object):
+    """Histograms of the time spent in each phase of each RPC method.
+
+    Phases recorded by the server are 'validate' (of the request), 'queue' (waiting for a
+    worker), 'execute' (the method itself, including its database access) and 'respond'
+    (serializing and publishing the response).  Callers record 'round_trip'.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = defaultdict(lambda: defaultdict(RpcHistogram))
+
+    def record(self, method, phase, seconds):
+        with self._lock:
+            self._histograms[method][phase].record(seconds)
+
+    def report(self):
+        with self._lock:
+            return dict((method, dict((phase, histogram.to_dict()) for phase, histogram in phases.items()))
+                        for method, phases in self._histograms.items())
+
+
+rpc_stats = RpcStats()
+
+
 class RpcError(Exception):
     def __init__(self, description, exception_type, **kwargs):
         super(Exception, self).__init__(description)
@@ -90,36 +186,18 @@ class RpcTimeout(Exception):
     pass
 
 
-class RunOneRpc(threading.Thread):
-    """Handle a single incoming RPC in a new thread, and send the
-    response (result or exception) from the execution thread."""
-
-    _outstanding = 0
-    _throttle_limit = 75
-    _throttled_locks = []
+class RunOneRpc(object):
+    """Handle a single incoming RPC on an RpcExecutor worker, and send the
+    response (result or exception) from the worker thread."""
 
     def __init__(self, rpc, body, response_conn_pool):
-        super(RunOneRpc, self).__init__()
         self.rpc = rpc
         self.body = body
         self._response_conn_pool = response_conn_pool
 
     def run(self):
-        # We do not throttle rpcs that do not hit the database.
-        rpc_throttle = self.body['method'] not in ['wait_table_change']
-
+        started_at = time.time()
         try:
-            if rpc_throttle:
-                if RunOneRpc._outstanding > RunOneRpc._throttle_limit:
-                    rpc_complete_event = threading.Event()
-                    RunOneRpc._throttled_locks.append(rpc_complete_event)
-                    log.info("_throttled_locks: '%s'" % RunOneRpc._throttled_locks)
-                    log.info("Throttled rpc to %s throttled rpcs=%s" % (self.body['method'], len(RunOneRpc._throttled_locks)))
-                    rpc_complete_event.wait()
-                    log.info("Released rpc to %s throttled rpcs=%s" % (self.body['method'], len(RunOneRpc._throttled_locks)))
-
-                RunOneRpc._outstanding += 1
-
             result = {
                 'result': self.rpc._local_call(self.body['method'], *self.body['args'], **self.body['kwargs']),
                 'request_id': self.body['request_id'],
@@ -148,29 +226,145 @@ class RunOneRpc(threading.Thread):
             }
             log.error("RunOneRpc: exception calling %s: %s" % (self.body['method'], backtrace))
         finally:
-            try:
-                if rpc_throttle:
-                    try:
-                        rpc_complete_event = RunOneRpc._throttled_locks.pop(0)
-                        rpc_complete_event.set()
-                    except IndexError:
-                        pass
-                    RunOneRpc._outstanding -= 1
-            finally:
-                django.db.connection.close()
+            django.db.connection.close()
+
+        executed_at = time.time()
+        rpc_stats.record(self.body['method'], 'execute', executed_at - started_at)
 
         with self._response_conn_pool[_amqp_connection()].acquire(block=True) as connection:
             with Producer(connection) as producer:
                 maybe_declare(_amqp_exchange(), producer.channel)
                 producer.publish(result, serializer="json", routing_key=self.body['response_routing_key'], delivery_mode = 1, immedate = True, mandatory = True)
 
+        rpc_stats.record(self.body['method'], 'respond', time.time() - executed_at)
+
+
+class RpcExecutor(object):
+    """A fixed pool of worker threads taking RPC requests from a bounded priority queue.
+
+    Requests run in priority order and then in the order they arrived, skipping over any
+    whose method is already running as many times as its concurrency limit allows.
+    """
+
+    def __init__(self, name, run, workers, queue_limit, priorities = None, concurrency_limits = None):
+        """
+        :param run: Callable invoked on a worker thread with each request body
+        :param priorities: Dict of method name to priority, default PRIORITY_NORMAL
+        :param concurrency_limits: Dict of method name to max concurrent calls, default unlimited
+        """
+        self.name = name
+        self._run = run
+        self._queue_limit = queue_limit
+        self._priorities = priorities or {}
+        self._concurrency_limits = concurrency_limits or {}
+
+        self._condition = threading.Condition()
+        self._queue = []                       # Heap of (priority, sequence, body, queued_at)
+        self._sequence = itertools.count()
+        self._running = defaultdict(int)
+        self._stopping = False
+
+        self._max_queued = 0
+        self._completed = 0
+        self._queue_full_waits = 0
+
+        self._workers = [threading.Thread(target = self._work, name = "%s-rpc-%s" % (name, i)) for i in range(workers)]
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+
+    def stop(self):
+        """Stop the workers once their current RPCs complete, dropping any still queued"""
+        with self._condition:
+            self._stopping = True
+            if self._queue:
+                log.warning("Dropping %s queued RPCs to %s" % (len(self._queue), self.name))
+                self._queue = []
+            self._condition.notify_all()
+
+    def join(self):
+        for worker in self._workers:
+            worker.join()
+
+    def put(self, body):
+        """Queue a request, blocking while the queue is full"""
+        priority = self._priorities.get(body['method'], PRIORITY_NORMAL)
+
+        with self._condition:
+            if len(self._queue) >= self._queue_limit:
+                self._queue_full_waits += 1
+                log.warning("RPC queue for %s full with %s requests" % (self.name, len(self._queue)))
+                while len(self._queue) >= self._queue_limit and not self._stopping:
+                    self._condition.wait()
+
+            heapq.heappush(self._queue, (priority, next(self._sequence), body, time.time()))
+            self._max_queued = max(self._max_queued, len(self._queue))
+            self._condition.notify_all()
+
+    def metrics(self):
+        """Queue depth and worker occupancy, for monitoring"""
+        with self._condition:
+            return {
+                'workers': len(self._workers),
+                'queued': len(self._queue),
+                'max_queued': self._max_queued,
+                'queue_limit': self._queue_limit,
+                'queue_full_waits': self._queue_full_waits,
+                'completed': self._completed,
+                'running': dict((method, n) for method, n in self._running.items() if n)
+            }
+
+    def _take(self):
+        """Pop the first request whose method is below its concurrency limit, or return None"""
+        skipped = []
+        body = None
+        while self._queue:
+            item = heapq.heappop(self._queue)
+            limit = self._concurrency_limits.get(item[2]['method'])
+            if limit is None or self._running[item[2]['method']] < limit:
+                body = item[2]
+                rpc_stats.record(body['method'], 'queue', time.time() - item[3])
+                break
+            skipped.append(item)
+
+        for item in skipped:
+            heapq.heappush(self._queue, item)
+
+        return body
+
+    def _work(self):
+        while True:
+            with self._condition:
+                body = self._take()
+                while body is None:
+                    if self._stopping:
+                        return
+                    self._condition.wait()
+                    body = self._take()
+                self._running[body['method']] += 1
+                # Wake a producer waiting on a full queue
+                self._condition.notify_all()
+
+            try:
+                self._run(body)
+            except Exception:
+                # RunOneRpc reports exceptions from the method itself, this is a failure to respond
+                log.exception("Failed to run RPC %s" % body['method'])
+            finally:
+                with self._condition:
+                    self._running[body['method']] -= 1
+                    self._completed += 1
+                    # Wake a worker for a request that was held back by the concurrency limit
+                    self._condition.notify_all()
+
 
 class RpcServer(ConsumerMixin):
     def __init__(self, rpc, connection, service_name, serialize = False):
         """
         :param rpc: A ServiceRpcInterface instance
         :param serialize: If True, then process RPCs one after another in a single thread
-        rather than running a thread for each RPC.
+        rather than running them on a pool of RPC_WORKERS threads.
         """
         super(RpcServer, self).__init__()
         self.serialize = serialize
@@ -179,6 +373,12 @@ class RpcServer(ConsumerMixin):
         self.queue_name = service_name
         self.request_routing_key = "%s.requests" % self.queue_name
         self._response_conn_pool = kombu.pools.Connections(limit = RESPONSE_CONN_LIMIT)
+        self.executor = RpcExecutor(service_name,
+                                    lambda body: RunOneRpc(self.rpc, body, self._response_conn_pool).run(),
+                                    1 if serialize else RPC_WORKERS,
+                                    RPC_QUEUE_LIMIT,
+                                    rpc.priorities,
+                                    rpc.concurrency_limits)
 
     def get_consumers(self, Consumer, channel):
         return [Consumer(
@@ -188,6 +388,7 @@ class RpcServer(ConsumerMixin):
     def process_task(self, body, message):
         message.ack()
 
+        started_at = time.time()
         try:
             jsonschema.validate(body, REQUEST_SCHEMA)
         except jsonschema.ValidationError as e:
@@ -195,10 +396,20 @@ class RpcServer(ConsumerMixin):
             # breaks our faith in request_id and response_routing_key
             log.error("Invalid RPC body: %s" % e)
         else:
-            RunOneRpc(self.rpc, body, self._response_conn_pool).start()
+            rpc_stats.record(body['method'], 'validate', time.time() - started_at)
+            self.executor.put(body)
+
+    def run(self):
+        self.executor.start()
+        try:
+            super(RpcServer, self).run()
+        finally:
+            self.executor.stop()
+            self.executor.join()
 
     def stop(self):
         self.should_stop = True
+        self.executor.stop()
 
 
 class ResponseWaitState(object):
@@ -540,6 +751,15 @@ class ServiceRpcInterface(object):
 
     """
 
+    # Optional dicts of method name to priority (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)
+    # and to the max number of concurrent calls, used to order and limit calls waiting
+    # for a worker in the server.
+    priorities = {}
+    concurrency_limits = {}
+
+    # Methods served by every ServiceRpcInterface in addition to those of the wrapped object
+    builtin_methods = ['get_rpc_stats']
+
     def __init__(self, wrapped = None):
         self.worker = None
         self.wrapped = wrapped
@@ -551,7 +771,7 @@ class ServiceRpcInterface(object):
                 getattr(wrapped, method)
 
     def __getattr__(self, name):
-        if name in self.methods:
+        if name in self.methods or name in self.builtin_methods:
             return lambda *args, **kwargs: self._call(name, *args, **kwargs)
         else:
             raise AttributeError(name)
@@ -575,7 +795,9 @@ class ServiceRpcInterface(object):
 
         rpc_client = RpcClientFactory.get_client(self.__class__.__name__)
 
+        started_at = time.time()
         result = rpc_client.call(request, rpc_timeout)
+        rpc_stats.record(fn_name, 'round_trip', time.time() - started_at)
 
         if result['exception']:
             log.error("ServiceRpcInterface._call: exception %s: %s \ttraceback: %s" % (result['exception'], result['exception_type'], result.get('traceback')))
@@ -601,10 +823,18 @@ class ServiceRpcInterface(object):
 
     def _local_call(self, fn_name, *args, **kwargs):
         log.debug("_local_call: %s %s %s" % (fn_name, args, kwargs))
-        assert (fn_name in self.methods)
-        fn = getattr(self.wrapped, fn_name)
+        if fn_name in self.builtin_methods:
+            fn = getattr(self, "_%s" % fn_name)
+        else:
+            assert (fn_name in self.methods)
+            fn = getattr(self.wrapped, fn_name)
         return fn(*args, **kwargs)
 
+    def _get_rpc_stats(self):
+        """The RpcStats report of the serving process, and the state of this server's workers"""
+        return {'methods': rpc_stats.report(),
+                'executor': self.worker.executor.metrics()}
+
     def run(self):
         with _amqp_connection() as connection:
             self.worker = RpcServer(self, connection, self.__class__.__name__)
@@ -3,10 +3,13 @@
 # license that can be found in the LICENSE file.
 
 
+import itertools
 import traceback
+from datetime import datetime
 from django import db
-from django.utils import dateparse
+from django.utils.timezone import utc
 from chroma_core.models import Stats
+from chroma_core.models.stats import microseconds
 from chroma_core.services import ChromaService, log_register, queue
 
 
@@ -16,8 +19,18 @@ log = log_register(__name__)
 class StatsQueue(queue.ServiceQueue):
     name = 'stats'
 
+    @staticmethod
+    def encode(samples):
+        "Return samples (id, dt, value) with datetimes as epoch timestamps, which are far cheaper to decode than strings."
+        return [(id, microseconds(dt) / 1e6, value) for id, dt, value in samples]
+
+    @staticmethod
+    def decode(samples):
+        "Generate samples (id, dt, value) from encoded samples."
+        return ((id, datetime.fromtimestamp(ts, utc), value) for id, ts, value in samples)
+
     def put(self, samples):
-        queue.ServiceQueue.put(self, [(id, str(dt), value) for id, dt, value in samples])
+        queue.ServiceQueue.put(self, self.encode(samples))
 
 
 class Service(ChromaService):
@@ -26,11 +39,15 @@ class Service(ChromaService):
 
         self.queue = StatsQueue()
         self.queue.purge()
-        self.queue.serve(callback=self.insert)
+        self.queue.serve_batch(callback=self.insert_batch)
+
+    def insert_batch(self, batch):
+        "Insert the samples of a batch of messages in one go."
+        self.insert(list(itertools.chain.from_iterable(batch)))
 
     def insert(self, samples):
         try:
-            outdated = Stats.insert((id, dateparse.parse_datetime(dt), value) for id, dt, value in samples)
+            outdated = Stats.insert(StatsQueue.decode(samples))
         except db.IntegrityError:
             log.error("Duplicate stats insert: " + db.connection.queries[-1]['sql'])
             db.transaction.rollback()  # allow future stats to still work
@@ -67,29 +67,34 @@ class Service(ChromaService):
         return removed_num_entries
 
     def on_data(self, fqdn, body):
+        self.on_data_batch([(fqdn, body)])
+
+    def on_data_batch(self, messages):
+        """Ingest the log lines of a batch of (fqdn, body) messages in a single transaction"""
         with transaction.commit_on_success():
             with LogMessage.delayed as log_messages:
-                for msg in body['log_lines']:
-                    try:
-                        log_messages.insert(dict(
-                            fqdn = fqdn,
-                            message = msg['message'],
-                            severity = msg['severity'],
-                            facility = msg['facility'],
-                            tag = msg['source'],
-                            datetime = IMLDateTime.parse(msg['datetime']).as_datetime,
-                            message_class = LogMessage.get_message_class(msg['message'])
-                        ))
-                        self._table_size += 1
-
-                        self._parser.parse(fqdn, msg)
-                    except Exception, e:
-                        self.log.error("Error %s ingesting systemd-journal entry: %s" % (e, msg))
+                for fqdn, body in messages:
+                    for msg in body['log_lines']:
+                        try:
+                            log_messages.insert(dict(
+                                fqdn = fqdn,
+                                message = msg['message'],
+                                severity = msg['severity'],
+                                facility = msg['facility'],
+                                tag = msg['source'],
+                                datetime = IMLDateTime.parse(msg['datetime']).as_datetime,
+                                message_class = LogMessage.get_message_class(msg['message'])
+                            ))
+                            self._table_size += 1
+
+                            self._parser.parse(fqdn, msg)
+                        except Exception, e:
+                            self.log.error("Error %s ingesting systemd-journal entry: %s" % (e, msg))
 
     def run(self):
         super(Service, self).run()
 
-        self._queue.serve(data_callback = self.on_data)
+        self._queue.serve_batch(data_callback = self.on_data_batch)
 
     def stop(self):
         super(Service, self).stop()
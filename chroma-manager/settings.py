@@ -238,6 +238,8 @@ STATS_5_MINUTE_EXPIRATION = {'days': 7}     # Expiration must be multiple of 5 m
 STATS_1_HOUR_EXPIRATION = {'days': 30}      # Expiration must be multiple of 1 hour.
 STATS_1_DAY_EXPIRATION = {'weeks': 10000}   # Expiration must be multiple of 1 day
 STATS_FLUSH_RATE = 20                       # Flush 20 times per expiration interval - for 10 seconds sample flush every 1day/20.
+STATS_CACHE_MEMORY = 32 * 1024 * 1024       # Bytes of recent points kept in memory per sample, least recently used series are evicted.
+STATS_COPY_INSERT = False                   # True means samples are streamed with COPY ... FROM STDIN instead of multi-row INSERTs.
 
 # When agent sends VPD 0x80 and 0x83 serial numbers, which do we prefer to use
 # for the canonical device serial on the manager?  Favorite first.
@@ -271,6 +273,10 @@ ALLOW_ANONYMOUS_READ = True
 # Long poll timeout Seconds
 LONG_POLL_TIMEOUT_SECONDS = (60 * 5)
 
+# Seconds over which each process merges the tables its commits change before
+# publishing them to long polling clients as a single message
+LONG_POLL_COALESCE_SECONDS = 0.5
+
 # Allow Cookie to be read from JavaScript and passed to
 # Realtime service
 SESSION_COOKIE_HTTPONLY = False
@@ -298,6 +304,30 @@ INSTALLATION_REBOOT_TIMEOUT = 300
 # How long to wait for an agent to resume contact after being restarted
 AGENT_RESTART_TIMEOUT = 30
 
+# Seconds between polls of each agent device plugin, advertised to agents when
+# their sessions are created.  Plugins not listed in AGENT_PLUGIN_POLL_PERIODS
+# use AGENT_POLL_PERIOD.
+AGENT_POLL_PERIOD = 10
+AGENT_PLUGIN_POLL_PERIODS = {}
+
+# When more than this many messages are waiting in a plugin's agent_<plugin>_rx
+# queue, its agents are asked to poll less often: the period doubles for each
+# multiple of this depth, up to AGENT_MAX_POLL_PERIOD seconds.
+AGENT_RX_BACKPRESSURE_DEPTH = 500
+AGENT_MAX_POLL_PERIOD = 120
+
+# The lustre_audit service only writes the parts of each host's report that
+# differ from the last one it applied.  Its record of what was applied is
+# forgotten after this many seconds so that changes made to the database by
+# other services are still reconciled against the agent's reports.
+AUDIT_SNAPSHOT_LIFETIME = 600
+
+# Alert classes which services notify on every report keep an index of their
+# active alerts in each process, so that a notify which changes nothing needs
+# no query.  The index is reloaded after this many seconds to pick up alerts
+# raised or lowered by other processes.
+ALERT_INDEX_LIFETIME = 60
+
 SSH_CONFIG = None
 
 LOCAL_SETTINGS_FILE = "local_settings.py"
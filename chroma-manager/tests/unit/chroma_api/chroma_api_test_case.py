@@ -66,8 +66,8 @@ class ChromaApiTestCase(ResourceTestCase):
         job_scheduler_client.JobSchedulerClient.available_jobs = fake_available_jobs
 
         @classmethod
-        def fake_get_locks(cls, obj_key, obj_id):
-            return {'read': [1, 2], 'write': [3, 4]}
+        def fake_get_locks(cls, object_list):
+            return defaultdict(lambda: {'read': [1, 2], 'write': [3, 4]})
 
         self.old_get_locks = job_scheduler_client.JobSchedulerClient.get_locks
         job_scheduler_client.JobSchedulerClient.get_locks = fake_get_locks
@@ -80,6 +80,7 @@ class ChromaApiTestCase(ResourceTestCase):
         from chroma_core.services.job_scheduler import job_scheduler_client
         job_scheduler_client.JobSchedulerClient.available_transitions = self.old_available_transitions
         job_scheduler_client.JobSchedulerClient.available_jobs = self.old_available_jobs
+        job_scheduler_client.JobSchedulerClient.get_locks = self.old_get_locks
 
         ObjectCache.clear()
 
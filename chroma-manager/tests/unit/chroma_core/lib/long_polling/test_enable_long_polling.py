@@ -1,5 +1,6 @@
 import mock
 from collections import defaultdict
+from django.utils import unittest
 
 from tests.unit.lib.iml_unit_test_case import IMLUnitTestCase
 
@@ -156,3 +157,30 @@ class TestEnableLongPolling(IMLUnitTestCase):
                              original_transaction_rollback[test_connection_name])
 
         self.assertEqual(self.mock_propagate_table_change.call_count, 0)
+
+
+class TestTableChangePublisher(unittest.TestCase):
+    def setUp(self):
+        self.mock_tables_changed = mock.patch('chroma_core.lib.long_polling.long_polling.tables_changed').start()
+        self.addCleanup(mock.patch.stopall)
+
+        self.publisher = enable_long_polling.TableChangePublisher(0)
+
+    def test_coalesce(self):
+        """Changes made within a window are published as a single message with the latest timestamp"""
+        self.publisher.add(100, ['chroma_core_leicester'])
+        self.publisher.add(300, ['chroma_core_tottenham', 'chroma_core_leicester'])
+        self.publisher.add(200, ['chroma_core_liverpool'])
+
+        self.publisher.publish()
+
+        self.assertEqual(self.mock_tables_changed.call_count, 1)
+        timestamp, tables = self.mock_tables_changed.call_args[0]
+        self.assertEqual(timestamp, 300)
+        self.assertEqual(sorted(tables), ['chroma_core_leicester', 'chroma_core_liverpool', 'chroma_core_tottenham'])
+
+    def test_nothing_changed(self):
+        self.publisher.publish()
+
+        self.assertEqual(self.mock_tables_changed.call_count, 0)
+        self.assertEqual(self.publisher.take(), None)
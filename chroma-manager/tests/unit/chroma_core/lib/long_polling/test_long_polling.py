@@ -0,0 +1,55 @@
+import threading
+
+import mock
+from django.utils import unittest
+
+from chroma_core.lib.long_polling import long_polling
+
+
+class TestLongPolling(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('chroma_core.lib.long_polling.long_polling.TableChangeBroadcast')
+        self.broadcast = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch.object(long_polling, 'timestamps', long_polling.defaultdict(lambda: 0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _wait(self, max_timestamp, results):
+        results.append(long_polling.wait_table_change({'max_timestamp': max_timestamp}, ['chroma_core_foo'], 10))
+
+    def test_tables_changed_published(self):
+        long_polling.tables_changed(100, ['chroma_core_foo'])
+        self.broadcast.return_value.publish.assert_called_once_with({'timestamp': 100, 'tables': ['chroma_core_foo']})
+        self.assertEqual(long_polling.timestamps['chroma_core_foo'], 100)
+
+    def test_lock_change_coalesced(self):
+        """Test that lock changes are left to the coalescing publisher rather than broadcast inline"""
+        lock = mock.Mock()
+        lock.locked_item._meta.db_table = 'chroma_core_foo'
+        with mock.patch('chroma_core.lib.long_polling.enable_long_polling._propagate_table_change') as propagate:
+            long_polling.lock_change_receiver(lock, True)
+
+        propagate.assert_called_once_with(['chroma_core_foo'])
+        self.assertFalse(self.broadcast.return_value.publish.called)
+
+    def test_subscribed_change_wakes_waiter(self):
+        results = []
+        waiter = threading.Thread(target = self._wait, args = (0, results))
+        waiter.start()
+        while not long_polling.events['chroma_core_foo']:
+            waiter.join(0.01)
+
+        long_polling._tables_changed(200, ['chroma_core_foo'])
+        waiter.join()
+        self.assertEqual(results, [{'chroma_core_foo': 200, 'max_timestamp': 200}])
+        self.assertFalse(self.broadcast.return_value.publish.called)
+
+    def test_resync(self):
+        long_polling._tables_changed(100, ['chroma_core_foo'])
+        long_polling._resync()
+
+        # Known and unknown tables are all treated as having changed on (re)connection
+        self.assertGreater(long_polling.timestamps['chroma_core_foo'], 100)
+        self.assertEqual(long_polling.timestamps['chroma_core_bar'], long_polling.timestamps['chroma_core_foo'])
@@ -1,8 +1,10 @@
 from tests.unit.lib.iml_unit_test_case import IMLUnitTestCase
+from tests.unit.chroma_core.helpers import synthetic_host
 
 from chroma_core.models import CommandRunningAlert
 from chroma_core.models import CommandCancelledAlert
 from chroma_core.models import AlertState
+from chroma_core.models import HostContactAlert
 
 
 class TestAlert(IMLUnitTestCase):
@@ -25,3 +27,17 @@ class TestAlert(IMLUnitTestCase):
         alerts = AlertState.objects.all()
         self.assertEqual(len(alerts), 1)
         self.assertEqual(alerts[0].message(), 'Command Houston we have a problem cancelled')
+
+    def test_indexed_notify(self):
+        """A notify which does not change the state of an indexed alert needs no query"""
+        host = synthetic_host('myserver')
+
+        HostContactAlert.notify(host, True)
+        with self.assertNumQueries(0):
+            HostContactAlert.notify(host, True)
+        self.assertEqual(HostContactAlert.objects.filter(active = True).count(), 1)
+
+        HostContactAlert.notify(host, False)
+        with self.assertNumQueries(0):
+            HostContactAlert.notify(host, False)
+        self.assertEqual(HostContactAlert.objects.filter(active = True).count(), 0)
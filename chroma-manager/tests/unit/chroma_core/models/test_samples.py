@@ -11,7 +11,7 @@ from django.utils.unittest import skipIf
 
 from tests.unit.lib.iml_unit_test_case import IMLUnitTestCase
 from chroma_core.models import Point, Stats
-from chroma_core.models.stats import total_seconds
+from chroma_core.models.stats import Rings, total_seconds
 from chroma_core.lib.util import chroma_settings
 
 
@@ -59,12 +59,14 @@ class TestModels(IMLUnitTestCase):
         connection.use_debug_cursor = True
         connection.cursor().execute('SET enable_seqscan = off')
         self.preserve_stats_wipe = settings.STATS_SIMPLE_WIPE
+        self.preserve_copy_insert = settings.STATS_COPY_INSERT
 
     def tearDown(self):
         connection.cursor().execute('SET enable_seqscan = on')
         connection.use_debug_cursor = False
         Stats.delete_all()
         settings.STATS_SIMPLE_WIPE = self.preserve_stats_wipe
+        settings.STATS_COPY_INSERT = self.preserve_copy_insert
 
     def test_point(self):
         self.assertEqual(Point(now, 0.0, 0).mean, 0)
@@ -157,6 +159,47 @@ class TestModels(IMLUnitTestCase):
         self.assertListEqual(list(model.select(id)), [])
         self.assertTrue(Stats[-1].start(id))
 
+    def test_sample_copy(self):
+        model = Stats[0]
+        settings.STATS_COPY_INSERT = True
+        model.insert({id: points})
+        model.cache.clear()
+        self.assertListEqual(list(model.select(id)), points)
+        self.assertEqual(model.latest(id), points[-1])
+        model.delete(id=id)
+
+    def test_rings(self):
+        rings = Rings(10, 10 * 24 * 2)  # room for 2 series
+        rings.extend(id, points[:5])
+        self.assertEqual(rings.latest(id), points[4])
+        rings.extend(id, points[5:])
+        self.assertEqual(rings.latest(id), points[-1])
+        self.assertIsNone(rings.rollup(id, points[0].dt, points[-1].dt, Stats[1].step))
+        start, stop = Stats[1].floor(points[-10].dt), Stats[1].floor(points[-1].dt)
+        if start < points[-10].dt:
+            start += timedelta(seconds=Stats[1].step)
+        expected = list(Stats[1].reduce(point for point in points if start <= point.dt < stop))
+        self.assertEqual(rings.rollup(id, start, stop, Stats[1].step), expected)
+        rings.prime(id + 1)
+        self.assertEqual(rings.latest(id + 1), Point.zero)
+        rings.prime(id + 2, points[0])
+        self.assertNotIn(id, rings)
+        self.assertIsNone(rings.latest(id))
+        self.assertEqual(rings.latest(id + 2), points[0])
+        rings.clear()
+        self.assertEqual(len(rings), 0)
+
+    def test_sample_prime(self):
+        model = Stats[0]
+        model.insert({id: points})
+        model.cache.clear()
+        with assertQueries('SELECT'):
+            model.prime([id, id + 1])
+            model.prime([id, id + 1])
+            self.assertEqual(model.latest(id), points[-1])
+            self.assertEqual(model.latest(id + 1), Point.zero)
+        model.delete(id=id)
+
     def test_stats(self):
         outdated = Stats.insert((id, point.dt, point.sum) for point in points)
         self.assertEqual(outdated, [])
@@ -201,6 +244,23 @@ class TestModels(IMLUnitTestCase):
         for model in Stats:
             self.assertListEqual(list(model.select(id)), [])
 
+    def test_stats_select_many(self):
+        "Test that many series are selected together with the same results as one at a time."
+        Stats.insert((series_id, point.dt, point.sum) for series_id in (id, id + 1) for point in points)
+        point = Stats.latest(id)
+        begin = point.dt - timedelta(hours=1)
+        with assertQueries('SELECT', 'SELECT'):
+            selection = Stats.select_many([id, id + 1, id + 2], begin, point.dt, rates=set([id + 1]))
+        self.assertListEqual(selection[id], Stats.select(id, begin, point.dt))
+        self.assertListEqual(selection[id + 1], Stats.select(id + 1, begin, point.dt, rate=True))
+        self.assertListEqual(selection[id + 2], [])
+        selection = Stats.select_many([id, id + 2], begin, point.dt, maxlen=100, fixed=3)
+        self.assertListEqual(selection[id], Stats.select(id, begin, point.dt, maxlen=100, fixed=3))
+        self.assertEqual([interval.len for interval in selection[id + 2]], [0, 0, 0])
+        self.assertEqual(Stats.select_many([], begin, point.dt), {})
+        for series_id in (id, id + 1):
+            Stats.delete(series_id)
+
 
 @skipIf(True, "Monster Data Tests Not Normally Run")
 class TestMonsterData(IMLUnitTestCase):
@@ -173,7 +173,7 @@ class TestAvailableJobs(IMLUnitTestCase):
             self.host.lnet_configuration.downcast()).natural_key()
         lnet_configuration_id = self.host.lnet_configuration.id
 
-        locks = js.get_locks(lnet_configuration_ct_key, lnet_configuration_id)
+        locks = js.get_locks([(lnet_configuration_ct_key, lnet_configuration_id)])[lnet_configuration_id]
         self.assertFalse(locks['read'])
         self.assertEqual(2, len(locks['write']))
 
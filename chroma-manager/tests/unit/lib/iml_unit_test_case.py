@@ -1,12 +1,19 @@
 from django.test import TestCase
 
 from chroma_core.models import Command
+from chroma_core.models.alert import active_alert_index
 from chroma_core.services.log import log_register
 
 log = log_register('iml_test_case')
 
 
 class IMLUnitTestCase(TestCase):
+    def _pre_setup(self):
+        super(IMLUnitTestCase, self)._pre_setup()
+
+        # The database is rolled back after each test, so forget the alerts indexed during the last
+        active_alert_index.clear()
+
     def make_command(self, complete=False, created_at=None, errored=True, message='test'):
 
         """
@@ -0,0 +1,39 @@
+import zlib
+
+import mock
+from django.utils import unittest
+
+# The views are imported by the http_agent service, import it first to avoid a circular import
+import chroma_core.services.http_agent  # noqa
+from chroma_agent_comms.views import decoded_body, UnsupportedEncoding, BodyTooLarge
+
+
+class TestDecodedBody(unittest.TestCase):
+    BODY = '{"messages": []}'
+
+    def _request(self, body, encoding = None):
+        request = mock.Mock(body = body, META = {})
+        if encoding:
+            request.META['HTTP_CONTENT_ENCODING'] = encoding
+        return request
+
+    def test_identity(self):
+        self.assertEqual(decoded_body(self._request(self.BODY)), self.BODY)
+
+    def test_gzip(self):
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        body = compressor.compress(self.BODY) + compressor.flush()
+        self.assertEqual(decoded_body(self._request(body, 'gzip')), self.BODY)
+
+    def test_deflate(self):
+        self.assertEqual(decoded_body(self._request(zlib.compress(self.BODY), 'deflate')), self.BODY)
+
+    def test_unsupported(self):
+        self.assertRaises(UnsupportedEncoding, decoded_body, self._request(self.BODY, 'br'))
+
+    def test_too_large(self):
+        """Test that a small compressed body is not inflated beyond the size limit"""
+        body = zlib.compress(' ' * 1025)
+        with mock.patch('chroma_agent_comms.views.MAX_DECODED_BODY_SIZE', 1024):
+            self.assertRaises(BodyTooLarge, decoded_body, self._request(body, 'deflate'))
+            self.assertEqual(decoded_body(self._request(zlib.compress(self.BODY), 'deflate')), self.BODY)
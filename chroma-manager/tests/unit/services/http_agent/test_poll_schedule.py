@@ -0,0 +1,48 @@
+import mock
+from django.utils import unittest
+
+from chroma_core.services.http_agent.poll_schedule import PollSchedule
+
+
+@mock.patch.multiple('settings', AGENT_POLL_PERIOD = 10, AGENT_PLUGIN_POLL_PERIODS = {'linux': 20},
+                     AGENT_RX_BACKPRESSURE_DEPTH = 100, AGENT_MAX_POLL_PERIOD = 60)
+class TestPollSchedule(unittest.TestCase):
+    def setUp(self):
+        self.depths = {}
+        self.schedule = PollSchedule(lambda plugin: self.depths.get(plugin, 0))
+        self.schedule.DEPTH_CHECK_INTERVAL = 0
+
+    def test_periods(self):
+        self.assertEqual(self.schedule.period('lustre'), 10)
+        self.assertEqual(self.schedule.period('linux'), 20)
+
+    def test_offset(self):
+        for _ in range(0, 10):
+            schedule = self.schedule.create('lustre')
+            self.assertEqual(schedule['poll_period'], 10)
+            self.assertTrue(0 <= schedule['poll_offset'] <= 10)
+
+    def test_backpressure(self):
+        """Test that the period doubles for each multiple of the backpressure depth, up to the maximum"""
+        for depth, period in [(99, 10), (100, 20), (250, 40), (300, 60), (10 ** 6, 60)]:
+            self.depths['lustre'] = depth
+            self.assertEqual(self.schedule.period('lustre'), period)
+
+    def test_depth_sampling(self):
+        """Test that the queue depth is sampled at most once per interval"""
+        rx_depth = mock.Mock(return_value = 0)
+        schedule = PollSchedule(rx_depth)
+
+        with mock.patch('time.time', return_value = 1000):
+            schedule.period('lustre')
+            schedule.period('lustre')
+        self.assertEqual(rx_depth.call_count, 1)
+
+        with mock.patch('time.time', return_value = 1000 + PollSchedule.DEPTH_CHECK_INTERVAL + 1):
+            schedule.period('lustre')
+        self.assertEqual(rx_depth.call_count, 2)
+
+    def test_depth_error(self):
+        """Test that failing to read the queue depth leaves the period alone"""
+        schedule = PollSchedule(mock.Mock(side_effect = IOError("AMQP down")))
+        self.assertEqual(schedule.period('lustre'), 10)
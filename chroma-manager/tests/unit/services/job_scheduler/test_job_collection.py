@@ -0,0 +1,60 @@
+import json
+
+import mock
+from django.utils import unittest
+
+from chroma_core.services.job_scheduler.job_scheduler import JobCollection
+
+
+class TestJobCollection(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('chroma_core.services.job_scheduler.job_scheduler.Job')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.collection = JobCollection()
+
+    def _job(self, id, wait_for = (), state = 'pending'):
+        return mock.Mock(id = id, state = state, wait_for_json = json.dumps(list(wait_for)))
+
+    def _ready_ids(self):
+        return sorted(job.id for job in self.collection.ready_jobs)
+
+    def test_dependency_chain(self):
+        jobs = [self._job(1), self._job(2, [1]), self._job(3, [1, 2]), self._job(4, [1])]
+        self.collection.add_command(mock.Mock(id = 1), jobs)
+        self.assertEqual(self._ready_ids(), [1])
+
+        self.collection.update_many([jobs[0]], 'tasked')
+        self.assertEqual(self._ready_ids(), [])
+
+        self.collection.update(jobs[0], 'complete')
+        self.assertEqual(self._ready_ids(), [2, 4])
+
+        self.collection.update_many([jobs[1], jobs[3]], 'tasked')
+        self.collection.update(jobs[1], 'complete')
+        self.assertEqual(self._ready_ids(), [3])
+
+    def test_wait_for_complete_job(self):
+        self.collection.add(self._job(1, state = 'complete'))
+        self.collection.add(self._job(2, [1]))
+        self.assertEqual(self._ready_ids(), [2])
+
+    def test_wait_for_unknown_job(self):
+        self.collection.add(self._job(2, [1]))
+        self.assertEqual(self._ready_ids(), [])
+        self.collection.add(self._job(1, state = 'complete'))
+        self.assertEqual(self._ready_ids(), [2])
+
+    def test_readd(self):
+        job = self._job(1)
+        self.collection.add(job)
+        self.collection.add_command(mock.Mock(id = 1), [job])
+        self.assertEqual(self._ready_ids(), [1])
+        self.assertEqual(len(self.collection.pending_jobs), 1)
+
+    def test_flush_when_quiescent(self):
+        job = self._job(1)
+        self.collection.add(job)
+        self.collection.update(job, 'complete')
+        self.assertEqual(self._ready_ids(), [])
+        self.assertEqual(self.collection._jobs, {})
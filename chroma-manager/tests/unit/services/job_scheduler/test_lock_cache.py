@@ -0,0 +1,60 @@
+import mock
+from django.utils import unittest
+
+from chroma_core.models import StateLock
+from chroma_core.services.job_scheduler.lock_cache import LockCache
+
+
+class TestLockCache(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('chroma_core.models.Job')
+        patcher.start().objects.filter.return_value = []
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(LockCache, 'lock_change_receivers', [])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.lock_cache = LockCache()
+        self.item = object()
+
+    def _lock(self, job_id, write, item = None):
+        lock = StateLock(job = mock.Mock(id = job_id), locked_item = item or self.item, write = write)
+        self.lock_cache.add(lock)
+        return lock
+
+    def test_latest_write(self):
+        self.assertEqual(self.lock_cache.get_latest_write(self.item), None)
+
+        # Added out of job order, the latest is still the highest job
+        write_2 = self._lock(2, True)
+        write_1 = self._lock(1, True)
+        self._lock(3, False)
+        self.assertEqual(self.lock_cache.get_latest_write(self.item), write_2)
+        self.assertEqual(self.lock_cache.get_latest_write(self.item, not_job = write_2.job), write_1)
+        self.assertEqual(self.lock_cache.get_write_by_locked_item(), {self.item: write_2})
+
+        self.lock_cache.remove_job(write_2.job)
+        self.assertEqual(self.lock_cache.get_latest_write(self.item), write_1)
+
+    def test_read_locks(self):
+        reads = [self._lock(job_id, False) for job_id in (1, 2, 4)]
+        write = self._lock(3, True)
+
+        self.assertEqual(self.lock_cache.get_read_locks(self.item, after = 2, not_job = None), reads[1:])
+        self.assertEqual(self.lock_cache.get_read_locks(self.item, after = 2, not_job = reads[2].job), reads[1:2])
+        self.assertEqual(self.lock_cache.get_write(self.item), [write])
+        self.assertEqual(set(self.lock_cache.get_by_locked_item(self.item)), set(reads + [write]))
+
+    def test_remove_job(self):
+        other_item = object()
+        job_locks = [self._lock(1, True), self._lock(1, False, other_item)]
+        kept = self._lock(2, False, other_item)
+
+        self.assertEqual(self.lock_cache.remove_job(job_locks[0].job), 2)
+        self.assertEqual(self.lock_cache.get_by_job(job_locks[0].job), [])
+        self.assertEqual(self.lock_cache.get_by_locked_item(self.item), [])
+        self.assertEqual(self.lock_cache.get_by_locked_item(other_item), [kept])
+
+        # Items with no locks left are dropped rather than left as empty entries
+        self.assertNotIn(self.item, self.lock_cache.write_by_item)
+        self.assertNotIn(self.item, self.lock_cache.all_by_item)
+        self.assertEqual(self.lock_cache.get_write_by_locked_item(), {})
@@ -1,11 +1,18 @@
+from collections import defaultdict
+
 import mock
+from django.utils import unittest
+
+import settings
 
 from chroma_core.services.job_scheduler import job_scheduler_notify
 from tests.unit.chroma_core.helpers import synthetic_host
 from tests.unit.chroma_core.helpers import load_default_profile
 from tests.unit.lib.iml_unit_test_case import IMLUnitTestCase
-from chroma_core.models import Package, PackageVersion, PackageAvailability
+from chroma_core.models import Package, PackageVersion, PackageAvailability, ManagedTarget
+from chroma_core.lib.long_polling import long_polling
 from chroma_core.services.lustre_audit import UpdateScan
+from chroma_core.services.lustre_audit.update_scan import MetricsDecoder, AuditSnapshot, SeriesMap
 from chroma_core.models.package import PackageInstallation
 from iml_common.lib.date_time import IMLDateTime
 
@@ -162,3 +169,127 @@ class TestAudit(IMLUnitTestCase):
         self.assertEqual(update_scan.host.properties, '{}')
         update_scan.update_properties(None)
         update_scan.update_properties({'key': 'value'})
+
+
+class TestMetricsDecoder(unittest.TestCase):
+    def test_decode(self):
+        decoder = MetricsDecoder()
+
+        raw = decoder.decode({'first': 0,
+                              'keys': [['jobid_var'], ['target', 'OST0000', 'filesfree'], ['target', 'OST0000', 'stats']],
+                              'values': [[0, 'disable'], [1, 10], [2, {}]],
+                              'removed': []})
+        self.assertEqual(raw, {'jobid_var': 'disable', 'target': {'OST0000': {'filesfree': 10, 'stats': {}}}})
+
+        # Unchanged values are kept, changed ones updated and removed ones dropped
+        raw = decoder.decode({'first': 3,
+                              'keys': [['target', 'OST0001', 'filesfree']],
+                              'values': [[1, 9], [3, 5]],
+                              'removed': [0]})
+        self.assertEqual(raw, {'target': {'OST0000': {'filesfree': 9, 'stats': {}},
+                                          'OST0001': {'filesfree': 5}}})
+
+    def test_missed_message(self):
+        decoder = MetricsDecoder()
+
+        # Keys from before this decoder started cannot be expanded until a full update
+        self.assertEqual(decoder.decode({'first': 2, 'keys': [['filesfree']], 'values': [[2, 10]], 'removed': []}), None)
+        self.assertEqual(decoder.decode({'first': 0, 'keys': [['filesfree']], 'values': [[0, 10]], 'removed': []}),
+                         {'filesfree': 10})
+
+    def test_sequence_gap(self):
+        """Test that a missed message which only changed values is noticed from the sequence numbers"""
+        decoder = MetricsDecoder()
+
+        decoder.decode({'seq': 1, 'first': 0, 'keys': [['filesfree']], 'values': [[0, 10]], 'removed': []})
+        self.assertEqual(decoder.decode({'seq': 2, 'first': 1, 'keys': [], 'values': [[0, 9]], 'removed': []}),
+                         {'filesfree': 9})
+        self.assertEqual(decoder.decode({'seq': 4, 'first': 1, 'keys': [], 'values': [[0, 7]], 'removed': []}), None)
+        self.assertEqual(decoder.decode({'seq': 5, 'first': 1, 'keys': [], 'values': [[0, 6]], 'removed': []}), None)
+        self.assertEqual(decoder.decode({'seq': 1, 'first': 0, 'keys': [['filesfree']], 'values': [[0, 6]], 'removed': []}),
+                         {'filesfree': 6})
+
+    def test_resync_requested(self):
+        """Test that the host's session is restarted once when its metrics cannot be expanded"""
+        reset_session = mock.patch('chroma_core.services.lustre_audit.update_scan.HttpAgentRpc').start().return_value.reset_session
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.object(UpdateScan, 'metrics_decoders', defaultdict(MetricsDecoder)).start()
+
+        update_scan = UpdateScan()
+        update_scan.host = mock.Mock(id = 1, fqdn = 'node1')
+        for seq in (2, 3):
+            update_scan.host_data = {'metrics': {'delta': {'seq': seq, 'first': 1, 'keys': [], 'values': [], 'removed': []}}}
+            update_scan.expand_metrics()
+            self.assertEqual(update_scan.host_data['metrics'], None)
+        reset_session.assert_called_once_with('node1', 'lustre', None)
+
+        update_scan.host_data = {'metrics': {'delta': {'seq': 1, 'first': 0, 'keys': [['filesfree']], 'values': [[0, 10]], 'removed': []}}}
+        update_scan.expand_metrics()
+        self.assertEqual(update_scan.host_data['metrics'], {'raw': {'filesfree': 10}})
+        self.assertFalse(UpdateScan.metrics_decoders[1].resync_requested)
+
+
+class TestAuditSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.time = mock.patch('time.time', return_value = 1000.0).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_changed(self):
+        snapshot = AuditSnapshot()
+
+        self.assertTrue(snapshot.changed(('resource_location', 'MGS_424f74'), 'node1'))
+        snapshot.commit()
+        self.assertFalse(snapshot.changed(('resource_location', 'MGS_424f74'), 'node1'))
+        self.assertTrue(snapshot.changed(('resource_location', 'MGS_424f74'), 'node2'))
+
+    def test_rollback(self):
+        """Test that values from a scan which failed are not taken as applied"""
+        snapshot = AuditSnapshot()
+
+        snapshot.changed(('target_mount', 1), (True, {}, 1))
+        snapshot.rollback()
+        self.assertTrue(snapshot.changed(('target_mount', 1), (True, {}, 1)))
+
+    def test_lifetime(self):
+        snapshot = AuditSnapshot()
+        snapshot.changed(('client_mounts',), [])
+        snapshot.commit()
+
+        self.time.return_value = 1000.0 + settings.AUDIT_SNAPSHOT_LIFETIME + 1
+        self.assertTrue(snapshot.changed(('client_mounts',), []))
+
+
+class TestSeriesMap(unittest.TestCase):
+    def setUp(self):
+        mock.patch('chroma_core.lib.long_polling.long_polling.subscribe_table_changes').start()
+        mock.patch.dict(long_polling.timestamps, dict((table, 0) for table in SeriesMap.TABLES)).start()
+        self.get_target = mock.patch.object(ManagedTarget.objects, 'get').start()
+        self.addCleanup(mock.patch.stopall)
+
+        self.host = mock.Mock(id = 1)
+        self.series_map = SeriesMap()
+
+    def test_target_metrics(self):
+        """Test that each target is looked up once, and again after the target tables change"""
+        target_metrics = self.series_map.target_metrics(self.host, 'testfs-OST0000')
+        self.assertIs(target_metrics, self.get_target.return_value.downcast.return_value.metrics)
+        target_metrics.load_series_ids.assert_called_once_with()
+
+        self.assertIs(self.series_map.target_metrics(self.host, 'testfs-OST0000'), target_metrics)
+        self.assertEqual(self.get_target.call_count, 1)
+
+        long_polling.timestamps[SeriesMap.TABLES[0]] = 1
+        self.series_map.target_metrics(self.host, 'testfs-OST0000')
+        self.assertEqual(self.get_target.call_count, 2)
+
+    def test_unknown_target(self):
+        self.get_target.side_effect = ManagedTarget.DoesNotExist
+
+        self.assertEqual(self.series_map.target_metrics(self.host, 'testfs-OST0001'), None)
+        self.assertEqual(self.series_map.target_metrics(self.host, 'testfs-OST0001'), None)
+        self.assertEqual(self.get_target.call_count, 1)
+
+    def test_host_metrics(self):
+        self.assertIs(self.series_map.host_metrics(self.host), self.host.metrics)
+        self.assertIs(self.series_map.host_metrics(self.host), self.host.metrics)
+        self.host.metrics.load_series_ids.assert_called_once_with()
@@ -0,0 +1,96 @@
+from Queue import Empty
+
+import mock
+from django.utils import unittest
+
+from chroma_core.services.queue import ServiceQueue, ServiceBroadcast, AgentRxQueue
+from chroma_core.services.http_agent.queues import AmqpRxForwarder, HostQueueCollection
+
+
+class FakeSimpleQueue(object):
+    "Hand out queued messages, then stop the ServiceQueue once drained."
+    def __init__(self, service_queue, bodies):
+        self.service_queue = service_queue
+        self.messages = [mock.Mock(decode = mock.Mock(return_value = body)) for body in bodies]
+
+    def get(self, timeout):
+        if self.messages:
+            return self.messages.pop(0)
+        self.service_queue.stop()
+        raise Empty()
+
+
+class TestServeBatch(unittest.TestCase):
+    def _serve(self, service_queue, bodies, **kwargs):
+        simple_queue = FakeSimpleQueue(service_queue, bodies)
+        messages = list(simple_queue.messages)
+        with mock.patch('chroma_core.services.queue._amqp_connection') as connection:
+            connection.return_value.__enter__.return_value.SimpleQueue.return_value = simple_queue
+            service_queue.serve_batch(**kwargs)
+        for message in messages:
+            self.assertEqual(message.ack.call_count, 1)
+
+    def test_batch_size(self):
+        class TestQueue(ServiceQueue):
+            name = 'test'
+
+        callback = mock.Mock()
+        self._serve(TestQueue(), range(5), callback = callback, batch_size = 2)
+        self.assertEqual(callback.call_args_list, [mock.call([0, 1]), mock.call([2, 3]), mock.call([4])])
+
+    def test_agent_rx_data(self):
+        data_callback = mock.Mock()
+        bodies = [{'type': 'DATA', 'fqdn': 'foo', 'body': 1},
+                  {'type': 'SESSION_CREATE', 'fqdn': 'foo'},
+                  {'type': 'DATA', 'fqdn': 'bar', 'body': 2}]
+        self._serve(AgentRxQueue('test'), bodies, data_callback = data_callback)
+        data_callback.assert_called_once_with([('foo', 1), ('bar', 2)])
+
+
+class TestPut(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('chroma_core.services.queue.producers')
+        self.producers = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.producer = self.producers.__getitem__.return_value.acquire.return_value.__enter__.return_value
+
+    def test_put(self):
+        class TestQueue(ServiceQueue):
+            name = 'test'
+
+        TestQueue().put({'foo': 'bar'})
+        TestQueue().put({'foo': 'baz'})
+        self.assertEqual(self.producer.publish.call_count, 2)
+        args, kwargs = self.producer.publish.call_args
+        self.assertEqual(args, ({'foo': 'baz'},))
+        self.assertEqual(kwargs['routing_key'], 'test')
+        self.assertEqual(kwargs['exchange'].name, 'test')
+        self.assertEqual([queue.name for queue in kwargs['declare']], ['test'])
+
+    def test_broadcast(self):
+        class TestBroadcast(ServiceBroadcast):
+            name = 'test'
+
+        TestBroadcast().publish({'foo': 'bar'})
+        args, kwargs = self.producer.publish.call_args
+        self.assertEqual(args, ({'foo': 'bar'},))
+        self.assertEqual(kwargs['exchange'].name, 'test')
+        self.assertEqual(kwargs['exchange'].type, 'fanout')
+
+    def test_rx_forwarder(self):
+        queue_collection = HostQueueCollection()
+        forwarder = AmqpRxForwarder(queue_collection)
+        messages = [{'plugin': 'lustre', 'n': n} for n in range(3)]
+        received = list(messages)
+
+        def get(block, timeout):
+            if not received:
+                forwarder.stop()
+                raise Empty()
+            return received.pop(0)
+
+        with mock.patch.object(queue_collection.plugin_rx_queue, 'get', get):
+            forwarder.run()
+        self.assertEqual([call[0][0] for call in self.producer.publish.call_args_list], messages)
+        self.assertEqual(set(call[1]['routing_key'] for call in self.producer.publish.call_args_list), set(['agent_lustre_rx']))
+        self.assertEqual(forwarder._rx_queues.keys(), ['lustre'])
@@ -0,0 +1,108 @@
+import threading
+
+import mock
+from django.utils import unittest
+
+from chroma_core.services.rpc import RpcExecutor, RpcHistogram, RpcStats, ServiceRpcInterface, PRIORITY_HIGH, PRIORITY_LOW
+
+
+class TestRpcExecutor(unittest.TestCase):
+    def setUp(self):
+        self.ran = []
+        self.release = threading.Event()
+
+    def _run(self, body):
+        self.ran.append(body['request_id'])
+        if body['method'] == 'block':
+            self.release.wait()
+
+    def _body(self, method, request_id):
+        return {'method': method, 'request_id': request_id}
+
+    def _wait_for_running(self, executor, method):
+        while executor.metrics()['running'].get(method) is None:
+            self.release.wait(0.01)
+
+    def _finish(self, executor):
+        executor.put(self._body('fast', 'last'))
+        while 'last' not in self.ran:
+            self.release.wait(0.01)
+        executor.stop()
+        executor.join()
+
+    def test_priority_order(self):
+        executor = RpcExecutor('test', self._run, 1, 10,
+                               priorities = {'read': PRIORITY_HIGH, 'create': PRIORITY_LOW})
+        executor.start()
+
+        # Occupy the only worker so that the rest queue up
+        executor.put(self._body('block', 'block'))
+        self._wait_for_running(executor, 'block')
+        for request_id, method in enumerate(['create', 'update', 'read', 'update', 'read']):
+            executor.put(self._body(method, request_id))
+        self.assertEqual(executor.metrics()['queued'], 5)
+
+        self.release.set()
+        # The lowest priority request runs last, wait for it before queueing the sentinel
+        while 0 not in self.ran:
+            self.release.wait(0.01)
+        self._finish(executor)
+        self.assertEqual(self.ran, ['block', 2, 4, 1, 3, 0, 'last'])
+        self.assertEqual(executor.metrics()['max_queued'], 5)
+
+    def test_concurrency_limit(self):
+        executor = RpcExecutor('test', self._run, 2, 10, concurrency_limits = {'block': 1})
+        executor.start()
+
+        executor.put(self._body('block', 1))
+        self._wait_for_running(executor, 'block')
+        executor.put(self._body('block', 2))
+        executor.put(self._body('fast', 3))
+
+        # The second blocking call waits for the first, the other worker carries on
+        while executor.metrics()['completed'] < 1:
+            self.release.wait(0.01)
+        self.assertEqual(self.ran, [1, 3])
+        self.assertEqual(executor.metrics()['running'], {'block': 1})
+
+        self.release.set()
+        while 2 not in self.ran:
+            self.release.wait(0.01)
+        self._finish(executor)
+        self.assertEqual(self.ran, [1, 3, 2, 'last'])
+
+
+class TestRpcStats(unittest.TestCase):
+    def test_histogram(self):
+        histogram = RpcHistogram()
+        for ms in [0.5, 1.5, 3, 3, 3, 3, 3, 3, 3, 700]:
+            histogram.record(ms / 1000.0)
+
+        self.assertEqual(histogram.counts[:4], [1, 1, 7, 0])
+        self.assertEqual(histogram.counts[10], 1)
+        result = histogram.to_dict()
+        self.assertEqual(result['count'], 10)
+        self.assertEqual(result['p50_ms'], 4)
+        self.assertEqual(result['p90_ms'], 4)
+        self.assertAlmostEqual(result['p99_ms'], 700)
+        self.assertAlmostEqual(result['max_ms'], 700)
+
+    def test_get_rpc_stats(self):
+        class Foo(object):
+            def bar(self):
+                pass
+
+        class FooRpc(ServiceRpcInterface):
+            methods = ['bar']
+
+        stats = RpcStats()
+        stats.record('bar', 'execute', 0.002)
+        rpc = FooRpc(Foo())
+        rpc.worker = mock.Mock()
+        rpc.worker.executor.metrics.return_value = {'queued': 0}
+
+        with mock.patch('chroma_core.services.rpc.rpc_stats', stats):
+            result = rpc._local_call('get_rpc_stats')
+        self.assertEqual(result['executor'], {'queued': 0})
+        self.assertEqual(result['methods']['bar']['execute']['count'], 1)
+        self.assertEqual(result['methods']['bar']['execute']['p50_ms'], 2)